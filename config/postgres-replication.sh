@@ -0,0 +1,4 @@
+#!/bin/bash
+# lets postgres-replica stream from this server, only runs when the data
+# volume is first initialized, so make db-wipe an existing one
+echo "host replication all all scram-sha-256" >> "$PGDATA/pg_hba.conf"
@@ -0,0 +1,36 @@
+"""
+base62 function
+"""
+
+from yoyo import step
+
+__depends__ = {"20230126_03_mZ7kh-link-table"}
+
+# must match nifty.service.base62.base62_encode, short_url is always
+# base62_encode(long_url.id)
+apply_sql = """
+CREATE OR REPLACE FUNCTION base62_encode(num BIGINT)
+RETURNS TEXT
+LANGUAGE plpgsql
+IMMUTABLE STRICT
+AS $$
+DECLARE
+  chars CONSTANT TEXT :=
+    '0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ';
+  n BIGINT := num;
+  ret TEXT := '';
+BEGIN
+  WHILE n > 0 LOOP
+    ret := substr(chars, (n % 62)::INT + 1, 1) || ret;
+    n := n / 62;
+  END LOOP;
+  RETURN ret;
+END;
+$$;
+"""
+
+rollback_sql = """
+DROP FUNCTION IF EXISTS base62_encode(BIGINT);
+"""
+
+steps = [step(apply_sql, rollback_sql)]
@@ -0,0 +1,80 @@
+"""
+long url digest
+"""
+
+from yoyo import step
+
+__depends__ = {"20230310_01_Hq3tZ-base62-function"}
+
+# rows written before this have no url_digest until the backfill or
+# 20230315_02 fills them, and the service looks long urls up by url_digest.
+# on a live database deploy in this order:
+#   1. apply this migration, the running service keeps working
+#   2. python -m nifty.util.db.backfill_url_digest
+#   3. apply 20230315_02
+#   4. deploy the service that uses url_digest
+# deploying it earlier misses old urls on re-shorten, and inserting them
+# again fails on long_url_url_key until 20230315_02 drops it
+
+# CREATE INDEX CONCURRENTLY can't run in a transaction, and it keeps
+# long_url writable while the index builds
+__transactional__ = False
+
+add_column_sql = """
+ALTER TABLE long_url ADD COLUMN IF NOT EXISTS url_digest BYTEA;
+"""
+
+drop_column_sql = """
+ALTER TABLE long_url DROP COLUMN IF EXISTS url_digest;
+"""
+
+digest_function_sql = """
+CREATE OR REPLACE FUNCTION long_url_digest(url TEXT)
+RETURNS BYTEA
+LANGUAGE sql
+IMMUTABLE STRICT PARALLEL SAFE
+AS $$
+  SELECT sha256(convert_to(url, 'UTF8'))
+$$;
+"""
+
+drop_digest_function_sql = """
+DROP FUNCTION IF EXISTS long_url_digest(TEXT);
+"""
+
+trigger_sql = """
+CREATE OR REPLACE FUNCTION long_url_set_digest()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  NEW.url_digest := long_url_digest(NEW.url);
+  RETURN NEW;
+END;
+$$;
+DROP TRIGGER IF EXISTS long_url_set_digest ON long_url;
+CREATE TRIGGER long_url_set_digest
+BEFORE INSERT OR UPDATE OF url ON long_url
+FOR EACH ROW EXECUTE FUNCTION long_url_set_digest();
+"""
+
+drop_trigger_sql = """
+DROP TRIGGER IF EXISTS long_url_set_digest ON long_url;
+DROP FUNCTION IF EXISTS long_url_set_digest();
+"""
+
+index_sql = """
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS long_url_url_digest_idx
+ON long_url (url_digest);
+"""
+
+drop_index_sql = """
+DROP INDEX CONCURRENTLY IF EXISTS long_url_url_digest_idx;
+"""
+
+steps = [
+    step(add_column_sql, drop_column_sql),
+    step(digest_function_sql, drop_digest_function_sql),
+    step(trigger_sql, drop_trigger_sql),
+    step(index_sql, drop_index_sql),
+]
@@ -0,0 +1,24 @@
+"""
+long url digest required
+"""
+
+from yoyo import step
+
+__depends__ = {"20230315_01_Wd8Rk-long-url-digest"}
+
+# on a big table, run python -m nifty.util.db.backfill_url_digest first so
+# the UPDATE here only has the stragglers left to do.  the service that looks
+# long urls up by url_digest must not be deployed until this has run, see
+# 20230315_01
+apply_sql = """
+UPDATE long_url SET url_digest = long_url_digest(url) WHERE url_digest IS NULL;
+ALTER TABLE long_url ALTER COLUMN url_digest SET NOT NULL;
+ALTER TABLE long_url DROP CONSTRAINT IF EXISTS long_url_url_key;
+"""
+
+rollback_sql = """
+ALTER TABLE long_url ADD CONSTRAINT long_url_url_key UNIQUE (url);
+ALTER TABLE long_url ALTER COLUMN url_digest DROP NOT NULL;
+"""
+
+steps = [step(apply_sql, rollback_sql)]
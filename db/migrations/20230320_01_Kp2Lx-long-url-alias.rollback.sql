@@ -0,0 +1,6 @@
+-- long url alias
+-- depends: 20230315_02_Tn5Jv-long-url-digest-required
+REVOKE SELECT, INSERT, UPDATE, DELETE
+ON long_url_alias
+FROM flask_rw;
+DROP TABLE IF EXISTS long_url_alias;
@@ -0,0 +1,10 @@
+-- long url alias
+-- depends: 20230315_02_Tn5Jv-long-url-digest-required
+CREATE TABLE IF NOT EXISTS long_url_alias(
+  url_digest BYTEA PRIMARY KEY,
+  url TEXT NOT NULL,
+  short_url TEXT NOT NULL
+);
+GRANT SELECT, INSERT, UPDATE, DELETE
+ON long_url_alias
+TO flask_rw;
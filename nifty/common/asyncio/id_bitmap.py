@@ -0,0 +1,55 @@
+# fixes stubs like redis that use generics when the code does not
+from __future__ import annotations
+
+import logging
+from typing import Iterable, Optional
+
+from redis.asyncio.client import Redis
+from redis.exceptions import RedisError
+
+from nifty.common import cfg
+from nifty.common.asyncio import redis_helpers
+from nifty.common.bloom import BLOOM_ADD, BLOOM_CHECK
+from nifty.common.id_bitmap import MAX_ID, SHORT_URL_BITMAP_CFG_KEY, bit_positions
+from nifty.common.types import Key
+
+_logger = logging.getLogger(__name__)
+
+# asyncio twin of nifty.common.id_bitmap, lookups and adds only, rebuilds go
+# through the sync one
+
+
+class IdBitmap:
+    """
+    see nifty.common.id_bitmap.IdBitmap
+    """
+
+    def __init__(self, redis: Redis[str], key: str):
+        self.__redis = redis
+        self.key = key
+        self.building_key = f"{key}:building"
+
+    async def might_contain(self, id: int) -> bool:
+        if id > MAX_ID:
+            return True
+        return bool(
+            await redis_helpers.run_script(self.__redis, BLOOM_CHECK, [self.key], [id])
+        )
+
+    async def add_many(self, ids: Iterable[int]):
+        positions = bit_positions(ids)
+        if not positions:
+            return
+        try:
+            await redis_helpers.run_script(
+                self.__redis, BLOOM_ADD, [self.key, self.building_key], positions
+            )
+        except RedisError as e:
+            _logger.error(f"unable to add to {self.key}, dropping it: {e}")
+            await self.__redis.delete(self.key)
+
+
+def short_url_bitmap_from_cfg(redis: Redis[str]) -> Optional[IdBitmap]:
+    if not cfg.gbool_fb(SHORT_URL_BITMAP_CFG_KEY, "enabled", False):
+        return None
+    return IdBitmap(redis, Key.short_url_bitmap.value)
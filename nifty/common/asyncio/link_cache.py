@@ -0,0 +1,141 @@
+# fixes stubs like redis that use generics when the code does not
+from __future__ import annotations
+
+import logging
+from typing import Awaitable, Callable, List, Optional, Sequence, TypeVar
+
+from redis.asyncio.client import Redis
+
+from nifty.common import cfg
+from nifty.common.asyncio import redis_helpers
+from nifty.common.hash_ring import HashRing
+from nifty.common.link_cache import (
+    NODE_FAILURES,
+    cache_nodes,
+    connect_timeout_sec,
+    forward_key,
+    ring_from_cfg,
+    timeout_sec,
+)
+from nifty.common.types import Key, Link, RedisType
+
+# asyncio twin of nifty.common.link_cache.LinkCache
+
+_logger = logging.getLogger(__name__)
+_R = TypeVar("_R")
+
+
+class LinkCache:
+    def __init__(self, ring: HashRing[Redis[str]]):
+        self.__ring = ring
+
+    async def __call(
+        self, key: str, fn: Callable[[Redis[str]], Awaitable[_R]], default: _R
+    ) -> _R:
+        for _ in range(len(self.__ring)):
+            owner = self.__ring.node(key)
+            if owner is None:
+                break
+            try:
+                return await fn(owner[1])
+            except NODE_FAILURES as e:
+                _logger.warning(
+                    f"redis-cache {owner[0]} failed, routing around it: {e}"
+                )
+                self.__ring.mark_down(owner[0])
+        return default
+
+    def __colocated(self, link: Link) -> bool:
+        link_node = self.__ring.node(link.short_url)
+        forward_node = self.__ring.node(forward_key(link.long_url))
+        return (
+            link_node is None or forward_node is None or link_node[0] == forward_node[0]
+        )
+
+    async def get_link(self, short_url: str) -> Optional[Link]:
+        return await self.__call(
+            short_url, lambda r: redis_helpers.get_link(r, short_url), None
+        )
+
+    async def get_links_by_id(self, ids: Sequence[int]) -> List[Optional[Link]]:
+        ret: List[Optional[Link]] = [None] * len(ids)
+        for name in self.__ring.names():
+            pending = [i for i, link in enumerate(ret) if link is None]
+            if not pending:
+                break
+            if self.__ring.is_down(name):
+                continue
+            try:
+                links = await redis_helpers.get_links_by_id(
+                    self.__ring.client(name), [ids[i] for i in pending]
+                )
+            except NODE_FAILURES as e:
+                _logger.warning(f"redis-cache {name} failed, routing around it: {e}")
+                self.__ring.mark_down(name)
+                continue
+            for i, link in zip(pending, links):
+                owner = self.__ring.node(link.short_url) if link else None
+                if owner is not None and owner[0] == name:
+                    ret[i] = link
+        return ret
+
+    async def get_link_by_long(self, long_url: str) -> Optional[Link]:
+        key = forward_key(long_url)
+        if len(self.__ring) == 1:
+            return await self.__call(
+                key, lambda r: redis_helpers.get_link_by_long(r, long_url), None
+            )
+
+        short_url = await self.__call(key, lambda r: r.get(key), None)
+        link = await self.get_link(short_url) if short_url else None
+        # a digest collision looks like a miss
+        return link if link is not None and link.long_url == long_url else None
+
+    async def is_missing(self, short_url: str) -> bool:
+        key = Key.missing_short_url.sub(short_url)
+        return bool(await self.__call(short_url, lambda r: r.exists(key), 0))
+
+    async def put_missing(self, short_url: str, ttl_sec: int):
+        key = Key.missing_short_url.sub(short_url)
+        await self.__call(short_url, lambda r: r.set(key, 1, ex=ttl_sec), None)
+
+    async def put_link(self, link: Link, forward_ttl_sec: int = 0):
+        if forward_ttl_sec <= 0 or self.__colocated(link):
+            await self.__call(
+                link.short_url,
+                lambda r: redis_helpers.put_link(r, link, forward_ttl_sec),
+                None,
+            )
+            return
+
+        await self.__call(
+            link.short_url, lambda r: redis_helpers.put_link(r, link, 0), None
+        )
+        key = forward_key(link.long_url)
+        await self.__call(
+            key, lambda r: r.set(key, link.short_url, ex=forward_ttl_sec), None
+        )
+
+    async def close(self):
+        for name in self.__ring.names():
+            await self.__ring.client(name).close()
+
+
+def from_cfg() -> LinkCache:
+    section = RedisType.CACHE.cfg_key
+    return LinkCache(
+        ring_from_cfg(
+            {
+                f"{host}:{port}": Redis(
+                    host=host,
+                    port=port,
+                    username=cfg.g(section, "user"),
+                    password=cfg.g(section, "pwd"),
+                    decode_responses=True,
+                    socket_connect_timeout=connect_timeout_sec(),
+                    socket_timeout=timeout_sec(),
+                )
+                for host, port in cache_nodes()
+            }
+        )
+    )
@@ -0,0 +1,163 @@
+# fixes stubs like redis that use generics when the code does not
+from __future__ import annotations
+
+import asyncio
+import logging
+from asyncio import CancelledError
+from typing import List, Optional, Tuple
+
+from redis.asyncio.client import Redis
+
+from nifty.common import cfg, redis_helpers
+from nifty.common.publisher import PUBLISHER_CFG_KEY, PublisherStats, QueueFullPolicy
+from nifty.common.types import Transport, stream_key
+
+_logger = logging.getLogger(__name__)
+
+
+class AsyncBatchPublisher:
+    """
+    asyncio twin of nifty.common.publisher.BatchPublisher, publishes from a
+    background task so requests never wait on redis.
+
+    Messages go into a bounded queue, and the flush task sends them in
+    pipelined batches of up to batch_size, or whatever has arrived after
+    flush_interval_sec.  A failed batch is counted and dropped, not retried.
+    """
+
+    def __init__(
+        self,
+        redis: Redis[str],
+        *,
+        max_queue: int = 10000,
+        batch_size: int = 500,
+        flush_interval_sec: float = 0.005,
+        policy: QueueFullPolicy = QueueFullPolicy.drop,
+        block_timeout_sec: float = 0.05,
+        transport: Transport = Transport.pubsub,
+        stream_maxlen: int = 100000,
+    ):
+        if max_queue < 1 or batch_size < 1:
+            raise ValueError("max_queue and batch_size must be >= 1")
+        if flush_interval_sec <= 0:
+            raise ValueError("flush_interval_sec must be > 0")
+
+        self.__redis = redis
+        self.__queue: asyncio.Queue[Tuple[str, str | bytes]] = asyncio.Queue(
+            maxsize=max_queue
+        )
+        self.__batch_size = batch_size
+        self.__flush_interval_sec = flush_interval_sec
+        self.__policy = policy
+        self.__block_timeout_sec = block_timeout_sec
+        self.__transport = transport
+        self.__stream_maxlen = stream_maxlen
+        self.__stats = PublisherStats()
+        self.__task: Optional[asyncio.Task[None]] = None
+        self.__flushing: Optional[asyncio.Future[None]] = None
+
+    def start(self):
+        if self.__task is None:
+            self.__task = asyncio.create_task(self.__run())
+
+    async def close(self):
+        """
+        Stop the flush task and send whatever is still queued
+        """
+        if self.__task is not None:
+            self.__task.cancel()
+            try:
+                await self.__task
+            except CancelledError:
+                pass
+            self.__task = None
+        if self.__flushing is not None:
+            await self.__flushing
+            self.__flushing = None
+        await self.__flush(self.__drain(self.__queue.qsize()))
+
+    async def publish(self, channel: str, msg: str | bytes) -> bool:
+        """
+        Queue a message, returns False if it was dropped
+        """
+        item = (channel, msg)
+        try:
+            if self.__policy == QueueFullPolicy.block:
+                await asyncio.wait_for(
+                    self.__queue.put(item), timeout=self.__block_timeout_sec
+                )
+            else:
+                self.__queue.put_nowait(item)
+            return True
+        except (asyncio.QueueFull, asyncio.TimeoutError):
+            self.__stats.dropped += 1
+            return False
+
+    def stats(self) -> PublisherStats:
+        return PublisherStats(
+            **{**self.__stats.__dict__, "pending": self.__queue.qsize()}
+        )
+
+    def __drain(self, limit: int) -> List[Tuple[str, str | bytes]]:
+        batch: List[Tuple[str, str | bytes]] = []
+        while len(batch) < limit:
+            try:
+                batch.append(self.__queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        return batch
+
+    async def __next_batch(self) -> List[Tuple[str, str | bytes]]:
+        batch = [await self.__queue.get()]
+        if self.__queue.qsize() < self.__batch_size - 1:
+            # give the rest of the batch a moment to arrive
+            await asyncio.sleep(self.__flush_interval_sec)
+        return batch + self.__drain(self.__batch_size - 1)
+
+    async def __flush(self, batch: List[Tuple[str, str | bytes]]):
+        if not batch:
+            return
+        try:
+            async with self.__redis.pipeline(transaction=False) as pipe:
+                for channel, msg in batch:
+                    if self.__transport == Transport.stream:
+                        pipe.xadd(
+                            stream_key(channel),
+                            {"data": msg},
+                            maxlen=self.__stream_maxlen,
+                            approximate=True,
+                        )
+                    else:
+                        pipe.publish(channel, msg)
+                await pipe.execute()
+            self.__stats.published += len(batch)
+            self.__stats.batches += 1
+        except Exception as e:
+            _logger.warning(f"dropping {len(batch)} messages, publish failed: {e}")
+            self.__stats.failed += len(batch)
+
+    async def __run(self):
+        while True:
+            batch = await self.__next_batch()
+            # shielded, close() waits for a batch on its way instead of
+            # cutting it off
+            self.__flushing = asyncio.ensure_future(self.__flush(batch))
+            await asyncio.shield(self.__flushing)
+            self.__flushing = None
+
+
+def from_cfg(redis: Redis[str]) -> AsyncBatchPublisher:
+    return AsyncBatchPublisher(
+        redis,
+        max_queue=cfg.gint_fb(PUBLISHER_CFG_KEY, "max_queue", 10000),
+        batch_size=cfg.gint_fb(PUBLISHER_CFG_KEY, "batch_size", 500),
+        flush_interval_sec=cfg.gfloat_fb(PUBLISHER_CFG_KEY, "flush_interval_ms", 5)
+        / 1000,
+        policy=QueueFullPolicy(
+            cfg.g_fb(PUBLISHER_CFG_KEY, "policy", QueueFullPolicy.drop.value)
+        ),
+        block_timeout_sec=cfg.gfloat_fb(PUBLISHER_CFG_KEY, "block_timeout_ms", 50)
+        / 1000,
+        transport=redis_helpers.get_transport(),
+        stream_maxlen=redis_helpers.get_stream_maxlen(),
+    )
@@ -2,27 +2,39 @@
 from __future__ import annotations
 
 import logging
-from typing import Optional, Type, TypeVar
+from typing import Any, List, Optional, Sequence, Type, TypeVar
 
 from pydantic import BaseModel
 from redis.asyncio.client import Redis
+from redis.exceptions import NoScriptError
 
 from nifty.common import cfg
 from nifty.common.helpers import none_throws, noneint_throws, optint_or_none
-from nifty.common.types import Key, RedisType
+from nifty.common.redis_helpers import (
+    GET_LINK,
+    GET_LINK_BY_LONG,
+    PUT_LINK,
+    LuaScript,
+    get_link_by_long_params,
+    get_link_params,
+    link_for_long_url,
+    link_from_flat,
+    put_link_params,
+)
+from nifty.common.types import Key, Link, RedisType, Transport, stream_key
+
+_logger = logging.getLogger(__name__)
 
 TBaseModel = TypeVar("TBaseModel", bound=BaseModel)
 
 
-def get_redis(
-    redis_type: RedisType,
-) -> Redis[str]:
+def get_redis(redis_type: RedisType, *, decode_responses: bool = True) -> Redis[str]:
     return Redis(
         host=cfg.g(redis_type.cfg_key, "host"),
         username=cfg.g(redis_type.cfg_key, "user"),
         password=cfg.g(redis_type.cfg_key, "pwd"),
         port=cfg.gint_fb(redis_type.cfg_key, "port", 6379),
-        decode_responses=True,
+        decode_responses=decode_responses,
     )
 
 
@@ -40,7 +52,7 @@ async def robj(
     throws: Optional[bool] = True,
 ) -> Optional[TBaseModel]:
     raw = await redis.hgetall(key)
-    logging.debug(f"Raw HGETALL response: {raw}")
+    _logger.debug("Raw HGETALL response: %s", raw)
     if throws:
         return cl.parse_obj(none_throws(raw, key))
 
@@ -51,3 +63,61 @@ async def trending_size(
     redis: Redis[str], throws: Optional[bool] = True
 ) -> Optional[int]:
     return await rint(redis, Key.trending_size, throws)
+
+
+async def run_script(
+    redis: Redis[str],
+    script: LuaScript,
+    keys: Sequence[str],
+    args: Sequence[str | int],
+) -> Any:
+    try:
+        return await redis.evalsha(script.sha, len(keys), *keys, *args)
+    except NoScriptError:
+        _logger.info("NOSCRIPT for %s, using EVAL", script.name)
+        return await redis.eval(script.source, len(keys), *keys, *args)
+
+
+async def get_link(redis: Redis[str], short_url: str) -> Optional[Link]:
+    return link_from_flat(
+        await run_script(redis, GET_LINK, *get_link_params(short_url))
+    )
+
+
+async def get_link_by_long(redis: Redis[str], long_url: str) -> Optional[Link]:
+    return link_for_long_url(
+        await run_script(redis, GET_LINK_BY_LONG, *get_link_by_long_params(long_url)),
+        long_url,
+    )
+
+
+async def get_links_by_id(
+    redis: Redis[str], ids: Sequence[int]
+) -> List[Optional[Link]]:
+    async with redis.pipeline(transaction=False) as pipe:
+        for id in ids:
+            pipe.hgetall(Key.link_by_link_id.sub(id))
+        return [Link.from_redis(raw) if raw else None for raw in await pipe.execute()]
+
+
+async def put_link(redis: Redis[str], link: Link, forward_ttl_sec: int = 0):
+    await run_script(redis, PUT_LINK, *put_link_params(link, forward_ttl_sec))
+
+
+async def emit(
+    redis: Redis[str],
+    channel: str,
+    msg: str | bytes,
+    *,
+    transport: Transport = Transport.pubsub,
+    stream_maxlen: int = 100000,
+):
+    """
+    Send an event on a channel with the given transport
+    """
+    if transport == Transport.stream:
+        await redis.xadd(
+            stream_key(channel), {"data": msg}, maxlen=stream_maxlen, approximate=True
+        )
+    else:
+        await redis.publish(channel, msg)
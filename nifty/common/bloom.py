@@ -0,0 +1,172 @@
+# fixes stubs like redis that use generics when the code does not
+from __future__ import annotations
+
+import hashlib
+import math
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
+
+from redis.client import Redis
+
+from . import cfg
+from .redis_helpers import register_script
+from .types import Key
+
+BLOOM_CFG_KEY = "long-url-bloom"
+
+# a redis string tops out at 512MB
+MAX_BITS = 2**32
+
+# a filter that has never been built answers "maybe" so it costs nothing
+BLOOM_CHECK = register_script(
+    "bloom_check",
+    """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+  return 1
+end
+for i = 1, #ARGV do
+  if redis.call('GETBIT', KEYS[1], ARGV[i]) == 0 then
+    return 0
+  end
+end
+return 1
+""",
+)
+
+# sets bits in the live filter and in one being rebuilt, but never creates
+# either, so adds during a rebuild aren't lost
+BLOOM_ADD = register_script(
+    "bloom_add",
+    """
+for _, key in ipairs(KEYS) do
+  if redis.call('EXISTS', key) == 1 then
+    for i = 1, #ARGV do
+      redis.call('SETBIT', key, ARGV[i], 1)
+    end
+  end
+end
+return 1
+""",
+)
+
+
+@dataclass
+class BloomStats:
+    bits: int
+    hashes: int
+    ready: bool
+    bits_set: int
+    fill_ratio: float
+    # the chance a new item is reported as maybe present, given the fill
+    estimated_fpr: float
+    estimated_items: Optional[int]
+
+
+class BloomSpec:
+    """
+    Size and hash functions of a bloom filter, sized for capacity items at
+    error_rate false positives.
+
+    The key includes the size, so processes with different settings never
+    share bits and a new size starts empty until it is rebuilt.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        if capacity < 1:
+            raise ValueError("capacity must be >= 1")
+        if not 0 < error_rate < 1:
+            raise ValueError("error_rate must be between 0 and 1")
+
+        bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.bits = min(bits, MAX_BITS)
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self.key = Key.long_url_bloom.sub(self.bits, self.hashes)
+        self.building_key = f"{self.key}:building"
+
+    def positions(self, item: str) -> List[int]:
+        # double hashing, k positions from one digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+
+class BloomFilter:
+    """
+    A bloom filter kept in a redis bitmap
+    """
+
+    def __init__(self, redis: Redis[str], spec: BloomSpec):
+        self.__redis = redis
+        self.spec = spec
+
+    def might_contain(self, item: str) -> bool:
+        """
+        False means item was definitely never added
+        """
+        return bool(
+            BLOOM_CHECK(self.__redis, [self.spec.key], self.spec.positions(item))
+        )
+
+    def add(self, item: str):
+        self.add_many([item])
+
+    def add_many(self, items: Iterable[str]):
+        positions = [p for item in items for p in self.spec.positions(item)]
+        if positions:
+            BLOOM_ADD(self.__redis, [self.spec.key, self.spec.building_key], positions)
+
+    def rebuild(self, items: Iterable[str], batch_size: int = 10000) -> int:
+        """
+        Build a new filter from items and swap it in atomically
+
+        :return: how many items were added
+        """
+        self.__redis.delete(self.spec.building_key)
+        # allocates the whole bitmap once, and lets BLOOM_ADD see the key
+        self.__redis.setbit(self.spec.building_key, self.spec.bits - 1, 0)
+        count = 0
+        batch: List[str] = []
+        for item in items:
+            batch.append(item)
+            if len(batch) >= batch_size:
+                self.add_many(batch)
+                count += len(batch)
+                batch = []
+        self.add_many(batch)
+        count += len(batch)
+        self.__redis.rename(self.spec.building_key, self.spec.key)
+        return count
+
+    def stats(self) -> BloomStats:
+        with self.__redis.pipeline(transaction=False) as pipe:
+            pipe.exists(self.spec.key)
+            pipe.bitcount(self.spec.key)
+            exists, bits_set = pipe.execute()
+        return bloom_stats(self.spec, bool(exists), int(bits_set))
+
+
+def bloom_stats(spec: BloomSpec, ready: bool, bits_set: int) -> BloomStats:
+    fill = bits_set / spec.bits
+    items = round(-spec.bits / spec.hashes * math.log(1 - fill)) if fill < 1 else None
+    return BloomStats(
+        bits=spec.bits,
+        hashes=spec.hashes,
+        ready=ready,
+        bits_set=bits_set,
+        fill_ratio=fill,
+        estimated_fpr=fill**spec.hashes,
+        estimated_items=items,
+    )
+
+
+def spec_from_cfg() -> Optional[BloomSpec]:
+    """
+    The known long urls filter spec, or None if it is disabled
+    """
+    if not cfg.gbool_fb(BLOOM_CFG_KEY, "enabled", False):
+        return None
+    return BloomSpec(
+        capacity=cfg.gint_fb(BLOOM_CFG_KEY, "capacity", 10000000),
+        error_rate=cfg.gfloat_fb(BLOOM_CFG_KEY, "error_rate", 0.01),
+    )
@@ -96,10 +96,10 @@ def g(section: str, key: str) -> str:
 
 def g_opt(section: str, key: str) -> Optional[str]:
     """
-    simple get, return None if not found
+    simple get, return None if not found (including when the section is missing)
     """
 
-    return _cfg()[section].get(key)
+    return _cfg().get(section, key, fallback=None)
 
 
 def g_fb(section: str, key: str, fallback: str) -> str:
@@ -137,3 +137,10 @@ def gfloat(section: str, key: str) -> float:
 def gfloat_fb(section: str, key: str, fallback: float) -> float:
     val = g_opt(section, key)
     return float(val) if val else fallback
+
+
+def gbool_fb(section: str, key: str, fallback: bool) -> bool:
+    """
+    bool getter with fallback, accepts anything configparser does (true/false, on/off, 1/0)
+    """
+    return _cfg().getboolean(section, key, fallback=fallback)
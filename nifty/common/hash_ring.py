@@ -0,0 +1,98 @@
+import bisect
+import hashlib
+import threading
+import time
+from typing import Callable, Dict, Generic, List, Optional, Sequence, Tuple, TypeVar
+
+_T = TypeVar("_T")
+
+
+def _point(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing(Generic[_T]):
+    """
+    Consistent hash ring over named nodes, each placed at vnodes points.
+
+    A key belongs to the first node clockwise from its hash, so adding or
+    removing one of n nodes only moves about 1 / n of the keys.  A node that
+    is marked down is skipped, its keys going to the next live node, until
+    down_sec has passed and it gets another chance.
+    """
+
+    def __init__(
+        self,
+        nodes: Dict[str, _T],
+        *,
+        vnodes: int = 160,
+        down_sec: float = 5,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if not nodes:
+            raise ValueError("a ring needs at least one node")
+        if vnodes < 1:
+            raise ValueError("vnodes must be >= 1")
+
+        self.__nodes = dict(nodes)
+        self.__down_sec = down_sec
+        self.__clock = clock
+        self.__lock = threading.Lock()
+        self.__down_until: Dict[str, float] = {}
+        points = sorted(
+            (_point(f"{name}#{i}"), name) for name in nodes for i in range(vnodes)
+        )
+        self.__points = [p for p, _ in points]
+        self.__owners = [name for _, name in points]
+
+    def __len__(self) -> int:
+        return len(self.__nodes)
+
+    def names(self) -> List[str]:
+        return list(self.__nodes)
+
+    def client(self, name: str) -> _T:
+        return self.__nodes[name]
+
+    def is_down(self, name: str) -> bool:
+        with self.__lock:
+            until = self.__down_until.get(name)
+            if until is None:
+                return False
+            if until <= self.__clock():
+                del self.__down_until[name]
+                return False
+            return True
+
+    def mark_down(self, name: str):
+        with self.__lock:
+            self.__down_until[name] = self.__clock() + self.__down_sec
+
+    def node(self, key: str) -> Optional[Tuple[str, _T]]:
+        """
+        The live node that owns key, or None if every node is down
+        """
+        start = bisect.bisect(self.__points, _point(key))
+        tried: set[str] = set()
+        for i in range(len(self.__owners)):
+            name = self.__owners[(start + i) % len(self.__owners)]
+            if name in tried:
+                continue
+            if not self.is_down(name):
+                return name, self.__nodes[name]
+            tried.add(name)
+            if len(tried) == len(self.__nodes):
+                break
+        return None
+
+    def group(self, keys: Sequence[str]) -> Dict[str, List[int]]:
+        """
+        The indexes of keys, by the name of the live node that owns them.
+        Keys with no live node are left out
+        """
+        ret: Dict[str, List[int]] = {}
+        for i, key in enumerate(keys):
+            owner = self.node(key)
+            if owner is not None:
+                ret.setdefault(owner[0], []).append(i)
+        return ret
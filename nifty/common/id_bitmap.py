@@ -0,0 +1,110 @@
+# fixes stubs like redis that use generics when the code does not
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
+
+from redis.client import Redis
+from redis.exceptions import RedisError
+
+from . import cfg
+from .bloom import BLOOM_ADD, BLOOM_CHECK
+from .types import Key
+
+_logger = logging.getLogger(__name__)
+
+SHORT_URL_BITMAP_CFG_KEY = "short-url-bitmap"
+
+# a redis string tops out at 512MB
+MAX_ID = 2**32 - 1
+
+
+@dataclass
+class IdBitmapStats:
+    ready: bool
+    ids: int
+    bytes: int
+
+
+class IdBitmap:
+    """
+    Exact set of ids in a redis bitmap, one bit per id.
+
+    It answers like a bloom filter with no false positives: the bloom scripts
+    with the id as the only position.  A bitmap that was never built, or an id
+    too big for one, answers "maybe".
+    """
+
+    def __init__(self, redis: Redis[str], key: str):
+        self.__redis = redis
+        self.key = key
+        self.building_key = f"{key}:building"
+
+    def might_contain(self, id: int) -> bool:
+        """
+        False means id was definitely never added
+        """
+        if id > MAX_ID:
+            return True
+        return bool(BLOOM_CHECK(self.__redis, [self.key], [id]))
+
+    def add_many(self, ids: Iterable[int]):
+        """
+        Set ids, or if that fails drop the bitmap so it answers "maybe" until
+        rebuilt, rather than 404ing ids it should have
+        """
+        positions = bit_positions(ids)
+        if not positions:
+            return
+        try:
+            BLOOM_ADD(self.__redis, [self.key, self.building_key], positions)
+        except RedisError as e:
+            _logger.error(f"unable to add to {self.key}, dropping it: {e}")
+            self.__redis.delete(self.key)
+
+    def rebuild(self, ids: Iterable[int], batch_size: int = 10000) -> int:
+        """
+        Build a new bitmap from ids and swap it in atomically
+
+        :return: how many ids were added
+        """
+        self.__redis.delete(self.building_key)
+        # lets BLOOM_ADD see the key, it grows as bits are set
+        self.__redis.setbit(self.building_key, 0, 0)
+        count = 0
+        batch: List[int] = []
+        for id in ids:
+            batch.append(id)
+            if len(batch) >= batch_size:
+                self.add_many(batch)
+                count += len(batch)
+                batch = []
+        self.add_many(batch)
+        count += len(batch)
+        self.__redis.rename(self.building_key, self.key)
+        return count
+
+    def stats(self) -> IdBitmapStats:
+        with self.__redis.pipeline(transaction=False) as pipe:
+            pipe.exists(self.key)
+            pipe.bitcount(self.key)
+            pipe.strlen(self.key)
+            exists, ids, size = pipe.execute()
+        return IdBitmapStats(ready=bool(exists), ids=int(ids), bytes=int(size))
+
+
+def bit_positions(ids: Iterable[int]) -> List[str | int]:
+    """
+    The BLOOM_ADD args that set ids, leaving out ones too big for a bitmap
+    """
+    return [id for id in ids if id <= MAX_ID]
+
+
+def short_url_bitmap_from_cfg(redis: Redis[str]) -> Optional[IdBitmap]:
+    """
+    The bitmap of decoded short urls that have a link, or None if disabled
+    """
+    if not cfg.gbool_fb(SHORT_URL_BITMAP_CFG_KEY, "enabled", False):
+        return None
+    return IdBitmap(redis, Key.short_url_bitmap.value)
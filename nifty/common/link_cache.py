@@ -0,0 +1,251 @@
+# fixes stubs like redis that use generics when the code does not
+from __future__ import annotations
+
+import logging
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, TypeVar
+
+from redis.client import Redis
+from redis.exceptions import ConnectionError, TimeoutError
+
+from . import cfg, redis_helpers
+from .hash_ring import HashRing
+from .types import Key, Link, RedisType
+
+_logger = logging.getLogger(__name__)
+_R = TypeVar("_R")
+_T = TypeVar("_T")
+
+# what a dead or unreachable node looks like, anything else is a real error
+NODE_FAILURES = (ConnectionError, TimeoutError)
+
+
+def cache_nodes() -> List[Tuple[str, int]]:
+    """
+    The redis-cache endpoints, [redis-cache] hosts=a:6379,b:6379 or just host
+    """
+    section = RedisType.CACHE.cfg_key
+    hosts = cfg.g_opt(section, "hosts")
+    if not hosts:
+        return [(cfg.g(section, "host"), cfg.gint_fb(section, "port", 6379))]
+    ret: List[Tuple[str, int]] = []
+    for endpoint in hosts.split(","):
+        host, _, port = endpoint.strip().partition(":")
+        ret.append((host, int(port) if port else 6379))
+    return ret
+
+
+def ring_from_cfg(nodes: Dict[str, _T]) -> HashRing[_T]:
+    section = RedisType.CACHE.cfg_key
+    return HashRing(
+        nodes,
+        vnodes=cfg.gint_fb(section, "vnodes", 160),
+        down_sec=cfg.gfloat_fb(section, "down_sec", 5),
+    )
+
+
+# a dead node has to fail fast to be routed around
+def connect_timeout_sec() -> float:
+    return cfg.gint_fb(RedisType.CACHE.cfg_key, "connect_timeout_ms", 250) / 1000
+
+
+def timeout_sec() -> float:
+    return cfg.gint_fb(RedisType.CACHE.cfg_key, "timeout_ms", 1000) / 1000
+
+
+def forward_key(long_url: str) -> str:
+    return Key.short_by_long_digest.sub(redis_helpers.long_url_digest(long_url))
+
+
+class LinkCache:
+    """
+    The short_url -> link cache, spread over redis-cache nodes on a hash ring.
+
+    Every key of a link is routed by its short_url so the lua scripts see them
+    all on one node.  The long_url -> short_url forward key is routed by
+    itself, and when that is another node it costs an extra round trip.
+
+    The cache is never worth failing a request over: an unreachable node is
+    marked down and its keys go to the next node, and if there are none left
+    reads miss and writes are dropped.
+    """
+
+    def __init__(self, ring: HashRing[Redis[str]]):
+        self.__ring = ring
+
+    def __down(self, name: str, e: Exception):
+        _logger.warning(f"redis-cache {name} failed, routing around it: {e}")
+        self.__ring.mark_down(name)
+
+    def __call(self, key: str, fn: Callable[[Redis[str]], _R], default: _R) -> _R:
+        for _ in range(len(self.__ring)):
+            owner = self.__ring.node(key)
+            if owner is None:
+                break
+            try:
+                return fn(owner[1])
+            except NODE_FAILURES as e:
+                self.__down(owner[0], e)
+        return default
+
+    def __on_nodes(
+        self, keys: Sequence[str], fn: Callable[[Redis[str], List[int]], None]
+    ):
+        """
+        Call fn once per node with the indexes of the keys it owns, moving
+        the keys of a failed node on to the next one
+        """
+        pending = list(range(len(keys)))
+        for _ in range(len(self.__ring)):
+            failed: List[int] = []
+            for name, idxs in self.__ring.group([keys[i] for i in pending]).items():
+                batch = [pending[i] for i in idxs]
+                try:
+                    fn(self.__ring.client(name), batch)
+                except NODE_FAILURES as e:
+                    self.__down(name, e)
+                    failed += batch
+            if not failed:
+                return
+            pending = failed
+
+    def __owns(self, name: str, link: Link) -> bool:
+        owner = self.__ring.node(link.short_url)
+        return owner is not None and owner[0] == name
+
+    def __colocated(self, link: Link) -> bool:
+        link_node = self.__ring.node(link.short_url)
+        forward_node = self.__ring.node(forward_key(link.long_url))
+        return (
+            link_node is None or forward_node is None or link_node[0] == forward_node[0]
+        )
+
+    def get_link(self, short_url: str) -> Optional[Link]:
+        return self.__call(
+            short_url, lambda r: redis_helpers.get_link(r, short_url), None
+        )
+
+    def get_links(self, short_urls: Sequence[str]) -> List[Optional[Link]]:
+        """
+        get_link for many short urls, one pipeline per node, in the same order
+        """
+        ret: List[Optional[Link]] = [None] * len(short_urls)
+
+        def get(redis: Redis[str], batch: List[int]):
+            links = redis_helpers.get_links(redis, [short_urls[i] for i in batch])
+            for i, link in zip(batch, links):
+                ret[i] = link
+
+        self.__on_nodes(short_urls, get)
+        return ret
+
+    def get_links_by_id(self, ids: Sequence[int]) -> List[Optional[Link]]:
+        """
+        The cached links for ids, in the same order.  A link lives on the node
+        of its short_url, which an id doesn't give us, so every live node is
+        asked for what is still missing, one pipeline each
+        """
+        ret: List[Optional[Link]] = [None] * len(ids)
+        for name in self.__ring.names():
+            pending = [i for i, link in enumerate(ret) if link is None]
+            if not pending:
+                break
+            if self.__ring.is_down(name):
+                continue
+            try:
+                links = redis_helpers.get_links_by_id(
+                    self.__ring.client(name), [ids[i] for i in pending]
+                )
+            except NODE_FAILURES as e:
+                self.__down(name, e)
+                continue
+            for i, link in zip(pending, links):
+                # a copy left on a node that no longer owns it may be stale
+                if link is not None and self.__owns(name, link):
+                    ret[i] = link
+        return ret
+
+    def get_link_by_long(self, long_url: str) -> Optional[Link]:
+        """
+        The cached link for a long_url, if it was put with a forward ttl
+        """
+        key = forward_key(long_url)
+        if len(self.__ring) == 1:
+            return self.__call(
+                key, lambda r: redis_helpers.get_link_by_long(r, long_url), None
+            )
+
+        short_url = self.__call(key, lambda r: r.get(key), None)
+        link = self.get_link(short_url) if short_url else None
+        # a digest collision looks like a miss
+        return link if link is not None and link.long_url == long_url else None
+
+    def is_missing(self, short_url: str) -> bool:
+        """
+        Whether a lookup of short_url recently found nothing
+        """
+        key = Key.missing_short_url.sub(short_url)
+        return bool(self.__call(short_url, lambda r: r.exists(key), 0))
+
+    def put_missing(self, short_url: str, ttl_sec: int):
+        """
+        Remember short_url has no link for ttl_sec, put_link forgets it
+        """
+        key = Key.missing_short_url.sub(short_url)
+        self.__call(short_url, lambda r: r.set(key, 1, ex=ttl_sec), None)
+
+    def put_link(self, link: Link, forward_ttl_sec: int = 0):
+        self.put_links([link], forward_ttl_sec)
+
+    def put_links(self, links: Sequence[Link], forward_ttl_sec: int = 0):
+        """
+        Cache links by short_url and link id, and by long_url for
+        forward_ttl_sec if that is > 0
+        """
+        near: List[Link] = []
+        far: List[Link] = []
+        for link in links:
+            colocated = forward_ttl_sec <= 0 or self.__colocated(link)
+            (near if colocated else far).append(link)
+
+        def put(ttl: int, group: List[Link]):
+            def fn(redis: Redis[str], batch: List[int]):
+                redis_helpers.put_links(redis, [group[i] for i in batch], ttl)
+
+            self.__on_nodes([link.short_url for link in group], fn)
+
+        put(forward_ttl_sec, near)
+        if not far:
+            return
+        put(0, far)
+
+        forward_keys = [forward_key(link.long_url) for link in far]
+
+        def put_forward(redis: Redis[str], batch: List[int]):
+            with redis.pipeline(transaction=False) as pipe:
+                for i in batch:
+                    pipe.set(forward_keys[i], far[i].short_url, ex=forward_ttl_sec)
+                pipe.execute()
+
+        self.__on_nodes(forward_keys, put_forward)
+
+
+def cache_ring() -> HashRing[Redis[str]]:
+    section = RedisType.CACHE.cfg_key
+    return ring_from_cfg(
+        {
+            f"{host}:{port}": Redis(
+                host=host,
+                port=port,
+                username=cfg.g(section, "user"),
+                password=cfg.g(section, "pwd"),
+                decode_responses=True,
+                socket_connect_timeout=connect_timeout_sec(),
+                socket_timeout=timeout_sec(),
+            )
+            for host, port in cache_nodes()
+        }
+    )
+
+
+def from_cfg() -> LinkCache:
+    return LinkCache(cache_ring())
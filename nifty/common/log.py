@@ -1,21 +1,161 @@
+import atexit
+import json
 import logging
+import os
+import queue
 import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Callable, Dict, Optional, Tuple
 
 from . import cfg
 
+# records are queued by the thread that logs them and written to stdout by a
+# listener thread, so a slow stdout never holds up a request.  configured by
+# [logging]:
+#   level      root level
+#   format     text or json, one object per line
+#   queue_size records waiting to be written, more are dropped, 0 writes inline
+#   rate_per_sec, burst
+#              per logger budget for records below WARNING, 0 is unlimited
+#
+# a forked child gets a copy of the queue but not the listener, so it starts
+# its own on a new queue
+
+LOGGING_CFG_KEY = "logging"
+
+_TEXT_FORMAT = (
+    "%(asctime)s %(levelname)-8s "
+    "[%(filename)s:%(lineno)d] %(funcName)s() => %(message)s"
+)
+
+_handler: Optional[logging.Handler] = None
+_listener: Optional[QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One json object per record, for log shippers
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            "at": int(record.created * 1000),
+            "level": record.levelname,
+            "logger": record.name,
+            "where": f"{record.filename}:{record.lineno}",
+            "func": record.funcName,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            out["exc"] = record.exc_text
+        return json.dumps(out)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets each logger through at rate_per_sec records on average, up to burst
+    at once, and drops the rest.  Warnings and worse always pass.
+    """
+
+    def __init__(
+        self,
+        rate_per_sec: float,
+        burst: int,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        super().__init__()
+        self.__rate = rate_per_sec
+        self.__burst = burst
+        self.__clock = clock
+        self.__lock = threading.Lock()
+        # tokens left and when they were counted, by logger
+        self.__buckets: Dict[str, Tuple[float, float]] = {}
+        self.dropped = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        now = self.__clock()
+        with self.__lock:
+            tokens, at = self.__buckets.get(record.name, (self.__burst, now))
+            tokens = min(self.__burst, tokens + (now - at) * self.__rate)
+            if tokens < 1:
+                self.__buckets[record.name] = (tokens, now)
+                self.dropped += 1
+                return False
+            self.__buckets[record.name] = (tokens - 1, now)
+            return True
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """
+    Drops records rather than block when the listener falls behind
+    """
+
+    def __init__(self, q: "queue.Queue[logging.LogRecord]"):
+        super().__init__(q)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def formatter() -> logging.Formatter:
+    if cfg.g_fb(LOGGING_CFG_KEY, "format", "text") == "json":
+        return JsonFormatter()
+    return logging.Formatter(_TEXT_FORMAT)
+
+
+def _start_listener(handler: QueueHandler, stream: logging.Handler, queue_size: int):
+    global _listener
+    handler.queue = queue.Queue(maxsize=queue_size)
+    _listener = QueueListener(handler.queue, stream)  # type: ignore
+    _listener.start()
+
+
+def _stop_listener():
+    # writes out whatever is still queued
+    if _listener is not None:
+        _listener.stop()
+
 
 def log_init():
-    log_level = cfg.g_fb("logging", "level", "WARN")
+    global _handler
+    log_level = cfg.g_fb(LOGGING_CFG_KEY, "level", "WARN")
     log_level_val = getattr(logging, log_level.upper())
     print(f"Log level set to {log_level} {log_level_val}")
     root = logging.getLogger()
     root.setLevel(log_level_val)
+    if _handler is not None:
+        return
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setLevel(log_level_val)
+    stream.setFormatter(formatter())
+
+    handler: logging.Handler = stream
+    queue_size = cfg.gint_fb(LOGGING_CFG_KEY, "queue_size", 10000)
+    if queue_size > 0:
+        queue_handler = _DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+        _start_listener(queue_handler, stream, queue_size)
+        os.register_at_fork(
+            after_in_child=lambda: _start_listener(queue_handler, stream, queue_size)
+        )
+        atexit.register(_stop_listener)
+        handler = queue_handler
 
-    handler = logging.StreamHandler(sys.stdout)
-    handler.setLevel(log_level_val)
-    formatter = logging.Formatter(
-        "%(asctime)s %(levelname)-8s "
-        "[%(filename)s:%(lineno)d] %(funcName)s() => %(message)s"
-    )
-    handler.setFormatter(formatter)
+    rate = cfg.gfloat_fb(LOGGING_CFG_KEY, "rate_per_sec", 0)
+    if rate > 0:
+        handler.addFilter(
+            RateLimitFilter(rate, cfg.gint_fb(LOGGING_CFG_KEY, "burst", 100))
+        )
     root.addHandler(handler)
+    _handler = handler
@@ -0,0 +1,198 @@
+# fixes stubs like redis that use generics when the code does not
+from __future__ import annotations
+
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from enum import Enum
+from typing import List, Optional, Tuple
+
+from redis.client import Redis
+
+from . import cfg, redis_helpers
+from .types import Transport, stream_key
+
+_logger = logging.getLogger(__name__)
+
+# how long an idle flusher waits before checking if it should stop
+_IDLE_WAIT_SEC = 0.25
+
+PUBLISHER_CFG_KEY = "publisher"
+
+
+class QueueFullPolicy(str, Enum):
+    """
+    What publish() does when the queue is full
+
+    drop: count it and move on, the caller never waits
+    block: wait up to block_timeout_sec for room, then drop
+    """
+
+    drop = "drop"
+    block = "block"
+
+
+@dataclass
+class PublisherStats:
+    published: int = 0
+    dropped: int = 0
+    failed: int = 0
+    batches: int = 0
+    pending: int = 0
+
+
+class BatchPublisher:
+    """
+    Publishes from a background thread so callers never wait on redis.
+
+    Messages go into a bounded queue, and a flusher thread sends them in
+    pipelined batches of up to batch_size, or whatever has arrived after
+    flush_interval_sec.  If redis is down the batch is counted as failed and
+    dropped rather than retried, so an outage can't back up into requests.
+    """
+
+    def __init__(
+        self,
+        redis: Redis[str],
+        *,
+        max_queue: int = 10000,
+        batch_size: int = 500,
+        flush_interval_sec: float = 0.005,
+        policy: QueueFullPolicy = QueueFullPolicy.drop,
+        block_timeout_sec: float = 0.05,
+        transport: Transport = Transport.pubsub,
+        stream_maxlen: int = 100000,
+    ):
+        if max_queue < 1 or batch_size < 1:
+            raise ValueError("max_queue and batch_size must be >= 1")
+        if flush_interval_sec <= 0:
+            raise ValueError("flush_interval_sec must be > 0")
+
+        self.__redis = redis
+        self.__queue: queue.Queue[Tuple[str, str | bytes]] = queue.Queue(
+            maxsize=max_queue
+        )
+        self.__batch_size = batch_size
+        self.__flush_interval_sec = flush_interval_sec
+        self.__policy = policy
+        self.__block_timeout_sec = block_timeout_sec
+        self.__transport = transport
+        self.__stream_maxlen = stream_maxlen
+        self.__lock = threading.Lock()
+        self.__stats = PublisherStats()
+        self.__running = threading.Event()
+        self.__thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self.__thread is not None:
+            return
+        self.__running.set()
+        self.__thread = threading.Thread(
+            target=self.__run, name="nifty-publisher", daemon=True
+        )
+        self.__thread.start()
+
+    def close(self, timeout_sec: float = 5):
+        """
+        Stop the flusher and send whatever is still queued
+        """
+        self.__running.clear()
+        if self.__thread is not None:
+            self.__thread.join(timeout_sec)
+            self.__thread = None
+        self.__flush(self.__drain(self.__queue.qsize()))
+
+    def publish(self, channel: str, msg: str | bytes) -> bool:
+        """
+        Queue a message, returns False if it was dropped
+        """
+        item = (channel, msg)
+        try:
+            if self.__policy == QueueFullPolicy.block:
+                self.__queue.put(item, timeout=self.__block_timeout_sec)
+            else:
+                self.__queue.put_nowait(item)
+            return True
+        except queue.Full:
+            with self.__lock:
+                self.__stats.dropped += 1
+            return False
+
+    def stats(self) -> PublisherStats:
+        with self.__lock:
+            return PublisherStats(
+                **{**self.__stats.__dict__, "pending": self.__queue.qsize()}
+            )
+
+    def __drain(self, limit: int) -> List[Tuple[str, str | bytes]]:
+        batch: List[Tuple[str, str | bytes]] = []
+        while len(batch) < limit:
+            try:
+                batch.append(self.__queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def __next_batch(self) -> List[Tuple[str, str | bytes]]:
+        try:
+            batch = [self.__queue.get(timeout=_IDLE_WAIT_SEC)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.__flush_interval_sec
+        while len(batch) < self.__batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.__queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def __flush(self, batch: List[Tuple[str, str | bytes]]):
+        if not batch:
+            return
+        try:
+            with self.__redis.pipeline(transaction=False) as pipe:
+                for channel, msg in batch:
+                    if self.__transport == Transport.stream:
+                        pipe.xadd(
+                            stream_key(channel),
+                            {"data": msg},
+                            maxlen=self.__stream_maxlen,
+                            approximate=True,
+                        )
+                    else:
+                        pipe.publish(channel, msg)
+                pipe.execute()
+            with self.__lock:
+                self.__stats.published += len(batch)
+                self.__stats.batches += 1
+        except Exception as e:
+            _logger.warning(f"dropping {len(batch)} messages, publish failed: {e}")
+            with self.__lock:
+                self.__stats.failed += len(batch)
+
+    def __run(self):
+        while self.__running.is_set():
+            self.__flush(self.__next_batch())
+
+
+def from_cfg(redis: Redis[str]) -> BatchPublisher:
+    return BatchPublisher(
+        redis,
+        max_queue=cfg.gint_fb(PUBLISHER_CFG_KEY, "max_queue", 10000),
+        batch_size=cfg.gint_fb(PUBLISHER_CFG_KEY, "batch_size", 500),
+        flush_interval_sec=cfg.gfloat_fb(PUBLISHER_CFG_KEY, "flush_interval_ms", 5)
+        / 1000,
+        policy=QueueFullPolicy(
+            cfg.g_fb(PUBLISHER_CFG_KEY, "policy", QueueFullPolicy.drop.value)
+        ),
+        block_timeout_sec=cfg.gfloat_fb(PUBLISHER_CFG_KEY, "block_timeout_ms", 50)
+        / 1000,
+        transport=redis_helpers.get_transport(),
+        stream_maxlen=redis_helpers.get_stream_maxlen(),
+    )
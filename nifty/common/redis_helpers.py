@@ -1,22 +1,32 @@
 # fixes stubs like redis that use generics when the code does not
 from __future__ import annotations
 
+import hashlib
 import logging
-from typing import Optional, Type, TypeVar
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Type, TypeVar
 
 from pydantic import BaseModel
-from redis.client import Redis
+from redis.client import Pipeline, Redis
+from redis.exceptions import NoScriptError
 
 from . import cfg
 from .helpers import none_throws, noneint_throws
-from .types import Key, RedisType
+from .types import EventFormat, Key, Link, RedisType, Transport
+
+_logger = logging.getLogger(__name__)
 
 TBaseModel = TypeVar("TBaseModel", bound=BaseModel)
 
 
 def get_redis(
-    redis_type: RedisType, *, cfg_creds_section: Optional[str] = None
+    redis_type: RedisType,
+    *,
+    cfg_creds_section: Optional[str] = None,
+    decode_responses: bool = True,
 ) -> Redis[str]:
+    """
+    decode_responses=False for a client that reads events, which may be binary
+    """
     creds_section = redis_type.cfg_key
     user_key = "user"
     pwd_key = "pwd"
@@ -29,11 +39,32 @@ def get_redis(
         username=cfg.g(creds_section, user_key),
         password=cfg.g(creds_section, pwd_key),
         port=cfg.gint_fb(redis_type.cfg_key, "port", 6379),
-        decode_responses=True,
+        decode_responses=decode_responses,
     )
     return foo
 
 
+def get_transport() -> Transport:
+    """
+    How events travel between the service and workers, all sides must agree
+    """
+    return Transport(cfg.g_fb("redis", "transport", Transport.pubsub.value))
+
+
+def get_event_format() -> EventFormat:
+    """
+    How producers encode events, consumers read every format
+    """
+    return EventFormat(cfg.g_fb("redis", "event_format", EventFormat.json.value))
+
+
+def get_stream_maxlen() -> int:
+    """
+    Approximate cap on each event stream when using Transport.stream
+    """
+    return cfg.gint_fb("redis", "stream_maxlen", 100000)
+
+
 def rint_throws(redis: Redis[str], key: str) -> int:
     raw = redis.get(key)
     return noneint_throws(raw, key)
@@ -51,7 +82,7 @@ def robj(
     throws: Optional[bool] = True,
 ) -> Optional[TBaseModel]:
     raw = redis.hgetall(key)
-    logging.getLogger().debug(f"Raw HGETALL response: {raw}")
+    _logger.debug("Raw HGETALL response: %s", raw)
     if throws:
         return cl.parse_obj(none_throws(raw, key))
 
@@ -62,3 +93,207 @@ def trending_size(
     redis: Redis[str],
 ) -> Optional[int]:
     return rint_throws(redis, Key.trending_size)
+
+
+class LuaScript:
+    """
+    A server side script, run with EVALSHA and falling back to EVAL
+    (which also caches it on the server) when redis answers NOSCRIPT
+    """
+
+    def __init__(self, name: str, source: str):
+        self.name = name
+        self.source = source
+        self.sha = hashlib.sha1(source.encode()).hexdigest()
+
+    def __call__(
+        self, redis: Redis[str], keys: Sequence[str], args: Sequence[str | int]
+    ) -> Any:
+        try:
+            return redis.evalsha(self.sha, len(keys), *keys, *args)
+        except NoScriptError:
+            _logger.info("NOSCRIPT for %s, using EVAL", self.name)
+            return redis.eval(self.source, len(keys), *keys, *args)
+
+    def queue(
+        self, pipe: Pipeline[str], keys: Sequence[str], args: Sequence[str | int]
+    ):
+        """
+        Queue on a pipeline, call load_scripts on the target first since
+        a NOSCRIPT can't be recovered from mid-pipeline
+        """
+        pipe.evalsha(self.sha, len(keys), *keys, *args)
+
+
+scripts: Dict[str, LuaScript] = {}
+
+
+def register_script(name: str, source: str) -> LuaScript:
+    script = LuaScript(name, source)
+    scripts[name] = script
+    return script
+
+
+def load_scripts(redis: Redis[str]):
+    for script in scripts.values():
+        redis.script_load(script.source)
+
+
+# short_url -> link_id -> link hash, in one round trip
+GET_LINK = register_script(
+    "get_link",
+    """
+local link_id = redis.call('GET', KEYS[1])
+if not link_id then
+  return {}
+end
+return redis.call('HGETALL', ARGV[1] .. ':' .. link_id)
+""",
+)
+
+# long_url digest -> short_url -> link_id -> link hash, in one round trip.
+# the digest can collide, callers must check the link's long_url
+GET_LINK_BY_LONG = register_script(
+    "get_link_by_long",
+    """
+local short_url = redis.call('GET', KEYS[1])
+if not short_url then
+  return {}
+end
+local link_id = redis.call('GET', ARGV[1] .. ':' .. short_url)
+if not link_id then
+  return {}
+end
+return redis.call('HGETALL', ARGV[2] .. ':' .. link_id)
+""",
+)
+
+# all the link cache keys atomically, the forward one only if it has a ttl,
+# and forget the short url was ever missing
+PUT_LINK = register_script(
+    "put_link",
+    """
+redis.call('HSET', KEYS[1], unpack(ARGV, 5))
+redis.call('SET', KEYS[2], ARGV[1])
+redis.call('SET', KEYS[3], ARGV[2])
+if tonumber(ARGV[4]) > 0 then
+  redis.call('SET', KEYS[4], ARGV[3], 'EX', ARGV[4])
+end
+redis.call('DEL', KEYS[5])
+return 1
+""",
+)
+
+
+def link_from_flat(raw: List[str]) -> Optional[Link]:
+    if not raw:
+        return None
+    return Link.from_redis(dict(zip(raw[::2], raw[1::2])))
+
+
+def get_link_params(short_url: str) -> Tuple[List[str], List[str | int]]:
+    return [Key.link_id_cache.sub(short_url)], [Key.link_by_link_id.value]
+
+
+def get_link(redis: Redis[str], short_url: str) -> Optional[Link]:
+    return link_from_flat(GET_LINK(redis, *get_link_params(short_url)))
+
+
+def long_url_digest(long_url: str) -> str:
+    return hashlib.blake2b(long_url.encode(), digest_size=16).hexdigest()
+
+
+def get_link_by_long_params(long_url: str) -> Tuple[List[str], List[str | int]]:
+    return [Key.short_by_long_digest.sub(long_url_digest(long_url))], [
+        Key.link_id_cache.value,
+        Key.link_by_link_id.value,
+    ]
+
+
+def link_for_long_url(raw: List[str], long_url: str) -> Optional[Link]:
+    link = link_from_flat(raw)
+    # a digest collision looks like a miss
+    return link if link is not None and link.long_url == long_url else None
+
+
+def get_link_by_long(redis: Redis[str], long_url: str) -> Optional[Link]:
+    """
+    The cached link for a long_url, if put_link was given a forward ttl
+    """
+    return link_for_long_url(
+        GET_LINK_BY_LONG(redis, *get_link_by_long_params(long_url)), long_url
+    )
+
+
+def put_link_params(
+    link: Link, forward_ttl_sec: int = 0
+) -> Tuple[List[str], List[str | int]]:
+    keys = [
+        Key.link_by_link_id.sub(link.id),
+        Key.link_id_cache.sub(link.short_url),
+        Key.long_by_short.sub(link.short_url),
+        Key.short_by_long_digest.sub(long_url_digest(link.long_url)),
+        Key.missing_short_url.sub(link.short_url),
+    ]
+    args: List[str | int] = [link.id, link.long_url, link.short_url, forward_ttl_sec]
+    for k, v in link.redis_dict().items():
+        args += [k, v]
+    return keys, args
+
+
+def put_link(redis: Redis[str], link: Link, forward_ttl_sec: int = 0):
+    """
+    Cache a link by short_url and link id, and by long_url for
+    forward_ttl_sec if that is > 0
+    """
+    PUT_LINK(redis, *put_link_params(link, forward_ttl_sec))
+
+
+def _pipelined(
+    redis: Redis[str],
+    script: LuaScript,
+    params: Sequence[Tuple[List[str], List[str | int]]],
+) -> List[Any]:
+    for attempt in range(2):
+        try:
+            with redis.pipeline(transaction=False) as pipe:
+                for keys, args in params:
+                    script.queue(pipe, keys, args)
+                return pipe.execute()
+        except NoScriptError:
+            # the server lost its script cache, load and go again
+            if attempt > 0:
+                raise
+            load_scripts(redis)
+    return []
+
+
+def put_links(redis: Redis[str], links: Sequence[Link], forward_ttl_sec: int = 0):
+    """
+    put_link for many links in one pipeline
+    """
+    _pipelined(
+        redis, PUT_LINK, [put_link_params(link, forward_ttl_sec) for link in links]
+    )
+
+
+def get_links_by_id(redis: Redis[str], ids: Sequence[int]) -> List[Optional[Link]]:
+    """
+    The cached links for ids in one pipeline, in the same order
+    """
+    with redis.pipeline(transaction=False) as pipe:
+        for id in ids:
+            pipe.hgetall(Key.link_by_link_id.sub(id))
+        return [Link.from_redis(raw) if raw else None for raw in pipe.execute()]
+
+
+def get_links(redis: Redis[str], short_urls: Sequence[str]) -> List[Optional[Link]]:
+    """
+    get_link for many short urls in one pipeline, in the same order
+    """
+    return [
+        link_from_flat(raw)
+        for raw in _pipelined(
+            redis, GET_LINK, [get_link_params(short_url) for short_url in short_urls]
+        )
+    ]
@@ -1,6 +1,9 @@
-from datetime import datetime
+import struct
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timezone
 from enum import Enum
-from typing import Dict, List, Set
+from typing import Callable, Dict, List, Mapping, Set, Tuple, Type, TypeVar
 from pydantic import BaseModel
 
 # NEVER import anything outside this module :-)
@@ -25,8 +28,14 @@ class Key(str, Enum):
     link_id_cache = "nifty:linkid:byshorturl"
     link_by_link_id = "nifty:link:bylinkid"
     long_by_short = "nifty:longurl:byshorturl"
+    short_by_long_digest = "nifty:shorturl:bylongdigest"
+    missing_short_url = "nifty:shorturl:missing"
+    short_url_bitmap = "nifty:bitmap:shorturlid"
+    hot_short_urls = "nifty:hotkeys:shorturl"
     trending = "nifty:trending"
     trending_size = "nifty:trending:size"
+    trending_view = "nifty:trending:view"
+    long_url_bloom = "nifty:bloom:longurl"
 
     def sub(self, *subscript: str | int) -> str:
         return f"{self.value}:{'.'.join([str(s) for s in subscript])}"
@@ -37,9 +46,59 @@ class Channel(str, Enum):
     trend = "nifty:trend"
     trend_link = "nifty:trend_link"
     image_builder = "nifty:image"
+    link_invalidate = "nifty:link:invalidate"
 
 
-class Link(BaseModel):
+class Transport(str, Enum):
+    """
+    How events on a Channel travel between processes
+
+    pubsub: PUBLISH/SUBSCRIBE, fire and forget, every subscriber gets everything
+    stream: XADD/XREADGROUP, durable, each consumer group processes an event once
+    """
+
+    pubsub = "pubsub"
+    stream = "stream"
+
+
+class EventFormat(str, Enum):
+    """
+    How events are encoded on a Channel, see encode_event
+
+    json: pydantic json, readable with redis-cli
+    binary: a fixed struct layout per event type, much cheaper to decode
+    """
+
+    json = "json"
+    binary = "binary"
+
+
+def _channel_name(channel: str) -> str:
+    # a str enum formats as Channel.action, not its value
+    return channel.value if isinstance(channel, Channel) else channel
+
+
+def stream_key(channel: str) -> str:
+    """
+    The stream that carries a channel's events when using Transport.stream
+    """
+    return f"{_channel_name(channel)}:stream"
+
+
+def dead_letter_key(channel: str) -> str:
+    """
+    Where a channel's stream entries go once they have failed too many times
+    """
+    return f"{_channel_name(channel)}:dead"
+
+
+@dataclass(slots=True)
+class Link:
+    """
+    A plain slotted record rather than a model, one is built for every lookup
+    and nothing about it needs validating
+    """
+
     id: int
     created_at: datetime
     long_url_id: int
@@ -47,13 +106,31 @@ class Link(BaseModel):
     long_url: str
     short_url: str
 
+    @classmethod
+    def from_redis(cls, raw: Mapping[str, str]) -> "Link":
+        """
+        From a redis_dict hash, as redis returns it
+        """
+        return cls(
+            int(raw["id"]),
+            datetime.fromtimestamp(int(raw["created_at"]) / 1000, tz=timezone.utc),
+            int(raw["long_url_id"]),
+            int(raw["short_url_id"]),
+            raw["long_url"],
+            raw["short_url"],
+        )
+
     def created_at_ms(self) -> int:
         return int(self.created_at.timestamp() * 1000)
 
     def redis_dict(self) -> Dict[str, int | str]:
         return {
-            **self.dict(exclude={"created_at"}),
-            "created_at": int(self.created_at.timestamp() * 1000),
+            "id": self.id,
+            "long_url_id": self.long_url_id,
+            "short_url_id": self.short_url_id,
+            "long_url": self.long_url,
+            "short_url": self.short_url,
+            "created_at": self.created_at_ms(),
         }
 
 
@@ -79,6 +156,14 @@ class Action(Meta):
     type: ActionType
     link_id: int
 
+    @classmethod
+    def new(cls, type: ActionType, link_id: int, at: int) -> "Action":
+        """
+        A new action from the request path, built without validation since
+        every field is ours
+        """
+        return cls.construct(uuid=str(uuid.uuid1()), at=at, type=type, link_id=link_id)
+
 
 class TrendEvent(Meta):
     added: Set[int]
@@ -93,3 +178,145 @@ class TrendLinkEvent(DownstreamEvent):
 class ImageEvent(DownstreamEvent):
     short_url: str
     image_key: str
+
+
+# binary events start with a magic byte no json document starts with, then a
+# version and the event type, then the event's fixed layout, little endian.
+# decode_event reads both formats so consumers can be upgraded before
+# producers switch, and a new version can be read before it is written
+EVENT_MAGIC = 0xA7
+EVENT_VERSION = 1
+
+_EVENT_HEADER = struct.Struct("<BBB")
+# uuid, at, type, link_id
+_ACTION = struct.Struct("<16sQBQ")
+# uuid, at, len(added), len(removed), then that many link ids
+_TREND = struct.Struct("<16sQII")
+# uuid, at, link_id, added, len(upstream), then that many upstreams
+_TREND_LINK = struct.Struct("<16sQQ?B")
+# uuid, at, channel
+_UPSTREAM = struct.Struct("<16sQB")
+
+# codes are part of the format, only ever add to these
+_ACTION_TYPES = {ActionType.get: 1, ActionType.create: 2}
+_CHANNELS = {
+    Channel.action: 1,
+    Channel.trend: 2,
+    Channel.trend_link: 3,
+    Channel.image_builder: 4,
+    Channel.link_invalidate: 5,
+}
+_ACTION_TYPES_BY_CODE = {v: k for k, v in _ACTION_TYPES.items()}
+_CHANNELS_BY_CODE = {v: k for k, v in _CHANNELS.items()}
+
+_TEvent = TypeVar("_TEvent", bound=Meta)
+
+
+def _uuid(raw: bytes) -> str:
+    # what str(uuid.UUID(bytes=raw)) gives, without building the UUID
+    h = raw.hex()
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+
+def _encode_action(e: Action) -> bytes:
+    return _ACTION.pack(uuid.UUID(e.uuid).bytes, e.at, _ACTION_TYPES[e.type], e.link_id)
+
+
+def _decode_action(data: bytes) -> Action:
+    raw_uuid, at, type, link_id = _ACTION.unpack_from(data, _EVENT_HEADER.size)
+    # the layout already guarantees the types, so skip validation
+    return Action.construct(
+        uuid=_uuid(raw_uuid),
+        at=at,
+        type=_ACTION_TYPES_BY_CODE[type],
+        link_id=link_id,
+    )
+
+
+def _encode_trend(e: TrendEvent) -> bytes:
+    return _TREND.pack(
+        uuid.UUID(e.uuid).bytes, e.at, len(e.added), len(e.removed)
+    ) + struct.pack(f"<{len(e.added) + len(e.removed)}Q", *e.added, *e.removed)
+
+
+def _decode_trend(data: bytes) -> TrendEvent:
+    offset = _EVENT_HEADER.size
+    raw_uuid, at, added, removed = _TREND.unpack_from(data, offset)
+    ids = struct.unpack_from(f"<{added + removed}Q", data, offset + _TREND.size)
+    return TrendEvent.construct(
+        uuid=_uuid(raw_uuid),
+        at=at,
+        added=set(ids[:added]),
+        removed=set(ids[added:]),
+    )
+
+
+def _encode_trend_link(e: TrendLinkEvent) -> bytes:
+    ret = _TREND_LINK.pack(
+        uuid.UUID(e.uuid).bytes, e.at, e.link_id, e.added, len(e.upstream)
+    )
+    for u in e.upstream:
+        ret += _UPSTREAM.pack(uuid.UUID(u.uuid).bytes, u.at, _CHANNELS[u.channel])
+    return ret
+
+
+def _decode_trend_link(data: bytes) -> TrendLinkEvent:
+    offset = _EVENT_HEADER.size
+    raw_uuid, at, link_id, added, count = _TREND_LINK.unpack_from(data, offset)
+    offset += _TREND_LINK.size
+    upstream: List[UpstreamSource] = []
+    for _ in range(count):
+        up_uuid, up_at, channel = _UPSTREAM.unpack_from(data, offset)
+        offset += _UPSTREAM.size
+        upstream.append(
+            UpstreamSource.construct(
+                uuid=_uuid(up_uuid), at=up_at, channel=_CHANNELS_BY_CODE[channel]
+            )
+        )
+    return TrendLinkEvent.construct(
+        uuid=_uuid(raw_uuid),
+        at=at,
+        link_id=link_id,
+        added=added,
+        upstream=upstream,
+    )
+
+
+# type code, encode, decode
+_Codec = Tuple[int, Callable[[Meta], bytes], Callable[[bytes], Meta]]
+_CODECS: Dict[Type[Meta], _Codec] = {
+    Action: (1, _encode_action, _decode_action),  # type: ignore
+    TrendEvent: (2, _encode_trend, _decode_trend),  # type: ignore
+    TrendLinkEvent: (3, _encode_trend_link, _decode_trend_link),  # type: ignore
+}
+
+
+def encode_event(event: Meta, fmt: EventFormat = EventFormat.json) -> bytes:
+    """
+    The event as fmt, or as json if it has no binary layout or its uuids
+    aren't uuids
+    """
+    codec = _CODECS.get(type(event)) if fmt == EventFormat.binary else None
+    if codec is not None:
+        code, encode, _ = codec
+        try:
+            return _EVENT_HEADER.pack(EVENT_MAGIC, EVENT_VERSION, code) + encode(event)
+        except ValueError:
+            pass
+    return event.json().encode()
+
+
+def decode_event(data: bytes | str, cls: Type[_TEvent]) -> _TEvent:
+    """
+    An event of type cls from either format, straight from the bytes of a
+    redis client without decode_responses
+    """
+    if not isinstance(data, bytes) or not data or data[0] != EVENT_MAGIC:
+        return cls.parse_raw(data)
+    _, version, code = _EVENT_HEADER.unpack_from(data)
+    if version != EVENT_VERSION:
+        raise ValueError(f"unsupported {cls.__name__} version {version}")
+    codec = _CODECS.get(cls)
+    if codec is None or codec[0] != code:
+        raise ValueError(f"event type {code} is not a {cls.__name__}")
+    return codec[2](data)  # type: ignore
@@ -1,18 +1,19 @@
 import logging
+from dataclasses import asdict
 from pathlib import Path
-from uuid import uuid1
 
 from flask import (
     Flask,
+    Response,
     jsonify,
     redirect,
+    request,
     send_from_directory,  # pyright: ignore [reportUnknownVariableType]
 )
 from flask_pydantic import validate
-from pydantic import BaseModel, HttpUrl
 
-from .base62 import base62_encode
-from .store import store
+from .store import store, trending_view
+from .types import ResolveBatchRequest, ShortenBatchRequest, ShortenRequest
 from nifty.common.types import Link
 from nifty.common.helpers import timestamp_ms
 from nifty.common import log
@@ -24,8 +25,9 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__, static_folder=None)
 
 
-class ShortenRequest(BaseModel):
-    long_url: HttpUrl
+@app.before_request
+def start_request():
+    store.start_request()
 
 
 @app.route("/")
@@ -49,49 +51,86 @@ def favicon():
 @app.route("/<path:subpath>")
 def static_files(subpath: Path):
     # Serve any other files from the static directory
-    logger.error(f"sending {subpath} from 'static'")
+    logger.debug("sending %s from 'static'", subpath)
     return send_from_directory("static", subpath)
 
 
 @app.route("/shorten", methods=["POST"])
 @validate()
 def shorten(body: ShortenRequest):
-    # Get the long URL from the request
-    long_url = body.long_url
-
-    # Check if the long URL has already been shortened
-    short_url = store.get_short_url(long_url)
-    if short_url:
-        logger.debug(f"found {short_url}")
+    link, created = store.shorten(body.long_url)
+    if not created:
+        logger.debug("found %s", link.short_url)
         # Return the existing short URL if it has been shortened before
-        return jsonify({"short_url": short_url})
-
-    # Upsert the long url
-    long_url_id = store.upsert_long_url(long_url)
-    short_url = base62_encode(long_url_id)
-    logger.debug(f"generated {short_url}")
-
-    # Save the long URL and short URL in the database
-    link = store.upsert_link(long_url_id, short_url)
-
-    # TODO maybe do this async after returning the response
-    # this is also kinda shady
-    store.redis_client.publish(
-        Channel.action,
-        Action(
-            uuid=str(uuid1()),
-            type=ActionType.create,
-            at=timestamp_ms(),
-            link_id=link.id,
-        ).json(),
+        return jsonify({"short_url": link.short_url})
+
+    logger.debug("generated %s", link.short_url)
+    store.publish(
+        Channel.action, Action.new(ActionType.create, link.id, timestamp_ms())
     )
 
-    return jsonify({"short_url": short_url}), 201
+    return jsonify({"short_url": link.short_url}), 201
+
+
+@app.route("/shorten/batch", methods=["POST"])
+@validate()
+def shorten_batch(body: ShortenBatchRequest):
+    short_urls, created = store.shorten_batch([str(u) for u in body.long_urls])
+    for link in created:
+        store.publish(
+            Channel.action, Action.new(ActionType.create, link.id, timestamp_ms())
+        )
+
+    # same order as the request
+    return jsonify({"short_urls": short_urls}), 201 if created else 200
+
+
+@app.route("/resolve/batch", methods=["POST"])
+@validate()
+def resolve_batch(body: ResolveBatchRequest):
+    links = store.resolve_batch(body.short_urls)
+    if body.emit_views:
+        at = timestamp_ms()
+        for short_url in body.short_urls:
+            if short_url in links:
+                store.publish(
+                    Channel.action, Action.new(ActionType.get, links[short_url].id, at)
+                )
+
+    # unknown short urls are left out
+    return (
+        jsonify({"long_urls": {s: link.long_url for s, link in links.items()}}),
+        200,
+    )
 
 
 @app.route("/nifty/trending", methods={"GET"})
 def trending():
-    return jsonify(store.get_trending().dict()), 200
+    view = store.get_trending_view()
+    headers = {"ETag": f'"{view.etag}"', "Cache-Control": "no-cache"}
+    if trending_view.matches(request.headers.get("If-None-Match"), view.etag):
+        return Response(status=304, headers=headers)
+    return Response(view.body, 200, headers, mimetype="application/json")
+
+
+@app.route("/nifty/stats", methods={"GET"})
+def stats():
+    local_cache_stats = store.local_cache_stats()
+    bloom_stats = store.bloom_stats()
+    bitmap_stats = store.short_url_bitmap_stats()
+    return (
+        jsonify(
+            {
+                "local_cache": asdict(local_cache_stats) if local_cache_stats else None,
+                "hot_links": store.hot_links_size(),
+                "publisher": asdict(store.publisher_stats()),
+                "pools": store.pool_stats(),
+                "long_url_bloom": asdict(bloom_stats) if bloom_stats else None,
+                "short_url_bitmap": asdict(bitmap_stats) if bitmap_stats else None,
+            }
+        ),
+        200,
+    )
 
 
 @app.route("/<short_url>", methods=["GET"])
@@ -101,16 +140,8 @@ def lookup(short_url: str):
 
     # Redirect to the long URL if it exists
     if link:
-        # TODO maybe move publish into store
-        # then we don't have to expose redis client
-        store.redis_client.publish(
-            Channel.action,
-            Action(
-                uuid=str(uuid1()),
-                type=ActionType.get,
-                at=timestamp_ms(),
-                link_id=link.id,
-            ).json(),
+        store.publish(
+            Channel.action, Action.new(ActionType.get, link.id, timestamp_ms())
         )
         return redirect(link.long_url)
     else:
@@ -0,0 +1,105 @@
+import logging
+from contextlib import asynccontextmanager
+from dataclasses import asdict
+from json import JSONDecodeError
+from typing import AsyncGenerator
+
+from pydantic import ValidationError
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import (
+    JSONResponse,
+    PlainTextResponse,
+    RedirectResponse,
+    Response,
+)
+from starlette.routing import Route
+
+from nifty.common import log
+from nifty.common.helpers import timestamp_ms
+from nifty.common.types import Action, ActionType, Channel
+from ..store import trending_view
+from ..store.asyncio import store
+from ..types import ShortenRequest
+
+# ASGI twin of nifty.service.app, run it with
+# uvicorn nifty.service.asyncio.app:app
+
+logger = logging.getLogger(__name__)
+
+
+def _validation_error(errors: object) -> Response:
+    # same shape flask_pydantic uses so clients can't tell the apps apart
+    return JSONResponse({"validation_error": {"body_params": errors}}, 400)
+
+
+async def shorten(request: Request) -> Response:
+    try:
+        body = ShortenRequest.parse_obj(await request.json())
+    except JSONDecodeError:
+        return _validation_error([{"msg": "invalid json body"}])
+    except ValidationError as e:
+        return _validation_error(e.errors())
+
+    link, created = await store.shorten(body.long_url)
+    if not created:
+        logger.debug("found %s", link.short_url)
+        return JSONResponse({"short_url": link.short_url})
+
+    logger.debug("generated %s", link.short_url)
+    await store.publish(
+        Channel.action, Action.new(ActionType.create, link.id, timestamp_ms())
+    )
+
+    return JSONResponse({"short_url": link.short_url}, 201)
+
+
+async def trending(request: Request) -> Response:
+    view = await store.get_trending_view()
+    headers = {"ETag": f'"{view.etag}"', "Cache-Control": "no-cache"}
+    if trending_view.matches(request.headers.get("If-None-Match"), view.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(view.body, headers=headers, media_type="application/json")
+
+
+async def stats(_request: Request) -> Response:
+    local_cache_stats = store.local_cache_stats()
+    return JSONResponse(
+        {
+            "local_cache": asdict(local_cache_stats) if local_cache_stats else None,
+            "publisher": asdict(store.publisher_stats()),
+            "pools": store.pool_stats(),
+        }
+    )
+
+
+async def lookup(request: Request) -> Response:
+    link = await store.get_long_url(request.path_params["short_url"])
+    if link:
+        await store.publish(
+            Channel.action, Action.new(ActionType.get, link.id, timestamp_ms())
+        )
+        return RedirectResponse(link.long_url, 302)
+    else:
+        return PlainTextResponse("Short URL not found", 404)
+
+
+@asynccontextmanager
+async def lifespan(_app: Starlette) -> AsyncGenerator[None, None]:
+    log.log_init()
+    await store.open()
+    try:
+        yield
+    finally:
+        await store.close()
+
+
+app = Starlette(
+    routes=[
+        Route("/shorten", shorten, methods=["POST"]),
+        Route("/nifty/trending", trending, methods=["GET"]),
+        Route("/nifty/stats", stats, methods=["GET"]),
+        Route("/{short_url}", lookup, methods=["GET"]),
+    ],
+    lifespan=lifespan,
+)
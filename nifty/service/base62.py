@@ -1,5 +1,6 @@
 import string
 import sys
+from typing import Optional
 
 # why base62?
 #
@@ -30,6 +31,20 @@ def base62_decode(base62: str) -> int:
     return num
 
 
+def base62_decode_strict(base62: str) -> Optional[int]:
+    """
+    Decode a short code we could have generated, or None if we couldn't have.
+
+    Rejects unknown characters and anything that does not encode back to the
+    same string (e.g. leading zeros), so the id is safe to use as a key.
+    """
+    try:
+        num = base62_decode(base62)
+    except ValueError:
+        return None
+    return num if num > 0 and base62_encode(num) == base62 else None
+
+
 if __name__ == "__main__":
     args = sys.argv[1:]
     print(f"{base62_encode(int(args[0]))}")
@@ -0,0 +1,31 @@
+import gc
+from typing import Any
+
+# gunicorn settings and hooks for the sync app, e.g.
+#   gunicorn -c python:nifty.service.gunicorn_conf nifty.service.app:app
+#
+# the arbiter imports the app once and forks the workers from it, so they
+# share its pages copy-on-write instead of each importing everything.  nothing
+# connects at import, each worker opens its own pools, redis connections and
+# threads after the fork, see store.open
+
+preload_app = True
+
+# no collections while the app is imported, they would free objects between
+# the ones the workers share and leave holes that get written to.  the
+# arbiter does little else so it stays off there
+gc.disable()
+
+
+def pre_fork(server: Any, worker: Any):
+    # everything alive now moves out of the collector's reach, so collections
+    # in the worker don't write to the pages it shares with the arbiter
+    gc.freeze()
+
+
+def post_fork(server: Any, worker: Any):
+    gc.enable()
+    from nifty.service.store import store
+
+    # connected and warm before the worker takes its first request
+    store.open()
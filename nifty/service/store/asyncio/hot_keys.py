@@ -0,0 +1,30 @@
+# fixes stubs like redis that use generics when the code does not
+from __future__ import annotations
+
+from typing import List, Sequence, Tuple
+
+from redis.asyncio.client import Redis
+
+from nifty.common.types import Key
+from ..hot_keys import limit, load_timeout_sec, queue_save, ttl_sec
+
+# asyncio twin of nifty.service.store.hot_keys
+
+__all__ = ["limit", "load", "load_timeout_sec", "save", "ttl_sec"]
+
+
+async def save(
+    redis: Redis[str], counts: Sequence[Tuple[str, int]], keep: int, ttl_sec: int
+):
+    """
+    see nifty.service.store.hot_keys.save
+    """
+    if not counts:
+        return
+    async with redis.pipeline(transaction=False) as pipe:
+        queue_save(pipe, counts, keep, ttl_sec)
+        await pipe.execute()
+
+
+async def load(redis: Redis[str], limit: int) -> List[str]:
+    return await redis.zrange(Key.hot_short_urls, 0, limit - 1, desc=True)
@@ -0,0 +1,598 @@
+# fixes stubs like redis that use generics when the code does not
+from __future__ import annotations
+
+import asyncio
+import logging
+from asyncio import CancelledError
+from contextvars import ContextVar
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    LiteralString,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+from psycopg import AsyncCursor, OperationalError
+from psycopg.rows import BaseRowFactory, class_row
+from psycopg_pool import AsyncConnectionPool
+from redis.asyncio.client import Redis
+from redis.exceptions import RedisError
+
+from nifty.common import bloom, cfg
+from nifty.common.asyncio import id_bitmap, link_cache, publisher, redis_helpers
+from nifty.common.redis_helpers import get_event_format, get_transport
+from nifty.common.helpers import none_throws, timestamp_ms
+from nifty.common.publisher import PublisherStats
+from nifty.common.types import Channel, Key, Link, Meta, RedisType, Transport
+from nifty.common.types import encode_event
+from .. import hot_links, local_cache, postgres, queries, shards
+from ..local_cache import CacheStats
+from . import hot_keys, trending_view
+from .trending_view import TrendingView
+from ...base62 import base62_decode_strict, base62_encode
+from ..types import Id, LookupMode, Trending, TrendingItem, Url
+
+# asyncio twin of nifty.service.store.store, for the ASGI app.
+# call open() before using it and close() when done.
+# every request runs in its own task with its own copy of _wrote, so unlike
+# the sync store there is no start_request()
+
+_logger = logging.getLogger(__name__)
+T = TypeVar("T")
+R = TypeVar("R")
+_lookup_mode = LookupMode(cfg.g_fb("nifty", "lookup_mode", LookupMode.join.value))
+_forward_ttl_sec = cfg.gint_fb("nifty", "forward_cache_ttl_sec", 0)
+_local_cache = local_cache.link_cache_from_cfg()
+_bloom_spec = bloom.spec_from_cfg()
+_missing_ttl_sec = cfg.gint_fb("nifty", "missing_cache_ttl_sec", 0)
+_hot_keys = hot_keys.limit() if _local_cache is not None else 0
+_hot_links = hot_links.from_cfg()
+_trending_view = trending_view.enabled()
+_event_format = get_event_format()
+
+_pool: Optional[AsyncConnectionPool] = None
+_replica_pool: Optional[AsyncConnectionPool] = None
+_wrote: ContextVar[bool] = ContextVar("nifty_store_wrote", default=False)
+_redis_client: Optional[Redis[str]] = None
+_cache: Optional[link_cache.LinkCache] = None
+# events go out from a background task so requests never wait on redis
+_publisher: Optional[publisher.AsyncBatchPublisher] = None
+_short_url_bitmap: Optional[id_bitmap.IdBitmap] = None
+_listener: Optional[asyncio.Task[None]] = None
+_pool_stats_logger: Optional[asyncio.Task[None]] = None
+_trending_refresher: Optional[asyncio.Task[None]] = None
+
+
+def pool() -> AsyncConnectionPool:
+    return none_throws(_pool, "store pool is not set - did you call open()?")
+
+
+def redis_client() -> Redis[str]:
+    return none_throws(_redis_client, "store redis is not set - did you call open()?")
+
+
+def cache() -> link_cache.LinkCache:
+    return none_throws(_cache, "store cache is not set - did you call open()?")
+
+
+def event_publisher() -> publisher.AsyncBatchPublisher:
+    return none_throws(_publisher, "store publisher is not set - did you call open()?")
+
+
+async def _listen_invalidations(caches: List[local_cache.Invalidatable]):
+    while True:
+        try:
+            async with (
+                redis_client().pubsub(  # pyright: ignore [reportUnknownMemberType]
+                    ignore_subscribe_messages=True
+                ) as pubsub
+            ):
+                await pubsub.subscribe(  # pyright: ignore [reportUnknownMemberType]
+                    Channel.link_invalidate
+                )
+                while True:
+                    msg = await pubsub.get_message(  # pyright: ignore [reportUnknownMemberType]
+                        ignore_subscribe_messages=True, timeout=1.0
+                    )
+                    if msg:
+                        for c in caches:
+                            local_cache.apply_invalidation(c, msg["data"])
+        except CancelledError:
+            raise
+        except Exception as e:
+            # we may have missed invalidations while disconnected, so start over
+            _logger.warning(f"invalidation listener error, clearing local cache: {e}")
+            for c in caches:
+                c.clear()
+            await asyncio.sleep(1)
+
+
+async def _log_pool_stats(interval_sec: float):
+    while True:
+        await asyncio.sleep(interval_sec)
+        for stats in pool_stats().values():
+            postgres.log_stats(stats)
+
+
+async def _refresh_trending_view(interval_sec: float):
+    listen = get_transport() == Transport.pubsub
+    # Channel.trend events may be binary
+    events = redis_helpers.get_redis(RedisType.STD, decode_responses=False)
+    try:
+        while True:
+            try:
+                async with (
+                    events.pubsub(  # pyright: ignore [reportUnknownMemberType]
+                        ignore_subscribe_messages=True
+                    ) as pubsub
+                ):
+                    if listen:
+                        await pubsub.subscribe(  # pyright: ignore [reportUnknownMemberType]
+                            Channel.trend
+                        )
+                    while True:
+                        changed = False
+                        if listen:
+                            msg = await pubsub.get_message(  # pyright: ignore [reportUnknownMemberType]
+                                ignore_subscribe_messages=True, timeout=interval_sec
+                            )
+                            changed = msg is not None
+                        else:
+                            await asyncio.sleep(interval_sec)
+                        await refresh_trending_view(changed)
+            except CancelledError:
+                raise
+            except Exception as e:
+                _logger.warning(f"unable to refresh trending view: {e}")
+                await asyncio.sleep(1)
+    finally:
+        await events.close()
+
+
+async def open():
+    global _pool, _replica_pool, _redis_client, _cache, _listener, _pool_stats_logger
+    global _trending_refresher, _short_url_bitmap, _publisher
+    if shards.layout_from_cfg().sharded:
+        raise Exception("sharded stores are only supported by the sync store")
+    _pool = AsyncConnectionPool(
+        conninfo=postgres.conninfo(),
+        open=False,
+        name="primary",
+        **postgres.pool_kwargs(),
+    )
+    await _pool.open()
+    replica_conninfo = postgres.replica_conninfo()
+    if replica_conninfo:
+        _replica_pool = AsyncConnectionPool(
+            conninfo=replica_conninfo,
+            open=False,
+            name="replica",
+            **postgres.pool_kwargs(),
+        )
+        await _replica_pool.open()
+    _redis_client = redis_helpers.get_redis(RedisType.STD)
+    _cache = link_cache.from_cfg()
+    _publisher = publisher.from_cfg(_redis_client)
+    _publisher.start()
+    _short_url_bitmap = id_bitmap.short_url_bitmap_from_cfg(_redis_client)
+    caches: List[local_cache.Invalidatable] = [
+        c for c in [_local_cache, _hot_links] if c is not None
+    ]
+    if caches:
+        _listener = asyncio.create_task(_listen_invalidations(caches))
+    if postgres.stats_log_interval_sec() > 0:
+        _pool_stats_logger = asyncio.create_task(
+            _log_pool_stats(postgres.stats_log_interval_sec())
+        )
+    if _trending_view:
+        _trending_refresher = asyncio.create_task(
+            _refresh_trending_view(trending_view.refresh_interval_sec())
+        )
+    await warm_local_cache()
+
+
+async def close():
+    global _pool, _replica_pool, _redis_client, _cache, _listener, _pool_stats_logger
+    global _trending_refresher, _short_url_bitmap, _publisher
+    if _redis_client is not None:
+        await save_hot_keys()
+    if _publisher is not None:
+        await _publisher.close()
+    _publisher = None
+    for task in [_listener, _pool_stats_logger, _trending_refresher]:
+        if task is not None:
+            task.cancel()
+    _listener = None
+    _pool_stats_logger = None
+    _trending_refresher = None
+    for p in [_pool, _replica_pool]:
+        if p is not None:
+            await p.close()
+    _pool = None
+    _replica_pool = None
+    if _redis_client is not None:
+        await _redis_client.close()
+    if _cache is not None:
+        await _cache.close()
+    _redis_client = None
+    _cache = None
+    _short_url_bitmap = None
+
+
+async def save_hot_keys():
+    """
+    see nifty.service.store.store.save_hot_keys
+    """
+    if _local_cache is None or _hot_keys <= 0:
+        return
+    try:
+        await hot_keys.save(
+            redis_client(), _local_cache.hot(_hot_keys), _hot_keys, hot_keys.ttl_sec()
+        )
+    except RedisError as e:
+        _logger.warning(f"unable to save hot keys: {e}")
+
+
+async def warm_local_cache() -> int:
+    """
+    see nifty.service.store.store.warm_local_cache
+    """
+    if _local_cache is None or _hot_keys <= 0:
+        return 0
+    deadline = asyncio.get_running_loop().time() + hot_keys.load_timeout_sec()
+    try:
+        short_urls = await hot_keys.load(redis_client(), _hot_keys)
+    except RedisError as e:
+        _logger.warning(f"unable to load hot keys: {e}")
+        return 0
+
+    loaded = 0
+    try:
+        # a few at a time, each is its own lookup
+        for i in range(0, len(short_urls), 50):
+            if asyncio.get_running_loop().time() > deadline:
+                _logger.warning(f"warm up timed out after {loaded} links")
+                break
+            links = await asyncio.gather(
+                *[get_long_url(short_url) for short_url in short_urls[i : i + 50]]
+            )
+            loaded += sum(1 for link in links if link is not None)
+    except (OperationalError, RedisError) as e:
+        _logger.warning(f"warm up stopped after {loaded} links: {e}")
+    _logger.info("warmed local cache with %s links", loaded)
+    return loaded
+
+
+def pool_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Stats of every postgres pool, by pool name
+    """
+    return {p.name: p.get_stats() for p in [pool(), _replica_pool] if p is not None}
+
+
+def local_cache_stats() -> Optional[CacheStats]:
+    return _local_cache.stats() if _local_cache is not None else None
+
+
+async def invalidate_link(short_url: str):
+    """
+    Evict a link from the local cache of every service process
+    """
+    await redis_client().publish(Channel.link_invalidate, short_url)
+
+
+def publisher_stats() -> PublisherStats:
+    return event_publisher().stats()
+
+
+async def publish(channel: Channel, event: Meta) -> bool:
+    """
+    Queue an event for publishing, returns False if it was dropped
+    """
+    return await event_publisher().publish(channel, encode_event(event, _event_format))
+
+
+async def _execute_on(
+    p: AsyncConnectionPool,
+    sql: LiteralString,
+    args: Tuple[Any, ...],
+    row_factory: BaseRowFactory[T],
+    processor: Callable[[AsyncCursor[T]], Awaitable[R]],
+) -> R:
+    async with p.connection() as conn:
+        async with conn.cursor(row_factory=row_factory) as cur:
+            await cur.execute(sql, args)
+            return await processor(cur)
+
+
+async def _execute(
+    sql: LiteralString,
+    args: Tuple[Any, ...],
+    row_factory: BaseRowFactory[T],
+    processor: Callable[[AsyncCursor[T]], Awaitable[R]],
+    read_only: bool = False,
+) -> R:
+    if _logger.isEnabledFor(logging.DEBUG):
+        _logger.debug("%s", args)
+    if not read_only:
+        _wrote.set(True)
+    elif _replica_pool is not None and not _wrote.get():
+        try:
+            return await _execute_on(_replica_pool, sql, args, row_factory, processor)
+        except OperationalError as e:
+            _logger.warning(f"replica read failed, using the primary: {e}")
+    return await _execute_on(pool(), sql, args, row_factory, processor)
+
+
+async def _ex_one(
+    sql: LiteralString,
+    args: Tuple[Any, ...],
+    row_factory: BaseRowFactory[T],
+    read_only: bool = False,
+) -> Optional[T]:
+    return await _execute(sql, args, row_factory, lambda cur: cur.fetchone(), read_only)
+
+
+async def _ex_all(
+    sql: LiteralString,
+    args: Tuple[Any, ...],
+    row_factory: BaseRowFactory[T],
+    read_only: bool = False,
+) -> List[T]:
+    return await _execute(sql, args, row_factory, lambda cur: cur.fetchall(), read_only)
+
+
+async def get_short_url(long_url: str) -> str | None:
+    ret = await _ex_one(
+        queries.short_url_sql, (long_url, long_url), class_row(Url), read_only=True
+    )
+    return ret.url if ret else None
+
+
+async def upsert_long_url(long_url: str) -> int:
+    ret = await _ex_one(queries.upsert_long_url_sql, (long_url,) * 3, class_row(Id))
+    if not ret or not ret.id:
+        raise Exception("Unable to get or create long url from ${long_url}")
+
+    return ret.id
+
+
+async def _get_link_from_cache(short_url: str) -> Optional[Link]:
+    link = await cache().get_link(short_url)
+    if _logger.isEnabledFor(logging.DEBUG):
+        if link is None:
+            _logger.debug("cache MISS - short_url:%s", short_url)
+        else:
+            _logger.debug("cache HIT  - short_url:%s , link_id:%s", short_url, link.id)
+    return link
+
+
+async def upsert_link(long_url_id: int, short_url: str) -> Link:
+    link = await _get_link_from_cache(short_url)
+    if link is not None:
+        return link
+
+    ret = await _ex_one(
+        queries.link_sql, queries.link_params(long_url_id, short_url), postgres.link_row
+    )
+    if not ret:
+        raise Exception("Unable to get or create long url from ${long_url}")
+
+    # update the cache, otherwise it's memoized to None
+    await cache().put_link(ret, _forward_ttl_sec)
+    await invalidate_link(ret.short_url)
+    return ret
+
+
+async def _might_be_known(long_url: str) -> bool:
+    if _bloom_spec is None:
+        return True
+    return bool(
+        await redis_helpers.run_script(
+            redis_client(),
+            bloom.BLOOM_CHECK,
+            [_bloom_spec.key],
+            _bloom_spec.positions(long_url),
+        )
+    )
+
+
+async def _add_known(long_url: str):
+    if _bloom_spec is not None:
+        await redis_helpers.run_script(
+            redis_client(),
+            bloom.BLOOM_ADD,
+            [_bloom_spec.key, _bloom_spec.building_key],
+            _bloom_spec.positions(long_url),
+        )
+
+
+async def _mark_exists(link: Link):
+    id = base62_decode_strict(link.short_url)
+    if _short_url_bitmap is not None and id is not None:
+        await _short_url_bitmap.add_many([id])
+
+
+async def _known_missing(short_url: str) -> bool:
+    id = base62_decode_strict(short_url)
+    if _short_url_bitmap is not None and id is not None:
+        try:
+            if not await _short_url_bitmap.might_contain(id):
+                return True
+        except RedisError as e:
+            _logger.warning(f"short url bitmap check failed: {e}")
+    return _missing_ttl_sec > 0 and await cache().is_missing(short_url)
+
+
+async def _on_created(link: Link):
+    await _mark_exists(link)
+    await cache().put_link(link, _forward_ttl_sec)
+    await invalidate_link(link.short_url)
+    await _add_known(link.long_url)
+
+
+async def shorten(long_url: str) -> Tuple[Link, bool]:
+    """
+    Get or create the link for long_url, normally in one statement
+
+    :return: the link and whether this call created it
+    """
+    if _forward_ttl_sec > 0:
+        link = await cache().get_link_by_long(long_url)
+        if link is not None:
+            return link, False
+
+    if not await _might_be_known(long_url):
+        row = await _ex_one(queries.shorten_new_sql, (long_url,), postgres.shorten_row)
+        if row is not None:
+            link = row.link
+            await _on_created(link)
+            return link, True
+
+    for _ in range(2):
+        # a lost insert race shows up as no row, and the retry sees the winner
+        row = await _ex_one(queries.shorten_sql, (long_url,) * 3, postgres.shorten_row)
+        if row is not None:
+            link = row.link
+            if row.created:
+                await _on_created(link)
+            else:
+                await cache().put_link(link, _forward_ttl_sec)
+            return link, row.created
+
+    # the long url exists without a link, an earlier shorten died half way
+    long_url_id = await upsert_long_url(long_url)
+    link = await upsert_link(long_url_id, base62_encode(long_url_id))
+    await _mark_exists(link)
+    await _add_known(long_url)
+    return link, True
+
+
+async def get_long_url(short_url: str) -> Link | None:
+    if _local_cache is not None:
+        link = _local_cache.get(short_url)
+        if link is not None:
+            return link
+
+    if _hot_links is not None:
+        link = _hot_links.get(short_url)
+        if link is not None:
+            return link
+
+    link = await _get_link_from_cache(short_url)
+    if link is None:
+        if await _known_missing(short_url):
+            return None
+        query = queries.long_url_query(_lookup_mode, short_url)
+        link = (
+            await _ex_one(*query, postgres.link_row, read_only=True) if query else None
+        )
+        if (
+            query is not None
+            and link is None
+            and _missing_ttl_sec > 0
+            and _replica_pool is not None
+            and not _wrote.get()
+        ):
+            # see nifty.service.store.store.get_long_url
+            link = await _execute_on(
+                pool(), *query, postgres.link_row, lambda cur: cur.fetchone()
+            )
+        if link is None:
+            if _missing_ttl_sec > 0:
+                await cache().put_missing(short_url, _missing_ttl_sec)
+            return None
+        await cache().put_link(link, _forward_ttl_sec)
+
+    if _local_cache is not None:
+        _local_cache.put(short_url, link)
+    return link
+
+
+async def get_links_by_id(ids: List[int]) -> List[Link]:
+    """
+    see nifty.service.store.store.get_links_by_id
+    """
+    by_id: Dict[int, Link] = {
+        link.id: link for link in await cache().get_links_by_id(ids) if link is not None
+    }
+    missing = [id for id in ids if id not in by_id]
+    if missing:
+        loaded: List[Link] = await _ex_all(
+            queries.links_by_ids_sql, (missing,), postgres.link_row, read_only=True
+        )
+        await asyncio.gather(
+            *[cache().put_link(link, _forward_ttl_sec) for link in loaded]
+        )
+        by_id.update({link.id: link for link in loaded})
+    return [by_id[id] for id in ids if id in by_id]
+
+
+async def get_trending() -> Trending:
+    tr_sz = await redis_helpers.trending_size(redis_client(), throws=False)
+    if tr_sz is None:
+        return Trending(list=[])
+
+    results: List[Tuple[int, int]] = [
+        (int(key), int(score))
+        for key, score in await redis_client().zrange(
+            Key.trending, 0, tr_sz, desc=True, withscores=True
+        )
+    ]
+    _logger.debug(results)
+    by_id = {link.id: link for link in await get_links_by_id([t[0] for t in results])}
+    # in rank order, leaving out any link that no longer exists
+    return Trending(
+        list=[
+            TrendingItem(
+                id=id,
+                created_at=by_id[id].created_at_ms(),
+                long_url=by_id[id].long_url,
+                short_url=by_id[id].short_url,
+                views=views,
+            )
+            for id, views in results
+            if id in by_id
+        ]
+    )
+
+
+async def refresh_trending_view(changed: bool) -> bool:
+    """
+    see nifty.service.store.store.refresh_trending_view
+    """
+    if not changed:
+        view = await trending_view.load(redis_client())
+        interval_ms = trending_view.refresh_interval_sec() * 1000
+        if view is not None and timestamp_ms() - view.at < interval_ms:
+            return False
+    if not await trending_view.claim_refresh(redis_client(), trending_view.claim_ms()):
+        return False
+    view = trending_view.render(await get_trending(), timestamp_ms())
+    await trending_view.save(redis_client(), view, trending_view.ttl_sec())
+    return True
+
+
+async def get_trending_view() -> TrendingView:
+    """
+    see nifty.service.store.store.get_trending_view
+    """
+    if not _trending_view:
+        return trending_view.render(await get_trending(), timestamp_ms())
+    try:
+        view = await trending_view.load(redis_client())
+        if view is not None:
+            return view
+    except RedisError as e:
+        _logger.warning(f"unable to load trending view: {e}")
+    view = trending_view.render(await get_trending(), timestamp_ms())
+    try:
+        await trending_view.save(redis_client(), view, trending_view.ttl_sec())
+    except RedisError as e:
+        _logger.warning(f"unable to save trending view: {e}")
+    return view
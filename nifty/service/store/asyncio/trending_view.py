@@ -0,0 +1,51 @@
+# fixes stubs like redis that use generics when the code does not
+from __future__ import annotations
+
+from typing import Optional
+
+from redis.asyncio.client import Redis
+
+from nifty.common.types import Key
+from ..trending_view import (
+    FIELDS,
+    REFRESH_KEY,
+    TrendingView,
+    claim_ms,
+    enabled,
+    parse,
+    queue_save,
+    refresh_interval_sec,
+    render,
+    ttl_sec,
+)
+
+# asyncio twin of nifty.service.store.trending_view
+
+__all__ = [
+    "TrendingView",
+    "claim_ms",
+    "claim_refresh",
+    "enabled",
+    "load",
+    "refresh_interval_sec",
+    "render",
+    "save",
+    "ttl_sec",
+]
+
+
+async def load(redis: Redis[str]) -> Optional[TrendingView]:
+    return parse(await redis.hmget(Key.trending_view, FIELDS))
+
+
+async def save(redis: Redis[str], view: TrendingView, ttl_sec: int):
+    async with redis.pipeline() as pipe:
+        queue_save(pipe, view, ttl_sec)
+        await pipe.execute()
+
+
+async def claim_refresh(redis: Redis[str], hold_ms: int) -> bool:
+    """
+    see nifty.service.store.trending_view.claim_refresh
+    """
+    return bool(await redis.set(REFRESH_KEY, 1, nx=True, px=hold_ms))
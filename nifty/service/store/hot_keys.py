@@ -0,0 +1,66 @@
+# fixes stubs like redis that use generics when the code does not
+from __future__ import annotations
+
+from typing import List, Sequence, Tuple
+
+from redis.asyncio.client import Pipeline as AsyncPipeline
+from redis.client import Pipeline, Redis
+
+from nifty.common import cfg
+from nifty.common.types import Key
+
+# service processes save the short urls hottest in their local cache when they
+# stop and warm up from them when they start, see store.save_hot_keys.
+# nifty.util.cache.warm can also warm redis-cache from them.  the asyncio
+# store's twin is nifty.service.store.asyncio.hot_keys
+
+WARM_CFG_KEY = "warm"
+
+
+def limit() -> int:
+    """
+    How many hot short urls each process saves and loads, 0 is off
+    """
+    return cfg.gint_fb(WARM_CFG_KEY, "hot_keys", 0)
+
+
+def load_timeout_sec() -> float:
+    return cfg.gfloat_fb(WARM_CFG_KEY, "load_timeout_sec", 5)
+
+
+def ttl_sec() -> int:
+    # a list nobody has refreshed in this long is not worth warming from
+    return cfg.gint_fb(WARM_CFG_KEY, "ttl_sec", 86400)
+
+
+def save(redis: Redis[str], counts: Sequence[Tuple[str, int]], keep: int, ttl_sec: int):
+    """
+    Merge one process' hot short urls into the shared list, keeping the
+    higher count of each and the keep hottest overall
+    """
+    if not counts:
+        return
+    with redis.pipeline(transaction=False) as pipe:
+        queue_save(pipe, counts, keep, ttl_sec)
+        pipe.execute()
+
+
+def queue_save(
+    pipe: Pipeline[str] | AsyncPipeline[str],
+    counts: Sequence[Tuple[str, int]],
+    keep: int,
+    ttl_sec: int,
+):
+    """
+    Queue save's commands on pipe, which the caller executes
+    """
+    pipe.zadd(Key.hot_short_urls, dict(counts), gt=True)
+    pipe.zremrangebyrank(Key.hot_short_urls, 0, -(keep + 1))
+    pipe.expire(Key.hot_short_urls, ttl_sec)
+
+
+def load(redis: Redis[str], limit: int) -> List[str]:
+    """
+    The limit hottest short urls, hottest first
+    """
+    return redis.zrange(Key.hot_short_urls, 0, limit - 1, desc=True)
@@ -0,0 +1,233 @@
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from nifty.common import cfg
+from nifty.common.types import Link
+
+# a read-only file of the hottest links, built by nifty.util.cache.hot_links
+# and mmapped by every service process on the host, so they share one copy
+# in the page cache instead of each warming its own.
+#
+# layout, all little endian:
+#   header  magic, count, built_at_ms (when the builder started reading)
+#   index   count record offsets, records sorted by short_url
+#   records id, created_at_ms, long_url_id, short_url_id, short_url length,
+#           long_url length, short_url, long_url
+
+_logger = logging.getLogger(__name__)
+
+HOT_LINKS_CFG_KEY = "hot-links"
+
+_MAGIC = b"NHL1"
+_HEADER = struct.Struct("<4sIQ")
+_OFFSET = struct.Struct("<Q")
+_RECORD = struct.Struct("<QQQQHI")
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def write(path: str, links: Iterable[Link], built_at_ms: Optional[int] = None) -> int:
+    """
+    Write links to path atomically, readers see the old file or the new one
+
+    :param built_at_ms: when the links were read, invalidations after it still
+        apply to this file
+    :return: how many links were written
+    """
+    by_short = {link.short_url.encode(): link for link in links}
+    keys = sorted(by_short)
+    records: List[bytes] = []
+    for key in keys:
+        link = by_short[key]
+        long_url = link.long_url.encode()
+        records.append(
+            _RECORD.pack(
+                link.id,
+                link.created_at_ms(),
+                link.long_url_id,
+                link.short_url_id,
+                len(key),
+                len(long_url),
+            )
+            + key
+            + long_url
+        )
+
+    offset = _HEADER.size + _OFFSET.size * len(records)
+    index = bytearray()
+    for record in records:
+        index += _OFFSET.pack(offset)
+        offset += len(record)
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, len(records), built_at_ms or _now_ms()))
+        f.write(index)
+        for record in records:
+            f.write(record)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return len(records)
+
+
+class _Mapped:
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            self.identity = (st.st_ino, st.st_mtime_ns)
+            self.buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self.built_at_ms = _HEADER.unpack_from(self.buf, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"{path} is not a hot links file")
+
+    def __record(self, i: int) -> Tuple[int, Tuple[int, ...]]:
+        (offset,) = _OFFSET.unpack_from(self.buf, _HEADER.size + _OFFSET.size * i)
+        return offset, _RECORD.unpack_from(self.buf, offset)
+
+    def __short_url(self, offset: int, fields: Tuple[int, ...]) -> bytes:
+        start = offset + _RECORD.size
+        return self.buf[start : start + fields[4]]
+
+    def get(self, short_url: bytes) -> Optional[Link]:
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset, fields = self.__record(mid)
+            key = self.__short_url(offset, fields)
+            if key < short_url:
+                lo = mid + 1
+            elif key > short_url:
+                hi = mid
+            else:
+                (
+                    id,
+                    created_at_ms,
+                    long_url_id,
+                    short_url_id,
+                    short_len,
+                    long_len,
+                ) = fields
+                start = offset + _RECORD.size + short_len
+                return Link(
+                    id=id,
+                    created_at=datetime.fromtimestamp(
+                        created_at_ms / 1000, tz=timezone.utc
+                    ),
+                    long_url_id=long_url_id,
+                    short_url_id=short_url_id,
+                    long_url=self.buf[start : start + long_len].decode(),
+                    short_url=short_url.decode(),
+                )
+        return None
+
+
+class HotLinks:
+    """
+    Lookups in the hot links file at path, which is reopened when the builder
+    replaces it.  Until it exists, every lookup misses.
+
+    The file can't be edited, so invalidated short urls are skipped until a
+    file built after the invalidation, and invalidating everything skips the
+    whole file.  So do invalidations while no file is mapped, or once
+    max_skipped short urls are being skipped, so a stopped builder can't
+    make the skip list grow forever.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        check_interval_sec: float = 5,
+        clock: Callable[[], float] = time.monotonic,
+        wall_clock_ms: Callable[[], int] = _now_ms,
+        max_skipped: int = 10000,
+    ):
+        self.__path = path
+        self.__check_interval_sec = check_interval_sec
+        self.__clock = clock
+        self.__wall_clock_ms = wall_clock_ms
+        self.__max_skipped = max_skipped
+        self.__lock = threading.Lock()
+        self.__mapped: Optional[_Mapped] = None
+        self.__next_check = 0.0
+        # when each short url, or everything, was last invalidated
+        self.__skipped: Dict[str, int] = {}
+        self.__skip_all = 0
+
+    def __current(self) -> Optional[_Mapped]:
+        now = self.__clock()
+        if now < self.__next_check:
+            return self.__mapped
+        with self.__lock:
+            if now < self.__next_check:
+                return self.__mapped
+            self.__next_check = now + self.__check_interval_sec
+            try:
+                st = os.stat(self.__path)
+            except FileNotFoundError:
+                self.__mapped = None
+                return None
+            old = self.__mapped
+            if old is None or old.identity != (st.st_ino, st.st_mtime_ns):
+                try:
+                    # the old map closes once no lookup is using it
+                    mapped = _Mapped(self.__path)
+                    self.__skipped = {
+                        k: at
+                        for k, at in self.__skipped.items()
+                        if at >= mapped.built_at_ms
+                    }
+                    self.__mapped = mapped
+                except (OSError, ValueError) as e:
+                    _logger.warning(f"unable to map {self.__path}: {e}")
+            return self.__mapped
+
+    def get(self, short_url: str) -> Optional[Link]:
+        mapped = self.__current()
+        if (
+            mapped is None
+            or self.__skip_all >= mapped.built_at_ms
+            or short_url in self.__skipped
+        ):
+            return None
+        return mapped.get(short_url.encode())
+
+    def invalidate(self, short_url: str):
+        mapped = self.__current()
+        with self.__lock:
+            if mapped is None or len(self.__skipped) >= self.__max_skipped:
+                self.__skip_all = self.__wall_clock_ms()
+                # covered by skip_all, which is later than all of them
+                self.__skipped.clear()
+            else:
+                self.__skipped[short_url] = self.__wall_clock_ms()
+
+    def clear(self):
+        with self.__lock:
+            self.__skip_all = self.__wall_clock_ms()
+            self.__skipped.clear()
+
+    def size(self) -> int:
+        mapped = self.__current()
+        return mapped.count if mapped is not None else 0
+
+
+def path() -> str:
+    return cfg.g_fb(HOT_LINKS_CFG_KEY, "path", "/dev/shm/nifty-hot-links")
+
+
+def from_cfg() -> Optional[HotLinks]:
+    """
+    The host's shared hot links, or None if disabled
+    """
+    if not cfg.gbool_fb(HOT_LINKS_CFG_KEY, "enabled", False):
+        return None
+    return HotLinks(path(), cfg.gfloat_fb(HOT_LINKS_CFG_KEY, "check_interval_sec", 5))
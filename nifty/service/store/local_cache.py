@@ -0,0 +1,209 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Generic, Hashable, List, Optional, Protocol, Tuple, TypeVar
+
+from nifty.common import cfg
+from nifty.common.types import Link
+
+_K = TypeVar("_K", bound=Hashable)
+_V = TypeVar("_V")
+
+# counters are 4 bits wide, like the original TinyLFU paper
+_MAX_COUNT = 15
+_DEPTH = 4
+# odd multipliers, one per sketch row, see _FrequencySketch.__indexes
+_SEEDS = (
+    0x9E3779B97F4A7C15,
+    0xC2B2AE3D27D4EB4F,
+    0x165667B19E3779F9,
+    0xD6E8FEB86659FD93,
+)
+_MASK_64 = (1 << 64) - 1
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    rejections: int = 0
+    expirations: int = 0
+    invalidations: int = 0
+    size: int = 0
+
+
+class _FrequencySketch:
+    """
+    Count-min sketch with periodic aging, used to estimate how often a key
+    has been requested recently.  A small doorkeeper set absorbs one-hit
+    wonders so they never touch the sketch.
+    """
+
+    def __init__(self, capacity: int):
+        width = 1
+        while width < max(capacity, 16):
+            width <<= 1
+        # each row keeps the top bits of the hash times its seed
+        self.__shift = 64 - (width.bit_length() - 1)
+        self.__table = [bytearray(width) for _ in range(_DEPTH)]
+        self.__doorkeeper: set[int] = set()
+        self.__sample_size = 10 * max(capacity, 16)
+        self.__additions = 0
+
+    def __indexes(self, h: int) -> Tuple[int, ...]:
+        # multiply-shift hashing with a multiplier per row, so two keys that
+        # share a slot in one row rarely share it in every row.  deriving the
+        # rows from the low bits alone made that 1 in 128 at the smallest width
+        return tuple(((h * seed) & _MASK_64) >> self.__shift for seed in _SEEDS)
+
+    def increment(self, key: Hashable):
+        h = hash(key)
+        if h not in self.__doorkeeper:
+            self.__doorkeeper.add(h)
+        else:
+            for row, i in zip(self.__table, self.__indexes(h)):
+                if row[i] < _MAX_COUNT:
+                    row[i] += 1
+
+        self.__additions += 1
+        if self.__additions >= self.__sample_size:
+            self.__age()
+
+    def frequency(self, key: Hashable) -> int:
+        h = hash(key)
+        count = min(row[i] for row, i in zip(self.__table, self.__indexes(h)))
+        return count + 1 if h in self.__doorkeeper else count
+
+    def __age(self):
+        # halve everything so old popularity fades out
+        for row in self.__table:
+            for i in range(len(row)):
+                row[i] >>= 1
+        self.__doorkeeper.clear()
+        self.__additions //= 2
+
+
+class LocalCache(Generic[_K, _V]):
+    """
+    Bounded, thread safe, in-process cache with TinyLFU admission and a TTL.
+
+    When the cache is full, a new entry only displaces the least recently used
+    entry if the sketch says it is requested more often, so a burst of cold keys
+    can't flush the hot set.
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl_sec: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if max_size < 1:
+            raise ValueError("max_size must be >= 1")
+        if ttl_sec <= 0:
+            raise ValueError("ttl_sec must be > 0")
+
+        self.__max_size = max_size
+        self.__ttl_sec = ttl_sec
+        self.__clock = clock
+        self.__lock = threading.Lock()
+        self.__entries: OrderedDict[_K, Tuple[_V, float]] = OrderedDict()
+        self.__sketch = _FrequencySketch(max_size)
+        self.__stats = CacheStats()
+
+    def get(self, key: _K) -> Optional[_V]:
+        with self.__lock:
+            self.__sketch.increment(key)
+            entry = self.__entries.get(key)
+            if entry is None:
+                self.__stats.misses += 1
+                return None
+
+            value, expires_at = entry
+            if expires_at <= self.__clock():
+                del self.__entries[key]
+                self.__stats.expirations += 1
+                self.__stats.misses += 1
+                return None
+
+            self.__entries.move_to_end(key)
+            self.__stats.hits += 1
+            return value
+
+    def put(self, key: _K, value: _V):
+        with self.__lock:
+            expires_at = self.__clock() + self.__ttl_sec
+            if key in self.__entries:
+                self.__entries[key] = (value, expires_at)
+                self.__entries.move_to_end(key)
+                return
+
+            if len(self.__entries) >= self.__max_size:
+                victim = next(iter(self.__entries))
+                if self.__sketch.frequency(key) <= self.__sketch.frequency(victim):
+                    self.__stats.rejections += 1
+                    return
+                del self.__entries[victim]
+                self.__stats.evictions += 1
+
+            self.__entries[key] = (value, expires_at)
+
+    def invalidate(self, key: _K):
+        with self.__lock:
+            if self.__entries.pop(key, None) is not None:
+                self.__stats.invalidations += 1
+
+    def clear(self):
+        with self.__lock:
+            self.__stats.invalidations += len(self.__entries)
+            self.__entries.clear()
+
+    def stats(self) -> CacheStats:
+        with self.__lock:
+            return CacheStats(**{**self.__stats.__dict__, "size": len(self.__entries)})
+
+    def hot(self, limit: int) -> List[Tuple[_K, int]]:
+        """
+        Up to limit cached keys with their estimated request counts, most
+        requested first
+        """
+        with self.__lock:
+            counts = [(k, self.__sketch.frequency(k)) for k in self.__entries]
+        counts.sort(key=lambda kc: kc[1], reverse=True)
+        return counts[:limit]
+
+
+LOCAL_CACHE_CFG_KEY = "local-cache"
+
+# published on Channel.link_invalidate to drop everything
+INVALIDATE_ALL = "*"
+
+
+def link_cache_from_cfg() -> Optional[LocalCache[str, Link]]:
+    """
+    The per process short_url -> Link cache, or None if it is disabled
+    """
+    if not cfg.gbool_fb(LOCAL_CACHE_CFG_KEY, "enabled", False):
+        return None
+    return LocalCache[str, Link](
+        max_size=cfg.gint_fb(LOCAL_CACHE_CFG_KEY, "max_size", 10000),
+        ttl_sec=cfg.gfloat_fb(LOCAL_CACHE_CFG_KEY, "ttl_sec", 60),
+    )
+
+
+class Invalidatable(Protocol):
+    # positional only, so implementations can name the key what they like
+    def invalidate(self, key: str, /):
+        ...
+
+    def clear(self):
+        ...
+
+
+def apply_invalidation(cache: Invalidatable, data: str):
+    if data == INVALIDATE_ALL:
+        cache.clear()
+    else:
+        cache.invalidate(data)
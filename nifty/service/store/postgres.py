@@ -0,0 +1,130 @@
+import logging
+import operator
+from dataclasses import fields
+from typing import Any, Dict, Optional, Sequence
+
+from psycopg.cursor import BaseCursor
+from psycopg.rows import RowMaker, no_result
+
+from nifty.common import cfg
+from nifty.common.types import Link
+from .types import ShortenRow
+
+# postgres pool settings shared by the sync and asyncio stores
+
+POOL_CFG_KEY = "postgres-pool"
+
+_logger = logging.getLogger(__name__)
+
+
+def conninfo(host: Optional[str] = None, port: Optional[int] = None) -> str:
+    """
+    The primary's conninfo, or another server's with the same credentials
+    """
+    return (
+        f"postgresql://{cfg.g('postgres', 'user')}:{cfg.g('postgres', 'pwd')}"
+        f"@{host or cfg.g('postgres', 'host')}{f':{port}' if port else ''}/postgres"
+    )
+
+
+def replica_conninfo(section: str = "postgres") -> Optional[str]:
+    """
+    The conninfo of a section's read replica, or None if it has none
+    """
+    host = cfg.g_opt(section, "replica_host")
+    if not host:
+        return None
+    return conninfo(host, cfg.gint_fb(section, "replica_port", 5432))
+
+
+def pool_kwargs() -> Dict[str, Any]:
+    """
+    ConnectionPool / AsyncConnectionPool arguments from [postgres-pool]
+    """
+    # psycopg prepares a statement server side once it has run this many
+    # times on a connection, < 0 never prepares
+    prepare_threshold = cfg.gint_fb(POOL_CFG_KEY, "prepare_threshold", 5)
+    connect_kwargs: Dict[str, Any] = {
+        "prepare_threshold": prepare_threshold if prepare_threshold >= 0 else None
+    }
+
+    # a session setting sent once when each connection opens.  postgres
+    # still times every statement separately against it, so one slow query
+    # is cancelled without a per statement SET round trip
+    statement_timeout_ms = cfg.gint_fb(POOL_CFG_KEY, "statement_timeout_ms", 0)
+    if statement_timeout_ms > 0:
+        connect_kwargs["options"] = f"-c statement_timeout={statement_timeout_ms}"
+
+    min_size = cfg.gint_fb(POOL_CFG_KEY, "min_size", 4)
+    return {
+        "kwargs": connect_kwargs,
+        "min_size": min_size,
+        "max_size": cfg.gint_fb(POOL_CFG_KEY, "max_size", min_size),
+        # 0 lets any number of requests queue for a connection
+        "max_waiting": cfg.gint_fb(POOL_CFG_KEY, "max_waiting", 0),
+        "timeout": cfg.gfloat_fb(POOL_CFG_KEY, "timeout_sec", 30),
+        "max_idle": cfg.gfloat_fb(POOL_CFG_KEY, "max_idle_sec", 600),
+        "max_lifetime": cfg.gfloat_fb(POOL_CFG_KEY, "max_lifetime_sec", 3600),
+    }
+
+
+def open_timeout_sec() -> float:
+    """
+    How long opening a pool waits for its first connection
+    """
+    return cfg.gfloat_fb(POOL_CFG_KEY, "open_timeout_sec", 10)
+
+
+def stats_log_interval_sec() -> float:
+    """
+    How often to log pool stats, 0 never does
+    """
+    return cfg.gfloat_fb(POOL_CFG_KEY, "stats_log_interval_sec", 0)
+
+
+def log_stats(stats: Dict[str, int]):
+    _logger.info(
+        f"pool {stats.get('pool_name', '')} size:{stats.get('pool_size', 0)}"
+        f" available:{stats.get('pool_available', 0)}"
+        f" waiting:{stats.get('requests_waiting', 0)}"
+        f" requests:{stats.get('requests_num', 0)}"
+        f" queued:{stats.get('requests_queued', 0)}"
+        f" wait_ms:{stats.get('requests_wait_ms', 0)}"
+        f" timeouts:{stats.get('requests_errors', 0)}"
+        f" usage_ms:{stats.get('usage_ms', 0)}"
+    )
+
+
+_LINK_FIELDS = [f.name for f in fields(Link)]
+
+
+def link_row(cursor: BaseCursor[Any, Any]) -> RowMaker[Link]:
+    """
+    Row factory like class_row(Link), but the columns are looked up once per
+    result rather than zipped into a dict for every row
+    """
+    if cursor.description is None:
+        return no_result
+    names = [c.name for c in cursor.description]
+    get = operator.itemgetter(*[names.index(f) for f in _LINK_FIELDS])
+
+    def make(values: Sequence[Any]) -> Link:
+        return Link(*get(values))
+
+    return make
+
+
+def shorten_row(cursor: BaseCursor[Any, Any]) -> RowMaker[ShortenRow]:
+    """
+    Row factory for the shorten statements, their link columns and created
+    """
+    if cursor.description is None:
+        return no_result
+    names = [c.name for c in cursor.description]
+    get = operator.itemgetter(*[names.index(f) for f in _LINK_FIELDS])
+    created = names.index("created")
+
+    def make(values: Sequence[Any]) -> ShortenRow:
+        return ShortenRow(Link(*get(values)), values[created])
+
+    return make
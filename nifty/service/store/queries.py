@@ -0,0 +1,335 @@
+from typing import List, LiteralString, Optional, Tuple
+
+from ..base62 import base62_decode_strict
+from .types import LookupMode
+
+# SQL shared by the sync and asyncio stores
+#
+# long_url is probed by url_digest, a fixed width hash with a small unique
+# index, and the full url is compared only on rows with a matching digest.
+# url_digest is set by a trigger, so inserts never mention it
+
+short_url_sql: LiteralString = """
+SELECT s.url
+FROM link k
+JOIN short_url s ON s.id = k.short_url_id
+JOIN long_url l ON l.id = k.long_url_id
+WHERE l.url_digest = long_url_digest(%s) AND l.url = %s;
+"""
+
+# get or create in one round trip, needs the base62_encode function from
+# db/migrations.  Returns nothing if it lost an insert race or the long_url
+# exists without a link, callers fall back to the step by step path
+shorten_sql: LiteralString = """
+WITH existing AS (
+  SELECT k.id, k.created_at, l.id AS long_url_id, s.id AS short_url_id,
+      l.url AS long_url, s.url AS short_url, false AS created
+  FROM long_url l
+  JOIN link k
+  ON l.url_digest = long_url_digest(%s) AND l.url = %s AND k.long_url_id = l.id
+  JOIN short_url s ON s.id = k.short_url_id
+), new_long AS (
+  INSERT INTO long_url (url)
+  SELECT %s WHERE NOT EXISTS (SELECT 1 FROM existing)
+  ON CONFLICT (url_digest) DO NOTHING
+  RETURNING id, url
+), new_short AS (
+  INSERT INTO short_url (url)
+  SELECT base62_encode(id) FROM new_long
+  ON CONFLICT (url) DO NOTHING
+  RETURNING id, url
+), new_link AS (
+  INSERT INTO link (long_url_id, short_url_id)
+  SELECT l.id, s.id FROM new_long l, new_short s
+  ON CONFLICT (short_url_id) DO NOTHING
+  RETURNING id, created_at, long_url_id, short_url_id
+)
+SELECT * FROM existing
+UNION ALL
+SELECT k.id, k.created_at, k.long_url_id, k.short_url_id,
+    l.url AS long_url, s.url AS short_url, true AS created
+FROM new_link k
+JOIN new_long l ON l.id = k.long_url_id
+JOIN new_short s ON s.id = k.short_url_id;
+"""
+
+# shorten_sql for a long_url known to be new, skips looking for a link
+shorten_new_sql: LiteralString = """
+WITH new_long AS (
+  INSERT INTO long_url (url)
+  VALUES (%s)
+  ON CONFLICT (url_digest) DO NOTHING
+  RETURNING id, url
+), new_short AS (
+  INSERT INTO short_url (url)
+  SELECT base62_encode(id) FROM new_long
+  ON CONFLICT (url) DO NOTHING
+  RETURNING id, url
+), new_link AS (
+  INSERT INTO link (long_url_id, short_url_id)
+  SELECT l.id, s.id FROM new_long l, new_short s
+  ON CONFLICT (short_url_id) DO NOTHING
+  RETURNING id, created_at, long_url_id, short_url_id
+)
+SELECT k.id, k.created_at, k.long_url_id, k.short_url_id,
+    l.url AS long_url, s.url AS short_url, true AS created
+FROM new_link k
+JOIN new_long l ON l.id = k.long_url_id
+JOIN new_short s ON s.id = k.short_url_id;
+"""
+
+upsert_long_url_sql: LiteralString = """
+    WITH new_url AS(
+      INSERT
+        INTO
+          long_url (url)
+        VALUES (%s)
+        ON
+            CONFLICT (url_digest) DO NOTHING 
+        RETURNING id
+    ) 
+    SELECT
+      COALESCE(
+    (SELECT id FROM new_url),
+    (SELECT id FROM long_url
+      WHERE url_digest = long_url_digest(%s) AND url = %s)) AS id;"""
+
+link_sql: LiteralString = """
+WITH upsert_short AS (
+  INSERT
+    INTO
+      short_url (url)
+    VALUES (%s)
+ON
+    CONFLICT (url) DO NOTHING 
+RETURNING id 
+), upsert_link AS (
+INSERT INTO link(long_url_id, short_url_id)
+VALUES (%s, COALESCE((SELECT id FROM upsert_short),(SELECT id 
+    FROM short_url WHERE url = %s)))
+ON CONFLICT (short_url_id)
+DO NOTHING
+RETURNING id, created_at, %s AS long_url_id,
+    short_url_id, %s AS short_url
+)
+SELECT ul.id, ul.created_at, %s AS long_url_id, ul.short_url_id,
+        l.url AS long_url, ul.short_url
+FROM upsert_link ul
+JOIN long_url l
+ON l.id = %s AND l.id = ul.long_url_id;
+    """
+
+long_url_sql: LiteralString = """
+SELECT k.id,
+    k.created_at,
+    l.id as long_url_id, 
+    s.id as short_url_id,
+    l.url as long_url,
+    s.url as short_url
+FROM short_url s
+JOIN link k
+ON s.url = %s AND s.id = k.short_url_id
+JOIN long_url l
+ON l.id = k.long_url_id;
+    """
+
+# short_url is always base62(long_url_id), so a miss can probe long_url by
+# primary key and reach short_url by its primary key too
+long_url_by_id_sql: LiteralString = """
+SELECT k.id,
+    k.created_at,
+    l.id as long_url_id,
+    s.id as short_url_id,
+    l.url as long_url,
+    s.url as short_url
+FROM long_url l
+JOIN link k
+ON l.id = %s AND k.long_url_id = l.id
+JOIN short_url s
+ON s.id = k.short_url_id AND s.url = %s;
+    """
+
+# ids is one array parameter, so the statement text never changes and psycopg
+# can prepare it
+links_by_ids_sql: LiteralString = """
+SELECT k.id, 
+    k.created_at,
+    l.id as long_url_id, 
+    s.id as short_url_id,
+    l.url as long_url,
+    s.url as short_url
+FROM link k
+JOIN short_url s
+ON s.id = k.short_url_id
+JOIN long_url l
+ON l.id = k.long_url_id
+WHERE k.id = ANY(%s)
+"""
+
+
+# sharded stores only, long urls whose home moved to this shard but whose
+# link lives on the shard that created it
+long_url_alias_sql: LiteralString = """
+SELECT short_url AS url
+FROM long_url_alias
+WHERE url_digest = long_url_digest(%s) AND url = %s;
+"""
+
+long_url_aliases_sql: LiteralString = """
+SELECT a.url AS long_url, a.short_url
+FROM unnest(%s::text[]) AS t(url)
+JOIN long_url_alias a
+ON a.url_digest = long_url_digest(t.url) AND a.url = t.url;
+"""
+
+# long_url.id is a BIGINT
+MAX_ID = 2**63 - 1
+
+
+def link_params(long_url_id: int, short_url: str) -> Tuple[str | int, ...]:
+    return (
+        short_url,
+        long_url_id,
+        short_url,
+        long_url_id,
+        short_url,
+        long_url_id,
+        long_url_id,
+    )
+
+
+def long_url_query(
+    lookup_mode: LookupMode, short_url: str
+) -> Optional[Tuple[LiteralString, Tuple[str | int, ...]]]:
+    """
+    The query and args to find a link by short_url, or None if the short_url
+    can't exist
+    """
+    if lookup_mode == LookupMode.decode:
+        long_url_id = base62_decode_strict(short_url)
+        if long_url_id is None or long_url_id > MAX_ID:
+            return None
+        return long_url_by_id_sql, (long_url_id, short_url)
+
+    return long_url_sql, (short_url,)
+
+
+# newest first, for cache warming
+recent_links_sql: LiteralString = """
+SELECT k.id,
+    k.created_at,
+    l.id as long_url_id,
+    s.id as short_url_id,
+    l.url as long_url,
+    s.url as short_url
+FROM link k
+JOIN short_url s
+ON s.id = k.short_url_id
+JOIN long_url l
+ON l.id = k.long_url_id
+ORDER BY k.id DESC
+LIMIT %s;
+"""
+
+
+# batch shortening, every array is a single parameter so the statement text
+# is the same whatever the batch size
+short_urls_by_long_urls_sql: LiteralString = """
+WITH input AS (
+  SELECT url, long_url_digest(url) AS digest FROM unnest(%s::text[]) AS t(url)
+)
+SELECT l.url AS long_url, s.url AS short_url
+FROM input i
+JOIN long_url l ON l.url_digest = i.digest AND l.url = i.url
+JOIN link k ON k.long_url_id = l.id
+JOIN short_url s ON s.id = k.short_url_id;
+"""
+
+upsert_long_urls_sql: LiteralString = """
+WITH input AS (
+  SELECT url, long_url_digest(url) AS digest
+  FROM (SELECT DISTINCT unnest(%s::text[]) AS url) t
+), new_url AS (
+  INSERT INTO long_url (url)
+  SELECT url FROM input
+  ON CONFLICT (url_digest) DO NOTHING
+  RETURNING id, url
+)
+SELECT id, url FROM new_url
+UNION ALL
+SELECT l.id, l.url
+FROM long_url l
+JOIN input i ON l.url_digest = i.digest AND l.url = i.url;
+"""
+
+upsert_links_sql: LiteralString = """
+WITH input AS (
+  SELECT *
+  FROM unnest(%s::bigint[], %s::text[]) AS t(long_url_id, short_url)
+), new_short AS (
+  INSERT INTO short_url (url)
+  SELECT short_url FROM input
+  ON CONFLICT (url) DO NOTHING
+  RETURNING id, url
+), shorts AS (
+  SELECT id, url FROM new_short
+  UNION ALL
+  SELECT s.id, s.url FROM short_url s JOIN input i ON s.url = i.short_url
+), new_link AS (
+  INSERT INTO link (long_url_id, short_url_id)
+  SELECT i.long_url_id, sh.id
+  FROM input i
+  JOIN shorts sh ON sh.url = i.short_url
+  ON CONFLICT (short_url_id) DO NOTHING
+  RETURNING id, created_at, long_url_id, short_url_id
+)
+SELECT k.id, k.created_at, k.long_url_id, k.short_url_id,
+    l.url AS long_url, i.short_url
+FROM new_link k
+JOIN input i ON i.long_url_id = k.long_url_id
+JOIN long_url l ON l.id = k.long_url_id;
+"""
+
+links_by_short_urls_sql: LiteralString = """
+SELECT k.id,
+    k.created_at,
+    l.id as long_url_id,
+    s.id as short_url_id,
+    l.url as long_url,
+    s.url as short_url
+FROM short_url s
+JOIN link k
+ON s.url = ANY(%s) AND s.id = k.short_url_id
+JOIN long_url l
+ON l.id = k.long_url_id;
+"""
+
+# callers must check that short_url matches what they asked for
+links_by_long_url_ids_sql: LiteralString = """
+SELECT k.id,
+    k.created_at,
+    l.id as long_url_id,
+    s.id as short_url_id,
+    l.url as long_url,
+    s.url as short_url
+FROM long_url l
+JOIN link k
+ON l.id = ANY(%s) AND k.long_url_id = l.id
+JOIN short_url s
+ON s.id = k.short_url_id;
+"""
+
+
+def links_by_short_urls_query(
+    lookup_mode: LookupMode, short_urls: List[str]
+) -> Optional[Tuple[LiteralString, Tuple[List[str] | List[int]]]]:
+    """
+    The query and args to find many links by short_url, or None if none of
+    them can exist
+    """
+    if lookup_mode == LookupMode.decode:
+        ids = [base62_decode_strict(s) for s in short_urls]
+        valid = [i for i in ids if i is not None and i <= MAX_ID]
+        return (links_by_long_url_ids_sql, (valid,)) if valid else None
+
+    return links_by_short_urls_sql, (short_urls,)
@@ -0,0 +1,124 @@
+import hashlib
+from typing import List, Optional, Tuple
+
+from nifty.common import cfg
+from ..base62 import base62_decode_strict
+from . import postgres
+
+SHARDS_CFG_KEY = "shards"
+
+# 64 bit LCG multiplier from the jump consistent hash paper
+_JUMP_MULTIPLIER = 2862933555777941757
+_MASK_64 = 2**64 - 1
+
+
+def jump_hash(key: int, buckets: int) -> int:
+    """
+    Lamping & Veach jump consistent hash.  Going from n to n + 1 buckets
+    only moves keys into the new bucket, and only 1 / (n + 1) of them
+    """
+    b, j = -1, 0
+    while j < buckets:
+        b = j
+        key = (key * _JUMP_MULTIPLIER + 1) & _MASK_64
+        j = int((b + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return b
+
+
+class ShardLayout:
+    """
+    Where rows live when links are split over several postgres databases.
+
+    Each shard's sequences hand out ids with id % slots == shard, so an id,
+    and the short code that is its base62, routes to its shard with no
+    lookup.  A long url's home shard, where it is deduped and created, is a
+    jump hash of the url, so adding a shard only moves homes onto the new one
+    (see nifty.util.db.shards rebalance).  Ids up to legacy_max_id were handed
+    out before sharding and all live on shard 0.
+
+    slots is the most shards there can ever be and must never change.
+    """
+
+    def __init__(self, count: int = 1, slots: int = 1, legacy_max_id: int = 0):
+        if count < 1:
+            raise ValueError("count must be >= 1")
+        if count > 1 and count > slots:
+            raise ValueError("count must be <= slots")
+        self.count = count
+        self.slots = slots
+        self.legacy_max_id = legacy_max_id
+
+    @property
+    def sharded(self) -> bool:
+        return self.count > 1
+
+    def shard_for_id(self, id: int) -> int:
+        if not self.sharded or id <= self.legacy_max_id:
+            return 0
+        return id % self.slots
+
+    def shard_for_short_url(self, short_url: str) -> Optional[int]:
+        """
+        The shard a short_url's link is on, or None if it can't exist
+        """
+        if not self.sharded:
+            return 0
+        id = base62_decode_strict(short_url)
+        if id is None:
+            return None
+        shard = self.shard_for_id(id)
+        return shard if shard < self.count else None
+
+    def home_shard(self, long_url: str, count: Optional[int] = None) -> int:
+        """
+        Where long_url is deduped and created, with count shards if given
+        """
+        count = count or self.count
+        if count == 1:
+            return 0
+        digest = hashlib.blake2b(long_url.encode(), digest_size=8).digest()
+        return jump_hash(int.from_bytes(digest, "little"), count)
+
+    def first_id(self, shard: int, above: int) -> int:
+        """
+        The smallest id greater than above that belongs to shard
+        """
+        id = above - above % self.slots + shard
+        return id if id > above else id + self.slots
+
+
+def layout_from_cfg() -> ShardLayout:
+    count = cfg.gint_fb(SHARDS_CFG_KEY, "count", 1)
+    return ShardLayout(
+        count=count,
+        slots=cfg.gint_fb(SHARDS_CFG_KEY, "slots", 64) if count > 1 else 1,
+        legacy_max_id=cfg.gint_fb(SHARDS_CFG_KEY, "legacy_max_id", 0),
+    )
+
+
+def shard_section(shard: int) -> str:
+    """
+    The config section with shard's host, shard 0 is [postgres]
+    """
+    return "postgres" if shard == 0 else f"postgres-shard-{shard}"
+
+
+def shard_conninfos(count: int) -> List[Tuple[str, Optional[str]]]:
+    """
+    The primary and optional replica conninfo of each shard, in shard order.
+    Every shard uses the [postgres] credentials
+    """
+    ret: List[Tuple[str, Optional[str]]] = [
+        (postgres.conninfo(), postgres.replica_conninfo())
+    ]
+    for shard in range(1, count):
+        section = shard_section(shard)
+        ret.append(
+            (
+                postgres.conninfo(
+                    cfg.g(section, "host"), cfg.gint_fb(section, "port", 5432)
+                ),
+                postgres.replica_conninfo(section),
+            )
+        )
+    return ret
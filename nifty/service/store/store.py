@@ -1,154 +1,549 @@
 import atexit
 import logging
-from typing import Callable, List, Optional, Tuple, TypeVar
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, LiteralString, Optional, Tuple, TypeVar
 
-from psycopg import Cursor
+from psycopg import Connection, Cursor, OperationalError
 from psycopg.rows import BaseRowFactory, class_row
-from psycopg_pool import ConnectionPool
+from psycopg_pool import ConnectionPool, PoolTimeout
+from redis.client import PubSub, PubSubWorkerThread
+from redis.exceptions import RedisError
 
-from nifty.common import cfg
-from nifty.common import helpers
+from nifty.common import bloom, cfg
+from nifty.common import id_bitmap, link_cache, publisher
 from nifty.common import redis_helpers
-from nifty.common.types import Key, Link, RedisType
-from .types import Id, Trending, TrendingItem, Url
+from nifty.common.bloom import BloomStats
+from nifty.common.id_bitmap import IdBitmapStats
+from nifty.common.publisher import PublisherStats
+from nifty.common.helpers import timestamp_ms
+from nifty.common.types import Channel, Key, Link, Meta, RedisType, Transport
+from nifty.common.types import encode_event
+from . import hot_keys, hot_links, local_cache, postgres, shards, trending_view
+from .local_cache import CacheStats
+from .trending_view import TrendingView
+from . import queries
+from ..base62 import base62_decode_strict, base62_encode
+from .types import (
+    Id,
+    LookupMode,
+    ShortByLong,
+    Trending,
+    TrendingItem,
+    Url,
+    UrlRow,
+)
 
 _logger = logging.getLogger(__name__)
 T = TypeVar("T")
 R = TypeVar("R")
-_conninfo = (
-    f"postgresql://{cfg.g('postgres', 'user')}:{cfg.g('postgres', 'pwd')}"
-    f"@{cfg.g('postgres', 'host')}/postgres"
-)
-_pool = ConnectionPool(conninfo=_conninfo)
+# one database, or several with links spread over them, see ShardLayout
+_layout = shards.layout_from_cfg()
+_pools: List[ConnectionPool] = []
+# optional read replica per shard, for queries that can tolerate some lag
+_replica_pools: List[Optional[ConnectionPool]] = []
+# nothing connects or starts a thread at import, so a preloading server can
+# fork workers from this module.  each process connects in open()
+for _shard, (_primary, _replica) in enumerate(shards.shard_conninfos(_layout.count)):
+    _name = "primary" if _shard == 0 else f"shard-{_shard}"
+    _pools.append(
+        ConnectionPool(
+            conninfo=_primary, name=_name, open=False, **postgres.pool_kwargs()
+        )
+    )
+    _replica_pools.append(
+        ConnectionPool(
+            conninfo=_replica,
+            name="replica" if _shard == 0 else f"{_name}-replica",
+            open=False,
+            **postgres.pool_kwargs(),
+        )
+        if _replica
+        else None
+    )
+# set by a write, so reads later in the same request see it
+_wrote: ContextVar[bool] = ContextVar("nifty_store_wrote", default=False)
+_lookup_mode = LookupMode(cfg.g_fb("nifty", "lookup_mode", LookupMode.join.value))
+# how long redis-cache remembers long_url -> link for re-shortens, 0 is off
+_forward_ttl_sec = cfg.gint_fb("nifty", "forward_cache_ttl_sec", 0)
 redis_client = redis_helpers.get_redis(RedisType.STD)
-cache = redis_helpers.get_redis(RedisType.CACHE)
+# redis-cache, over a hash ring when it has several nodes
+cache = link_cache.from_cfg()
+
+# events go out from a background thread so requests never wait on redis
+_publisher = publisher.from_cfg(redis_client)
+_event_format = redis_helpers.get_event_format()
+
+# per process cache in front of redis-cache, kept honest by invalidations
+# published on Channel.link_invalidate (a short_url, or "*" for everything)
+_local_cache = local_cache.link_cache_from_cfg()
+
+# long urls we have shortened, so new ones can skip looking for a link
+_bloom_spec = bloom.spec_from_cfg()
+_bloom = bloom.BloomFilter(redis_client, _bloom_spec) if _bloom_spec else None
+
+# short urls that have a link, and ones recently looked up and not found,
+# so lookups of codes that don't exist can skip postgres
+_short_url_bitmap = id_bitmap.short_url_bitmap_from_cfg(redis_client)
+_missing_ttl_sec = cfg.gint_fb("nifty", "missing_cache_ttl_sec", 0)
+
+_hot_keys = hot_keys.limit() if _local_cache is not None else 0
+
+# the hottest links, mmapped from a file every process on the host shares
+_hot_links = hot_links.from_cfg()
+_invalidatables: List[local_cache.Invalidatable] = [
+    c for c in [_local_cache, _hot_links] if c is not None
+]
+
+
+# the rendered /nifty/trending response lives in redis, see trending_view
+_trending_view = trending_view.enabled()
+_trending_changed = threading.Event()
+
+
+def _on_invalidate(msg: Dict[str, Any]):
+    for c in _invalidatables:
+        local_cache.apply_invalidation(c, msg["data"].decode())
+
+
+def _on_trend(_msg: Dict[str, Any]):
+    _trending_changed.set()
+
+
+def _on_listener_error(e: BaseException, pubsub: PubSub, thread: PubSubWorkerThread):
+    # we may have missed invalidations while disconnected, so start over
+    _logger.warning(f"invalidation listener error, clearing local cache: {e}")
+    for c in _invalidatables:
+        c.clear()
+    _trending_changed.set()
+    time.sleep(1)
+
+
+_handlers: Dict[str, Callable[[Dict[str, Any]], None]] = {}
+if _invalidatables:
+    _handlers[Channel.link_invalidate.value] = _on_invalidate
+if _trending_view and redis_helpers.get_transport() == Transport.pubsub:
+    _handlers[Channel.trend.value] = _on_trend
+
+_listener: Optional[PubSubWorkerThread] = None
+_stopping = threading.Event()
+
+
+def _subscribe():
+    """
+    Subscribe to _handlers and start the listener, retrying until redis
+    answers, so a process can start and serve without it
+    """
+    global _listener
+    # Channel.trend events may be binary
+    pubsub = redis_helpers.get_redis(RedisType.STD, decode_responses=False).pubsub(
+        ignore_subscribe_messages=True
+    )
+    failed = False
+    while not _stopping.is_set():
+        try:
+            pubsub.subscribe(**_handlers)
+        except RedisError as e:
+            _logger.warning(f"unable to subscribe, retrying: {e}")
+            failed = True
+            _stopping.wait(1)
+            continue
+        if failed:
+            # invalidations sent while we weren't listening are lost
+            for c in _invalidatables:
+                c.clear()
+            _trending_changed.set()
+        _listener = pubsub.run_in_thread(
+            sleep_time=1, daemon=True, exception_handler=_on_listener_error
+        )
+        return
+
+
+def _refresh_trending_view(interval_sec: float):
+    while not _stopping.is_set():
+        changed = _trending_changed.wait(interval_sec)
+        if _stopping.is_set():
+            break
+        _trending_changed.clear()
+        try:
+            refresh_trending_view(changed)
+        except Exception as e:
+            _logger.warning(f"unable to refresh trending view: {e}")
+
+
+def _log_pool_stats(interval_sec: float):
+    while not _stopping.wait(interval_sec):
+        for stats in pool_stats().values():
+            postgres.log_stats(stats)
+
+
+# the process that opened, connections and threads don't survive a fork
+_opened_pid = 0
+_open_lock = threading.Lock()
+
+
+def open():
+    """
+    Connect and start this process' background threads, then warm the local
+    cache.  Does nothing once this process has, so a forking server can call
+    it in each worker (see nifty.service.gunicorn_conf) and start_request
+    calls it for everything else
+    """
+    global _opened_pid
+    pid = os.getpid()
+    if _opened_pid == pid:
+        return
+    with _open_lock:
+        if _opened_pid == pid:
+            return
+        pools = [p for p in _pools + _replica_pools if p is not None]
+        # each fills to min_size in the background, so shards connect at once
+        for pool in pools:
+            pool.open()
+        timeout_sec = postgres.open_timeout_sec()
+        for pool in pools:
+            try:
+                with pool.connection(timeout=timeout_sec):
+                    pass
+            except PoolTimeout as e:
+                # the pool keeps trying, requests wait for it as usual
+                _logger.warning(f"pool {pool.name} not ready: {e}")
+
+        _publisher.start()
+        if _handlers:
+            threading.Thread(
+                target=_subscribe, name="nifty-subscribe", daemon=True
+            ).start()
+        if _trending_view:
+            threading.Thread(
+                target=_refresh_trending_view,
+                args=(trending_view.refresh_interval_sec(),),
+                name="nifty-trending-view",
+                daemon=True,
+            ).start()
+        if postgres.stats_log_interval_sec() > 0:
+            threading.Thread(
+                target=_log_pool_stats,
+                args=(postgres.stats_log_interval_sec(),),
+                name="nifty-pool-stats",
+                daemon=True,
+            ).start()
+        _opened_pid = pid
+    # before taking traffic, so a restart doesn't send every redirect to postgres
+    warm_local_cache()
 
 
 @atexit.register
 def close():
-    _pool.close()
+    # a preloading server's arbiter imports this and forks, only the
+    # processes that opened have anything to close
+    if _opened_pid != os.getpid():
+        return
+    _stopping.set()
+    _trending_changed.set()
+    save_hot_keys()
+    if _listener is not None:
+        _listener.stop()
+    _publisher.close()
+    for pool in _pools + _replica_pools:
+        if pool is not None:
+            pool.close()
+
+
+def save_hot_keys():
+    """
+    Save the local cache's hottest short urls for warm_local_cache
+    """
+    if _local_cache is None or _hot_keys <= 0:
+        return
+    try:
+        hot_keys.save(
+            redis_client, _local_cache.hot(_hot_keys), _hot_keys, hot_keys.ttl_sec()
+        )
+    except RedisError as e:
+        _logger.warning(f"unable to save hot keys: {e}")
 
 
-def _execute(
-    sql: str,
-    args: Tuple[str | int, ...],
+def warm_local_cache() -> int:
+    """
+    Fill the local cache, and redis-cache on the way, with the hot short urls
+    saved by processes that stopped, for up to [warm] load_timeout_sec.  Best
+    effort, it stops at the first postgres or redis error
+
+    :return: how many links were loaded
+    """
+    if _local_cache is None or _hot_keys <= 0:
+        return 0
+    deadline = time.monotonic() + hot_keys.load_timeout_sec()
+    try:
+        short_urls = hot_keys.load(redis_client, _hot_keys)
+    except RedisError as e:
+        _logger.warning(f"unable to load hot keys: {e}")
+        return 0
+
+    loaded = 0
+    try:
+        # small batches, so the deadline is checked often
+        for i in range(0, len(short_urls), 500):
+            if time.monotonic() > deadline:
+                _logger.warning(f"warm up timed out after {loaded} links")
+                break
+            loaded += len(resolve_batch(short_urls[i : i + 500]))
+    except (OperationalError, RedisError) as e:
+        # covers pool timeouts too
+        _logger.warning(f"warm up stopped after {loaded} links: {e}")
+    _logger.info("warmed local cache with %s links", loaded)
+    return loaded
+
+
+def hot_links_size() -> Optional[int]:
+    return _hot_links.size() if _hot_links is not None else None
+
+
+def local_cache_stats() -> Optional[CacheStats]:
+    return _local_cache.stats() if _local_cache is not None else None
+
+
+def bloom_stats() -> Optional[BloomStats]:
+    return _bloom.stats() if _bloom is not None else None
+
+
+def short_url_bitmap_stats() -> Optional[IdBitmapStats]:
+    return _short_url_bitmap.stats() if _short_url_bitmap is not None else None
+
+
+def pool_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Stats of every postgres pool, by pool name
+    """
+    return {p.name: p.get_stats() for p in _pools + _replica_pools if p is not None}
+
+
+def start_request():
+    """
+    Call at the start of every request, so reads go to the replica until
+    the request writes something.  Opens the store if this process hasn't
+    """
+    if _opened_pid != os.getpid():
+        open()
+    _wrote.set(False)
+
+
+def publisher_stats() -> PublisherStats:
+    return _publisher.stats()
+
+
+def publish(channel: Channel, event: Meta) -> bool:
+    """
+    Queue an event for publishing, returns False if it was dropped
+    """
+    return _publisher.publish(channel, encode_event(event, _event_format))
+
+
+def invalidate_link(short_url: str):
+    """
+    Evict a link from the local cache of every service process
+    """
+    redis_client.publish(Channel.link_invalidate, short_url)
+
+
+def invalidate_links(short_urls: List[str]):
+    with redis_client.pipeline(transaction=False) as pipe:
+        for short_url in short_urls:
+            pipe.publish(Channel.link_invalidate, short_url)
+        pipe.execute()
+
+
+def _execute_on(
+    pool: ConnectionPool,
+    sql: LiteralString,
+    args: Tuple[Any, ...],
     row_factory: BaseRowFactory[T],
     processor: Callable[[Cursor[T]], R],
 ) -> R:
-    _logger.debug(args)
-    with _pool.connection() as conn:
+    with pool.connection() as conn:
         with conn.cursor(row_factory=row_factory) as cur:
             cur.execute(sql, args)
             return processor(cur)
 
 
+def _execute(
+    sql: LiteralString,
+    args: Tuple[Any, ...],
+    row_factory: BaseRowFactory[T],
+    processor: Callable[[Cursor[T]], R],
+    read_only: bool = False,
+    shard: int = 0,
+) -> R:
+    if _logger.isEnabledFor(logging.DEBUG):
+        _logger.debug("%s", args)
+    replica_pool = _replica_pools[shard]
+    if not read_only:
+        _wrote.set(True)
+    elif replica_pool is not None and not _wrote.get():
+        try:
+            return _execute_on(replica_pool, sql, args, row_factory, processor)
+        except OperationalError as e:
+            # covers pool timeouts, lost connections and recovery conflicts
+            _logger.warning(f"replica read failed, using the primary: {e}")
+    return _execute_on(_pools[shard], sql, args, row_factory, processor)
+
+
 def _ex_one(
-    sql: str, args: Tuple[str | int, ...], row_factory: BaseRowFactory[T]
+    sql: LiteralString,
+    args: Tuple[Any, ...],
+    row_factory: BaseRowFactory[T],
+    read_only: bool = False,
+    shard: int = 0,
 ) -> Optional[T]:
-    return _execute(sql, args, row_factory, lambda cur: cur.fetchone())
+    return _execute(
+        sql, args, row_factory, lambda cur: cur.fetchone(), read_only, shard
+    )
 
 
 def _ex_all(
-    sql: str, args: Tuple[str | int, ...], row_factory: BaseRowFactory[T]
+    sql: LiteralString,
+    args: Tuple[Any, ...],
+    row_factory: BaseRowFactory[T],
+    read_only: bool = False,
+    shard: int = 0,
 ) -> List[T]:
-    return _execute(sql, args, row_factory, lambda cur: cur.fetchall())
-
-
-_short_url_sql = """
-SELECT s.url
-FROM link k
-JOIN short_url s ON s.id = k.short_url_id
-JOIN long_url l ON l.id = k.long_url_id
-WHERE l.url = %s;
-"""
+    return _execute(
+        sql, args, row_factory, lambda cur: cur.fetchall(), read_only, shard
+    )
 
 
-def get_short_url(long_url: str) -> str | None:
-    ret = _ex_one(_short_url_sql, (long_url,), class_row(Url))
+def _get_alias(long_url: str) -> Optional[str]:
+    if not _layout.sharded:
+        return None
+    ret = _ex_one(
+        queries.long_url_alias_sql,
+        (long_url, long_url),
+        class_row(Url),
+        shard=_layout.home_shard(long_url),
+    )
     return ret.url if ret else None
 
 
-_upsert_long_url_sql = """
-    WITH new_url AS(
-      INSERT
-        INTO
-          long_url (url)
-        VALUES (%s)
-        ON
-            CONFLICT (url) DO NOTHING 
-        RETURNING id
-    ) 
-    SELECT
-      COALESCE(
-    (SELECT id FROM new_url),
-    (SELECT id FROM long_url WHERE url = %s)) AS id;"""
+def get_short_url(long_url: str) -> str | None:
+    ret = _ex_one(
+        queries.short_url_sql,
+        (long_url, long_url),
+        class_row(Url),
+        read_only=True,
+        shard=_layout.home_shard(long_url),
+    )
+    return ret.url if ret else _get_alias(long_url)
 
 
 def upsert_long_url(long_url: str) -> int:
-    ret = _ex_one(_upsert_long_url_sql, (long_url, long_url), class_row(Id))
+    ret = _ex_one(
+        queries.upsert_long_url_sql,
+        (long_url,) * 3,
+        class_row(Id),
+        shard=_layout.home_shard(long_url),
+    )
     if not ret or not ret.id:
         raise Exception("Unable to get or create long url from ${long_url}")
 
     return ret.id
 
 
-_link_sql = """
-WITH upsert_short AS (
-  INSERT
-    INTO
-      short_url (url)
-    VALUES (%s)
-ON
-    CONFLICT (url) DO NOTHING 
-RETURNING id 
-), upsert_link AS (
-INSERT INTO link(long_url_id, short_url_id)
-VALUES (%s, COALESCE((SELECT id FROM upsert_short),(SELECT id 
-    FROM short_url WHERE url = %s)))
-ON CONFLICT (short_url_id)
-DO NOTHING
-RETURNING id, created_at, %s AS long_url_id,
-    short_url_id, %s AS short_url
-)
-SELECT ul.id, ul.created_at, %s AS long_url_id, ul.short_url_id,
-        l.url AS long_url, ul.short_url
-FROM upsert_link ul
-JOIN long_url l
-ON l.id = %s AND l.id = ul.long_url_id;
+def _mark_exists(links: List[Link]):
+    if _short_url_bitmap is not None:
+        ids = [base62_decode_strict(link.short_url) for link in links]
+        _short_url_bitmap.add_many([id for id in ids if id is not None])
+
+
+def _on_created(links: List[Link]):
+    # before anyone is handed the short url, so it can't be filtered out
+    _mark_exists(links)
+    cache.put_links(links, _forward_ttl_sec)
+    invalidate_links([link.short_url for link in links])
+    if _bloom is not None:
+        _bloom.add_many([link.long_url for link in links])
+
+
+def _short_urls_by_long_urls(
+    conn: Connection[Any], long_urls: List[str]
+) -> Dict[str, str]:
+    with conn.cursor(row_factory=class_row(ShortByLong)) as cur:
+        cur.execute(queries.short_urls_by_long_urls_sql, (long_urls,))
+        found = {r.long_url: r.short_url for r in cur.fetchall()}
+        missing = [u for u in long_urls if u not in found]
+        if _layout.sharded and missing:
+            cur.execute(queries.long_url_aliases_sql, (missing,))
+            found.update({r.long_url: r.short_url for r in cur.fetchall()})
+        return found
+
+
+def _shorten_batch_on(
+    shard: int, unique_urls: List[str]
+) -> Tuple[Dict[str, str], List[Link]]:
+    created: List[Link] = []
+    with _pools[shard].connection() as conn:
+        found = _short_urls_by_long_urls(conn, unique_urls)
+        new_urls = [u for u in unique_urls if u not in found]
+        if new_urls:
+            with conn.cursor(row_factory=class_row(UrlRow)) as cur:
+                cur.execute(queries.upsert_long_urls_sql, (new_urls,))
+                long_url_ids = [r.id for r in cur.fetchall()]
+            short_urls = [base62_encode(i) for i in long_url_ids]
+            with conn.cursor(row_factory=postgres.link_row) as cur:
+                cur.execute(queries.upsert_links_sql, (long_url_ids, short_urls))
+                created = cur.fetchall()
+            found.update({link.long_url: link.short_url for link in created})
+
+            # anything left was created concurrently by someone else
+            missing = [u for u in new_urls if u not in found]
+            if missing:
+                found.update(_short_urls_by_long_urls(conn, missing))
+    return found, created
+
+
+def shorten_batch(long_urls: List[str]) -> Tuple[List[str], List[Link]]:
     """
+    Shorten many urls with a fixed number of statements per shard, each
+    shard's on one connection
 
+    :return: the short urls, in the same order as long_urls, and the links
+        that were created by this call
+    """
+    by_shard: Dict[int, List[str]] = {}
+    for long_url in dict.fromkeys(long_urls):
+        by_shard.setdefault(_layout.home_shard(long_url), []).append(long_url)
 
-@helpers.retry(max_tries=3, stack_id=__name__)
-def _cache_upsert_link(link: Link):
-    link_key = Key.link_by_link_id.sub(link.id)
-    link_id_key = Key.link_id_cache.sub(link.short_url)
-    long_url_key = Key.long_by_short.sub(link.short_url)
-    with cache.pipeline() as p:
-        p.watch(link_key, link_id_key, long_url_key)
-        p.multi()
+    found: Dict[str, str] = {}
+    created: List[Link] = []
+    _wrote.set(True)
+    for shard, unique_urls in by_shard.items():
+        shard_found, shard_created = _shorten_batch_on(shard, unique_urls)
+        found.update(shard_found)
+        created += shard_created
 
-        p.hset(link_key, mapping=link.redis_dict())  # type: ignore
-        p.set(link_id_key, link.id).set(long_url_key, link.long_url).execute()
+    if created:
+        _on_created(created)
+
+    missing = [u for u in long_urls if u not in found]
+    if missing:
+        raise Exception(f"Unable to get or create long urls {missing}")
+    return [found[u] for u in long_urls], created
+
+
+def _cache_upsert_link(link: Link):
+    cache.put_link(link, _forward_ttl_sec)
 
 
 def _get_link_from_cache(short_url: str) -> Optional[Link]:
-    link_id_key = Key.link_id_cache.sub(short_url)
-
-    # TODO make a lua script and execute both on server side
-    # we want to do this atomically, but for now let's get this working
-    link_id = redis_helpers.rint(cache, link_id_key)
-    if link_id is not None:
-        link_key = Key.link_by_link_id.sub(link_id)
-        link = redis_helpers.robj(cache, link_key, Link, throws=False)
+    link = cache.get_link(short_url)
+    if _logger.isEnabledFor(logging.DEBUG):
         if link is None:
-            _logger.debug(f"cache MISS - short_url:{short_url} , link_id:{link_id}")
-            return None
+            _logger.debug("cache MISS - short_url:%s", short_url)
         else:
-            _logger.debug(f"cache HIT  - short_url:{short_url} , link_id:{link_id}")
-            return link
-    else:
-        _logger.debug(f"CACHE MISS - no link_id for {short_url}")
-        return None
+            _logger.debug("cache HIT  - short_url:%s , link_id:%s", short_url, link.id)
+    return link
 
 
 def upsert_link(long_url_id: int, short_url: str) -> Link:
@@ -156,69 +551,211 @@ def upsert_link(long_url_id: int, short_url: str) -> Link:
     if link is not None:
         return link
 
-    params = (
-        short_url,
-        long_url_id,
-        short_url,
-        long_url_id,
-        short_url,
-        long_url_id,
-        long_url_id,
+    ret = _ex_one(
+        queries.link_sql,
+        queries.link_params(long_url_id, short_url),
+        postgres.link_row,
+        shard=_layout.shard_for_id(long_url_id),
     )
-    ret = _ex_one(_link_sql, params, class_row(Link))
     if not ret:
         raise Exception("Unable to get or create long url from ${long_url}")
 
     # update the cache, otherwise it's memoized to None
     _cache_upsert_link(ret)
+    invalidate_link(ret.short_url)
     return ret
 
 
-_long_url_sql = """
-SELECT k.id,
-    k.created_at,
-    l.id as long_url_id, 
-    s.id as short_url_id,
-    l.url as long_url,
-    s.url as short_url
-FROM short_url s
-JOIN link k
-ON s.url = %s AND s.id = k.short_url_id
-JOIN long_url l
-ON l.id = k.long_url_id;
+def shorten(long_url: str) -> Tuple[Link, bool]:
     """
+    Get or create the link for long_url, normally in one statement
+
+    :return: the link and whether this call created it
+    """
+    if _forward_ttl_sec > 0:
+        link = cache.get_link_by_long(long_url)
+        if link is not None:
+            return link, False
+
+    home = _layout.home_shard(long_url)
+    if _bloom is not None and not _bloom.might_contain(long_url):
+        row = _ex_one(
+            queries.shorten_new_sql, (long_url,), postgres.shorten_row, shard=home
+        )
+        if row is not None:
+            link = row.link
+            _on_created([link])
+            return link, True
+
+    alias = _get_alias(long_url)
+    link = get_long_url(alias) if alias else None
+    if link is not None:
+        return link, False
+
+    for _ in range(2):
+        # a lost insert race shows up as no row, and the retry sees the winner
+        row = _ex_one(
+            queries.shorten_sql, (long_url,) * 3, postgres.shorten_row, shard=home
+        )
+        if row is not None:
+            link = row.link
+            if row.created:
+                _on_created([link])
+            else:
+                # so the next re-shorten is answered by the cache
+                _cache_upsert_link(link)
+            return link, row.created
+
+    # the long url exists without a link, an earlier shorten died half way
+    long_url_id = upsert_long_url(long_url)
+    link = upsert_link(long_url_id, base62_encode(long_url_id))
+    _mark_exists([link])
+    if _bloom is not None:
+        _bloom.add(long_url)
+    return link, True
+
+
+def _get_link_from_db(short_url: str, replica: bool = True) -> Optional[Link]:
+    shard = _layout.shard_for_short_url(short_url)
+    query = queries.long_url_query(_lookup_mode, short_url)
+    if shard is None or query is None:
+        return None
+    if not replica:
+        return _execute_on(
+            _pools[shard], *query, postgres.link_row, lambda cur: cur.fetchone()
+        )
+    return _ex_one(*query, postgres.link_row, read_only=True, shard=shard)
+
+
+def _reads_replica(short_url: str) -> bool:
+    """
+    Whether a read-only lookup of short_url would go to a replica
+    """
+    shard = _layout.shard_for_short_url(short_url)
+    return shard is not None and _replica_pools[shard] is not None and not _wrote.get()
+
+
+def _known_missing(short_url: str) -> bool:
+    if _short_url_bitmap is not None:
+        id = base62_decode_strict(short_url)
+        try:
+            if id is not None and not _short_url_bitmap.might_contain(id):
+                return True
+        except RedisError as e:
+            _logger.warning(f"short url bitmap check failed: {e}")
+    return _missing_ttl_sec > 0 and cache.is_missing(short_url)
 
 
 def get_long_url(short_url: str) -> Link | None:
+    if _local_cache is not None:
+        link = _local_cache.get(short_url)
+        if link is not None:
+            return link
+
+    if _hot_links is not None:
+        link = _hot_links.get(short_url)
+        if link is not None:
+            return link
+
     link = _get_link_from_cache(short_url)
     if link is None:
-        link = _ex_one(_long_url_sql, (short_url,), class_row(Link))
+        if _known_missing(short_url):
+            _logger.debug("known missing - short_url:%s", short_url)
+            return None
+        link = _get_link_from_db(short_url)
+        if link is None and _missing_ttl_sec > 0 and _reads_replica(short_url):
+            # a lagging replica may not have a link created moments ago, only
+            # the primary's word is good enough to remember it as missing
+            link = _get_link_from_db(short_url, replica=False)
         if link is None:
+            if _missing_ttl_sec > 0:
+                cache.put_missing(short_url, _missing_ttl_sec)
             return None
         _cache_upsert_link(link)
 
+    if _local_cache is not None:
+        _local_cache.put(short_url, link)
     return link
 
 
-links_by_ids_sql = """
-SELECT k.id, 
-    k.created_at,
-    l.id as long_url_id, 
-    s.id as short_url_id,
-    l.url as long_url,
-    s.url as short_url
-FROM link k
-JOIN short_url s
-ON s.id = k.short_url_id
-JOIN long_url l
-ON l.id = k.long_url_id
-WHERE k.id IN (
-"""
+def resolve_batch(short_urls: List[str]) -> Dict[str, Link]:
+    """
+    Look up many short urls at once: local cache, then one redis-cache
+    pipeline, then one query for whatever is still missing
+
+    :return: the links that exist, by short url
+    """
+    unique = list(dict.fromkeys(short_urls))
+    found: Dict[str, Link] = {}
+    if _local_cache is not None:
+        for short_url in unique:
+            link = _local_cache.get(short_url)
+            if link is not None:
+                found[short_url] = link
+
+    remaining = [s for s in unique if s not in found]
+    if remaining:
+        cached = cache.get_links(remaining)
+        found.update({s: link for s, link in zip(remaining, cached) if link})
+
+    wanted = set(s for s in remaining if s not in found)
+    by_shard: Dict[int, List[str]] = {}
+    for short_url in wanted:
+        shard = _layout.shard_for_short_url(short_url)
+        if shard is not None:
+            by_shard.setdefault(shard, []).append(short_url)
+    links: List[Link] = []
+    for shard, shard_short_urls in by_shard.items():
+        query = queries.links_by_short_urls_query(_lookup_mode, shard_short_urls)
+        if query is not None:
+            links += [
+                link
+                for link in _ex_all(
+                    *query, postgres.link_row, read_only=True, shard=shard
+                )
+                if link.short_url in wanted
+            ]
+    if links:
+        cache.put_links(links, _forward_ttl_sec)
+    found.update({link.short_url: link for link in links})
+
+    if _local_cache is not None:
+        for short_url in remaining:
+            if short_url in found:
+                _local_cache.put(short_url, found[short_url])
+    return found
+
+
+def _get_links_by_id_from_db(ids: List[int]) -> List[Link]:
+    by_shard: Dict[int, List[int]] = {}
+    for id in ids:
+        by_shard.setdefault(_layout.shard_for_id(id), []).append(id)
+    links: List[Link] = []
+    for shard, shard_ids in by_shard.items():
+        links += _ex_all(
+            queries.links_by_ids_sql,
+            (shard_ids,),
+            postgres.link_row,
+            read_only=True,
+            shard=shard,
+        )
+    return links
 
 
 def get_links_by_id(ids: List[int]) -> List[Link]:
-    sql = links_by_ids_sql + ",".join(["%s"] * len(ids)) + ")"
-    return _ex_all(sql, tuple(ids), class_row(Link))
+    """
+    The links that exist, in the same order as ids.  Cached ones come from
+    redis-cache, the rest from postgres and are cached for next time
+    """
+    by_id: Dict[int, Link] = {
+        link.id: link for link in cache.get_links_by_id(ids) if link is not None
+    }
+    missing = [id for id in ids if id not in by_id]
+    if missing:
+        loaded = _get_links_by_id_from_db(missing)
+        cache.put_links(loaded, _forward_ttl_sec)
+        by_id.update({link.id: link for link in loaded})
+    return [by_id[id] for id in ids if id in by_id]
 
 
 def get_trending() -> Trending:
@@ -229,23 +766,64 @@ def get_trending() -> Trending:
     # pyright doesn't like this because redis lib is still using the old lowercase types
     # pyright: reportGeneralTypeIssues=false
     results: List[Tuple[int, int]] = [
-        (key, int(score))
+        (int(key), int(score))
         for key, score in redis_client.zrange(
             Key.trending, 0, tr_sz, desc=True, withscores=True
         )
     ]
     _logger.debug(results)
-    items: List[TrendingItem] = []
-    if results and len(results) > 0:
-        links: List[Link] = get_links_by_id([int(t[0]) for t in results])
-        for i in range(len(results)):
-            items.append(
-                TrendingItem(
-                    id=results[i][0],
-                    created_at=links[i].created_at_ms(),
-                    long_url=links[i].long_url,
-                    short_url=links[i].short_url,
-                    views=int(results[i][1]),
-                )
+    by_id = {link.id: link for link in get_links_by_id([t[0] for t in results])}
+    # in rank order, leaving out any link that no longer exists
+    return Trending(
+        list=[
+            TrendingItem(
+                id=id,
+                created_at=by_id[id].created_at_ms(),
+                long_url=by_id[id].long_url,
+                short_url=by_id[id].short_url,
+                views=views,
             )
-    return Trending(list=items)
+            for id, views in results
+            if id in by_id
+        ]
+    )
+
+
+def refresh_trending_view(changed: bool) -> bool:
+    """
+    Render the trending view into redis if trending changed or it is older
+    than the refresh interval, unless another process is already on it
+
+    :return: whether this process rendered it
+    """
+    if not changed:
+        view = trending_view.load(redis_client)
+        interval_ms = trending_view.refresh_interval_sec() * 1000
+        if view is not None and timestamp_ms() - view.at < interval_ms:
+            return False
+    if not trending_view.claim_refresh(redis_client, trending_view.claim_ms()):
+        return False
+    view = trending_view.render(get_trending(), timestamp_ms())
+    trending_view.save(redis_client, view, trending_view.ttl_sec())
+    return True
+
+
+def get_trending_view() -> TrendingView:
+    """
+    The rendered trending response, from redis when the view is enabled and
+    it has been rendered, otherwise rendered now
+    """
+    if not _trending_view:
+        return trending_view.render(get_trending(), timestamp_ms())
+    try:
+        view = trending_view.load(redis_client)
+        if view is not None:
+            return view
+    except RedisError as e:
+        _logger.warning(f"unable to load trending view: {e}")
+    view = trending_view.render(get_trending(), timestamp_ms())
+    try:
+        trending_view.save(redis_client, view, trending_view.ttl_sec())
+    except RedisError as e:
+        _logger.warning(f"unable to save trending view: {e}")
+    return view
@@ -0,0 +1,119 @@
+# fixes stubs like redis that use generics when the code does not
+from __future__ import annotations
+
+import hashlib
+from dataclasses import dataclass
+from typing import List, Optional
+
+from redis.asyncio.client import Pipeline as AsyncPipeline
+from redis.client import Pipeline, Redis
+
+from nifty.common import cfg
+from nifty.common.types import Key
+from .types import Trending
+
+# the /nifty/trending response, rendered into redis when the trend worker
+# reports a change on Channel.trend and every refresh_interval_sec, so serving
+# it is one HMGET and no postgres.  see store.get_trending_view
+#
+# Channel.trend is only heard with the pubsub transport, with streams the
+# view refreshes on the interval alone.  the asyncio store's twin is
+# nifty.service.store.asyncio.trending_view
+
+TRENDING_VIEW_CFG_KEY = "trending-view"
+
+FIELDS = ["etag", "body", "at"]
+
+# held by the process rendering the view, see claim_refresh
+REFRESH_KEY = Key.trending_view.sub("refresh")
+
+
+@dataclass
+class TrendingView:
+    etag: str
+    body: str
+    # ms when it was rendered
+    at: int
+
+
+def enabled() -> bool:
+    return cfg.gbool_fb(TRENDING_VIEW_CFG_KEY, "enabled", False)
+
+
+def refresh_interval_sec() -> float:
+    return cfg.gfloat_fb(TRENDING_VIEW_CFG_KEY, "refresh_interval_sec", 10)
+
+
+def ttl_sec() -> int:
+    # a view nobody has refreshed in this long is dropped, and the next
+    # request renders it
+    return cfg.gint_fb(TRENDING_VIEW_CFG_KEY, "ttl_sec", 300)
+
+
+def claim_ms() -> int:
+    return cfg.gint_fb(TRENDING_VIEW_CFG_KEY, "claim_ms", 1000)
+
+
+def render(trending: Trending, at: int) -> TrendingView:
+    body = trending.json()
+    return TrendingView(
+        etag=hashlib.sha1(body.encode()).hexdigest()[:20], body=body, at=at
+    )
+
+
+def parse(values: List[Optional[str]]) -> Optional[TrendingView]:
+    """
+    The view from an HMGET of FIELDS, or None if there isn't one
+    """
+    etag, body, at = values
+    if etag is None or body is None or at is None:
+        return None
+    return TrendingView(etag=etag, body=body, at=int(at))
+
+
+def load(redis: Redis[str]) -> Optional[TrendingView]:
+    return parse(redis.hmget(Key.trending_view, FIELDS))
+
+
+def save(redis: Redis[str], view: TrendingView, ttl_sec: int):
+    with redis.pipeline() as pipe:
+        queue_save(pipe, view, ttl_sec)
+        pipe.execute()
+
+
+def queue_save(
+    pipe: Pipeline[str] | AsyncPipeline[str], view: TrendingView, ttl_sec: int
+):
+    """
+    Queue save's commands on pipe, which the caller executes
+    """
+    pipe.hset(
+        Key.trending_view,
+        mapping={"etag": view.etag, "body": view.body, "at": view.at},
+    )
+    pipe.expire(Key.trending_view, ttl_sec)
+
+
+def claim_refresh(redis: Redis[str], hold_ms: int) -> bool:
+    """
+    Whether this process should render the view now, every process hears the
+    same Channel.trend event but one render is enough
+    """
+    return bool(redis.set(REFRESH_KEY, 1, nx=True, px=hold_ms))
+
+
+def matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Whether an If-None-Match header names etag, so the client's copy is current
+    """
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag.strip('"') == etag:
+            return True
+    return False
@@ -1,7 +1,11 @@
+from dataclasses import dataclass
+from enum import Enum
 from typing import List
 
 from pydantic import BaseModel
 
+from nifty.common.types import Link
+
 
 class TrendingItem(BaseModel):
     id: int
@@ -26,3 +30,27 @@ class Url(BaseModel):
 class UrlRow(BaseModel):
     id: int
     url: str
+
+
+class ShortByLong(BaseModel):
+    long_url: str
+    short_url: str
+
+
+@dataclass(slots=True)
+class ShortenRow:
+    link: Link
+    # whether the statement inserted the link rather than found it
+    created: bool
+
+
+class LookupMode(Enum):
+    """
+    How get_long_url finds a link on a cache miss
+
+    join: by short_url text, through the short_url unique index
+    decode: base62 decode the short_url and probe long_url by primary key
+    """
+
+    join = "join"
+    decode = "decode"
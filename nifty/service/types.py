@@ -0,0 +1,20 @@
+from pydantic import BaseModel, HttpUrl, conlist
+
+# request bodies shared by the flask and asyncio apps
+
+
+class ShortenRequest(BaseModel):
+    long_url: HttpUrl
+
+
+MAX_BATCH_SIZE = 10000
+
+
+class ShortenBatchRequest(BaseModel):
+    long_urls: conlist(HttpUrl, min_items=1, max_items=MAX_BATCH_SIZE)  # type: ignore
+
+
+class ResolveBatchRequest(BaseModel):
+    short_urls: conlist(str, min_items=1, max_items=MAX_BATCH_SIZE)  # type: ignore
+    # publish a view action for every link found, like a redirect would
+    emit_views: bool = False
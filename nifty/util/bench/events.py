@@ -0,0 +1,69 @@
+import argparse
+import time
+from typing import Callable, List
+from uuid import uuid1
+
+from nifty.common.types import (
+    Action,
+    ActionType,
+    Channel,
+    EventFormat,
+    Meta,
+    TrendEvent,
+    TrendLinkEvent,
+    UpstreamSource,
+    decode_event,
+    encode_event,
+)
+
+# events a second on one core for each channel's event and format, encoding
+# as producers do and decoding as workers do, e.g.
+# python -m nifty.util.bench.events --count 200000
+
+
+def _rate(count: int, fn: Callable[[], object]) -> float:
+    start = time.perf_counter()
+    for _ in range(count):
+        fn()
+    return count / (time.perf_counter() - start)
+
+
+def _events() -> List[Meta]:
+    return [
+        Action(uuid=str(uuid1()), at=1678620136000, type=ActionType.get, link_id=42),
+        TrendEvent(uuid=str(uuid1()), at=1678620136000, added={1, 2, 3}, removed={4}),
+        TrendLinkEvent(
+            uuid=str(uuid1()),
+            at=1678620136000,
+            link_id=42,
+            added=True,
+            upstream=[
+                UpstreamSource(
+                    channel=Channel.trend, at=1678620135000, uuid=str(uuid1())
+                )
+            ],
+        ),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark the event formats")
+    parser.add_argument("--count", type=int, default=100000)
+    args = parser.parse_args()
+
+    print(f"{'event':<16}{'format':<8}{'bytes':>6}{'encode/s':>12}{'decode/s':>12}")
+    for event in _events():
+        cls = type(event)
+        for fmt in EventFormat:
+            data = encode_event(event, fmt)
+            assert decode_event(data, cls) == event
+            encode = _rate(args.count, lambda: encode_event(event, fmt))
+            decode = _rate(args.count, lambda: decode_event(data, cls))
+            print(
+                f"{cls.__name__:<16}{fmt.value:<8}{len(data):>6}"
+                f"{encode:>12,.0f}{decode:>12,.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
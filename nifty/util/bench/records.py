@@ -0,0 +1,105 @@
+import argparse
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Tuple
+from uuid import uuid1
+
+from pydantic import BaseModel
+
+from nifty.common.types import Action, ActionType, Link
+from nifty.service.store import postgres
+
+# the per lookup cost of the Link and Action records against the pydantic
+# models they replaced, e.g. python -m nifty.util.bench.records --count 200000
+
+
+class _ModelLink(BaseModel):
+    # Link as it was
+    id: int
+    created_at: datetime
+    long_url_id: int
+    short_url_id: int
+    long_url: str
+    short_url: str
+
+    def redis_dict(self) -> Dict[str, int | str]:
+        return {
+            **self.dict(exclude={"created_at"}),
+            "created_at": int(self.created_at.timestamp() * 1000),
+        }
+
+
+_CREATED_AT = datetime.fromtimestamp(1678620136, tz=timezone.utc)
+_ROW: Tuple[int, datetime, int, int, str, str] = (
+    7,
+    _CREATED_AT,
+    3,
+    5,
+    "https://www.google.com",
+    "3",
+)
+_COLUMNS = ["id", "created_at", "long_url_id", "short_url_id", "long_url", "short_url"]
+_HASH = {k: str(v) for k, v in Link(*_ROW).redis_dict().items()}
+
+
+def _rate(count: int, fn: Callable[[], Any]) -> float:
+    start = time.perf_counter()
+    for _ in range(count):
+        fn()
+    return count / (time.perf_counter() - start)
+
+
+def _bytes(fn: Callable[[], Any], count: int = 1000) -> float:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = [fn() for _ in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return (after - before) / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark the link records")
+    parser.add_argument("--count", type=int, default=100000)
+    args = parser.parse_args()
+
+    cursor = SimpleNamespace(description=[SimpleNamespace(name=c) for c in _COLUMNS])
+    make_link = postgres.link_row(cursor)  # type: ignore
+    model = _ModelLink.parse_obj(dict(zip(_COLUMNS, _ROW)))
+    link = Link(*_ROW)
+    cases = [
+        (
+            "from redis hash",
+            lambda: _ModelLink.parse_obj(_HASH),
+            lambda: Link.from_redis(_HASH),
+        ),
+        (
+            "from db row",
+            lambda: _ModelLink.parse_obj(dict(zip(_COLUMNS, _ROW))),
+            lambda: make_link(_ROW),
+        ),
+        ("redis_dict", model.redis_dict, link.redis_dict),
+        (
+            "new action",
+            lambda: Action(uuid=str(uuid1()), at=1, type=ActionType.get, link_id=7),
+            lambda: Action.new(ActionType.get, 7, 1),
+        ),
+    ]
+
+    print(f"{'':<16}{'model/s':>12}{'record/s':>12}")
+    for name, before, after in cases:
+        print(
+            f"{name:<16}{_rate(args.count, before):>12,.0f}"
+            f"{_rate(args.count, after):>12,.0f}"
+        )
+    print(
+        f"{'bytes per link':<16}{_bytes(lambda: _ModelLink.parse_obj(_HASH)):>12,.0f}"
+        f"{_bytes(lambda: Link.from_redis(_HASH)):>12,.0f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import argparse
+from dataclasses import asdict
+from typing import Iterator
+
+import psycopg
+
+from nifty.common import bloom, redis_helpers
+from nifty.common.helpers import none_throws
+from nifty.common.types import RedisType
+from nifty.service.store import shards
+
+# rebuild the known long urls bloom filter from postgres, run it with the
+# service's config, e.g.
+# APP_CONTEXT_CFG=nifty python -m nifty.util.cache.bloom
+
+
+def long_urls(batch_size: int) -> Iterator[str]:
+    # every shard, moved long urls are still in the shard that created them
+    count = shards.layout_from_cfg().count
+    for conninfo, _ in shards.shard_conninfos(count):
+        with psycopg.connect(conninfo) as conn:
+            # named cursor, so rows stream from the server batch_size at a time
+            with conn.cursor(name="bloom_rebuild") as cur:
+                cur.itersize = batch_size
+                cur.execute("SELECT url FROM long_url")
+                for (url,) in cur:
+                    yield url
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="rebuild the known long urls bloom filter"
+    )
+    parser.add_argument(
+        "--stats", action="store_true", help="print stats without rebuilding"
+    )
+    parser.add_argument("--batch-size", type=int, default=10000)
+    args = parser.parse_args()
+
+    spec = none_throws(bloom.spec_from_cfg(), f"[{bloom.BLOOM_CFG_KEY}] is not enabled")
+    bf = bloom.BloomFilter(redis_helpers.get_redis(RedisType.STD), spec)
+    if not args.stats:
+        count = bf.rebuild(long_urls(args.batch_size), args.batch_size)
+        print(f"added {count} long urls to {spec.key}")
+    print(asdict(bf.stats()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import argparse
+import time
+from typing import Dict
+
+from nifty.common import redis_helpers
+from nifty.common.types import Key, Link, RedisType
+from nifty.service.store import hot_keys, hot_links, shards
+from nifty.util.cache.warm import links_by_id, links_by_short_url
+
+# build the host's hot links file, see nifty.service.store.hot_links.  run it
+# next to the service with the service's config, e.g.
+# APP_CONTEXT_CFG=nifty python -m nifty.util.cache.hot_links --interval-sec 60
+
+
+def build(path: str, limit: int, batch_size: int) -> int:
+    """
+    The most viewed links from the trending list, topped up with the short
+    urls service processes saved as hot
+    """
+    # invalidations from here on still apply to the file
+    started_ms = int(time.time() * 1000)
+    layout = shards.layout_from_cfg()
+    redis = redis_helpers.get_redis(RedisType.STD)
+    links: Dict[str, Link] = {}
+
+    ids = [int(id) for id in redis.zrange(Key.trending, 0, limit - 1, desc=True)]
+    for batch in links_by_id(layout, ids, batch_size):
+        links.update({link.short_url: link for link in batch})
+
+    wanted = [s for s in hot_keys.load(redis, limit) if s not in links]
+    wanted = wanted[: max(0, limit - len(links))]
+    for batch in links_by_short_url(layout, wanted, batch_size):
+        links.update({link.short_url: link for link in batch})
+
+    return hot_links.write(path, links.values(), started_ms)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="build the hot links file")
+    parser.add_argument("--path", default=None, help="defaults to [hot-links] path")
+    parser.add_argument("--limit", type=int, default=100000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument(
+        "--interval-sec", type=float, default=0, help="rebuild this often, 0 is once"
+    )
+    args = parser.parse_args()
+
+    path = args.path or hot_links.path()
+    while True:
+        started = time.monotonic()
+        count = build(path, args.limit, args.batch_size)
+        print(f"wrote {count} links to {path} in {time.monotonic() - started:.1f}s")
+        if args.interval_sec <= 0:
+            break
+        time.sleep(max(0.0, args.interval_sec - (time.monotonic() - started)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import argparse
+from dataclasses import asdict
+from typing import Iterator
+
+import psycopg
+
+from nifty.common import id_bitmap, redis_helpers
+from nifty.common.helpers import none_throws
+from nifty.common.types import RedisType
+from nifty.service.base62 import base62_decode_strict
+from nifty.service.store import shards
+
+# rebuild the bitmap of short urls that have a link from postgres, run it with
+# the service's config, e.g.
+# APP_CONTEXT_CFG=nifty python -m nifty.util.cache.short_url_bitmap
+
+
+def short_url_ids(batch_size: int) -> Iterator[int]:
+    count = shards.layout_from_cfg().count
+    for conninfo, _ in shards.shard_conninfos(count):
+        with psycopg.connect(conninfo) as conn:
+            # named cursor, so rows stream from the server batch_size at a time
+            with conn.cursor(name="short_url_bitmap_rebuild") as cur:
+                cur.itersize = batch_size
+                cur.execute(
+                    "SELECT s.url FROM short_url s JOIN link k ON k.short_url_id = s.id"
+                )
+                for (url,) in cur:
+                    id = base62_decode_strict(url)
+                    if id is not None:
+                        yield id
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="rebuild the bitmap of short urls that have a link"
+    )
+    parser.add_argument(
+        "--stats", action="store_true", help="print stats without rebuilding"
+    )
+    parser.add_argument("--batch-size", type=int, default=10000)
+    args = parser.parse_args()
+
+    bitmap = none_throws(
+        id_bitmap.short_url_bitmap_from_cfg(redis_helpers.get_redis(RedisType.STD)),
+        f"[{id_bitmap.SHORT_URL_BITMAP_CFG_KEY}] is not enabled",
+    )
+    if not args.stats:
+        count = bitmap.rebuild(short_url_ids(args.batch_size), args.batch_size)
+        print(f"added {count} short urls to {bitmap.key}")
+    print(asdict(bitmap.stats()))
+
+
+if __name__ == "__main__":
+    main()
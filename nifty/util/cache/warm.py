@@ -0,0 +1,134 @@
+import argparse
+import time
+from typing import Dict, Iterator, List
+
+import psycopg
+
+from nifty.common import cfg, link_cache, redis_helpers
+from nifty.common.types import Key, Link, RedisType
+from nifty.service.store import hot_keys, postgres, queries, shards
+from nifty.service.store.shards import ShardLayout
+from nifty.service.store.types import LookupMode
+
+# fill redis-cache from postgres after a flush, failover or new cache node,
+# so redirects don't all miss at once.  run it with the service's config, e.g.
+# APP_CONTEXT_CFG=nifty python -m nifty.util.cache.warm --source trending
+#
+# recent: the newest --limit links of each shard
+# trending: the --limit most viewed links, from the trending list
+# hot: the --limit short urls service processes last saved as hot
+
+
+class _Pacer:
+    """
+    Sleeps just enough to keep to rate items a second, 0 is unlimited
+    """
+
+    def __init__(self, rate: float):
+        self.__rate = rate
+        self.__start = time.monotonic()
+        self.__sent = 0
+
+    def wait(self, n: int):
+        self.__sent += n
+        if self.__rate <= 0:
+            return
+        ahead = self.__sent / self.__rate - (time.monotonic() - self.__start)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+def recent_links(
+    layout: ShardLayout, limit: int, batch_size: int
+) -> Iterator[List[Link]]:
+    for conninfo, _ in shards.shard_conninfos(layout.count):
+        with psycopg.connect(conninfo) as conn:
+            # named cursor, so rows stream from the server batch_size at a time
+            with conn.cursor(name="warm", row_factory=postgres.link_row) as cur:
+                cur.itersize = batch_size
+                cur.execute(queries.recent_links_sql, (limit,))
+                while batch := cur.fetchmany(batch_size):
+                    yield batch
+
+
+def links_by_id(
+    layout: ShardLayout, ids: List[int], batch_size: int
+) -> Iterator[List[Link]]:
+    conns = [psycopg.connect(c) for c, _ in shards.shard_conninfos(layout.count)]
+    try:
+        for i in range(0, len(ids), batch_size):
+            by_shard: Dict[int, List[int]] = {}
+            for id in ids[i : i + batch_size]:
+                by_shard.setdefault(layout.shard_for_id(id), []).append(id)
+            for shard, shard_ids in by_shard.items():
+                with conns[shard].cursor(row_factory=postgres.link_row) as cur:
+                    cur.execute(queries.links_by_ids_sql, (shard_ids,))
+                    yield cur.fetchall()
+    finally:
+        for conn in conns:
+            conn.close()
+
+
+def links_by_short_url(
+    layout: ShardLayout, short_urls: List[str], batch_size: int
+) -> Iterator[List[Link]]:
+    lookup_mode = LookupMode(cfg.g_fb("nifty", "lookup_mode", LookupMode.join.value))
+    conns = [psycopg.connect(c) for c, _ in shards.shard_conninfos(layout.count)]
+    try:
+        for i in range(0, len(short_urls), batch_size):
+            by_shard: Dict[int, List[str]] = {}
+            for short_url in short_urls[i : i + batch_size]:
+                shard = layout.shard_for_short_url(short_url)
+                if shard is not None:
+                    by_shard.setdefault(shard, []).append(short_url)
+            for shard, shard_short_urls in by_shard.items():
+                query = queries.links_by_short_urls_query(lookup_mode, shard_short_urls)
+                if query is None:
+                    continue
+                wanted = set(shard_short_urls)
+                with conns[shard].cursor(row_factory=postgres.link_row) as cur:
+                    cur.execute(*query)
+                    yield [link for link in cur.fetchall() if link.short_url in wanted]
+    finally:
+        for conn in conns:
+            conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="warm redis-cache from postgres")
+    parser.add_argument(
+        "--source", choices=["recent", "trending", "hot"], default="recent"
+    )
+    parser.add_argument("--limit", type=int, default=100000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument(
+        "--rate", type=float, default=5000, help="links a second, 0 is unlimited"
+    )
+    args = parser.parse_args()
+
+    layout = shards.layout_from_cfg()
+    forward_ttl_sec = cfg.gint_fb("nifty", "forward_cache_ttl_sec", 0)
+    if args.source == "recent":
+        batches = recent_links(layout, args.limit, args.batch_size)
+    else:
+        redis = redis_helpers.get_redis(RedisType.STD)
+        if args.source == "trending":
+            ids = redis.zrange(Key.trending, 0, args.limit - 1, desc=True)
+            batches = links_by_id(layout, [int(id) for id in ids], args.batch_size)
+        else:
+            short_urls = hot_keys.load(redis, args.limit)
+            batches = links_by_short_url(layout, short_urls, args.batch_size)
+
+    cache = link_cache.from_cfg()
+    pacer = _Pacer(args.rate)
+    warmed = 0
+    for batch in batches:
+        # one pipeline per cache node
+        cache.put_links(batch, forward_ttl_sec)
+        warmed += len(batch)
+        pacer.wait(len(batch))
+    print(f"warmed {warmed} links from {args.source}")
+
+
+if __name__ == "__main__":
+    main()
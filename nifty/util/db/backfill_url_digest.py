@@ -0,0 +1,43 @@
+import argparse
+import time
+from typing import LiteralString
+
+import psycopg
+
+from nifty.service.store import postgres
+
+# fills long_url.url_digest for rows written before the column existed, in
+# short transactions walking the primary key so writers are never blocked
+# for long, e.g.
+# APP_CONTEXT_CFG=nifty python -m nifty.util.db.backfill_url_digest
+
+backfill_sql: LiteralString = """
+UPDATE long_url
+SET url_digest = long_url_digest(url)
+WHERE id >= %s AND id < %s AND url_digest IS NULL;
+"""
+
+
+def backfill(batch_size: int, pause_sec: float):
+    with psycopg.connect(postgres.conninfo(), autocommit=True) as conn:
+        row = conn.execute("SELECT COALESCE(MAX(id), 0) FROM long_url").fetchone()
+        max_id = row[0] if row else 0
+        total = 0
+        for lo in range(1, max_id + 1, batch_size):
+            total += conn.execute(backfill_sql, (lo, lo + batch_size)).rowcount
+            print(f"ids < {min(lo + batch_size, max_id + 1)} -> {total} rows updated")
+            time.sleep(pause_sec)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="backfill long_url.url_digest")
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument(
+        "--pause-ms", type=int, default=50, help="sleep between batches"
+    )
+    args = parser.parse_args()
+    backfill(args.batch_size, args.pause_ms / 1000)
+
+
+if __name__ == "__main__":
+    main()
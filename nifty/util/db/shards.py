@@ -0,0 +1,137 @@
+import argparse
+import os
+from typing import Dict, List, LiteralString, Tuple
+
+import psycopg
+from psycopg import sql
+
+from nifty.service.store import shards
+from nifty.service.store.shards import ShardLayout
+
+# tooling for the sharded store, see nifty.service.store.shards.ShardLayout
+#
+# adding a shard to a running store:
+# 1. create the database, PG_HOST=<new host> make db-apply
+# 2. add its [postgres-shard-<n>] section to the config
+# 3. python -m nifty.util.db.shards sequences --shard <n> --host <new host>
+# 4. python -m nifty.util.db.shards rebalance --from-count <n> --to-count <n+1>
+# 5. set [shards] count=<n+1> and roll the service
+#
+# turning a single database into shard 0 is step 3 with --shard 0, then
+# setting [shards] legacy_max_id to what it prints
+
+_tables = ["long_url", "short_url", "link"]
+
+alias_insert_sql: LiteralString = """
+INSERT INTO long_url_alias (url_digest, url, short_url)
+VALUES (long_url_digest(%s), %s, %s)
+ON CONFLICT (url_digest) DO NOTHING;
+"""
+
+# every long url a shard can answer for, and its short url
+homed_sql: LiteralString = """
+SELECT l.url, s.url
+FROM long_url l
+JOIN link k ON k.long_url_id = l.id
+JOIN short_url s ON s.id = k.short_url_id
+UNION ALL
+SELECT url, short_url FROM long_url_alias;
+"""
+
+
+def sequences(layout: ShardLayout, shard: int, host: str, port: int):
+    """
+    Point shard's sequences at its own ids, above every id already used
+    """
+    conninfo = (
+        f"postgresql://postgres:{os.environ['PG_ADMIN_PWD']}@{host}:{port}/postgres"
+    )
+    with psycopg.connect(conninfo) as conn:
+        max_id = layout.legacy_max_id
+        for t in _tables:
+            row = conn.execute(
+                sql.SQL("SELECT COALESCE(MAX(id), 0) FROM {0}").format(
+                    sql.Identifier(t)
+                )
+            ).fetchone()
+            max_id = max(max_id, row[0] if row else 0)
+
+        start = layout.first_id(shard, max_id)
+        for t in _tables:
+            seq = f"{t}_id_seq"
+            conn.execute(
+                sql.SQL("ALTER SEQUENCE {0} INCREMENT BY {1} RESTART WITH {2}").format(
+                    sql.Identifier(seq), sql.Literal(layout.slots), sql.Literal(start)
+                )
+            )
+            print(f"{seq} -> {start}, {start + layout.slots}, ...")
+        if shard == 0 and max_id > layout.legacy_max_id:
+            print(f"set [shards] legacy_max_id={max_id}")
+
+
+def rebalance(layout: ShardLayout, from_count: int, to_count: int, batch_size: int):
+    """
+    Copy an alias of every long url whose home moves to a new shard, so it
+    is still deduped after the shard count goes up
+    """
+    conninfos = [c for c, _ in shards.shard_conninfos(to_count)]
+    targets = {
+        shard: psycopg.connect(conninfos[shard], autocommit=True)
+        for shard in range(from_count, to_count)
+    }
+    try:
+        for shard in range(from_count):
+            pending: Dict[int, List[Tuple[str, str, str]]] = {}
+            copied = 0
+            with psycopg.connect(conninfos[shard]) as conn:
+                # named cursor, so rows stream from the server
+                with conn.cursor(name="rebalance") as cur:
+                    cur.itersize = batch_size
+                    cur.execute(homed_sql)
+                    for long_url, short_url in cur:
+                        home = layout.home_shard(long_url, to_count)
+                        if home == layout.home_shard(long_url, from_count):
+                            continue
+                        batch = pending.setdefault(home, [])
+                        batch.append((long_url, long_url, short_url))
+                        if len(batch) >= batch_size:
+                            copied += _copy(targets[home], batch)
+                            batch.clear()
+            for home, batch in pending.items():
+                copied += _copy(targets[home], batch)
+            print(f"shard {shard} -> {copied} aliases copied")
+    finally:
+        for conn in targets.values():
+            conn.close()
+
+
+def _copy(conn: psycopg.Connection[Tuple[str, ...]], batch: List[Tuple[str, str, str]]):
+    with conn.cursor() as cur:
+        cur.executemany(alias_insert_sql, batch)
+    return len(batch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="sharded store tooling")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    seq = sub.add_parser("sequences", help="set up a shard's id sequences")
+    seq.add_argument("--shard", type=int, required=True)
+    seq.add_argument("--host", required=True)
+    seq.add_argument("--port", type=int, default=5432)
+
+    reb = sub.add_parser("rebalance", help="alias long urls whose home moves")
+    reb.add_argument("--from-count", type=int, required=True)
+    reb.add_argument("--to-count", type=int, required=True)
+    reb.add_argument("--batch-size", type=int, default=1000)
+
+    args = parser.parse_args()
+    layout = shards.layout_from_cfg()
+    if args.command == "sequences":
+        sequences(layout, args.shard, args.host, args.port)
+    else:
+        rebalance(layout, args.from_count, args.to_count, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,8 @@ from redis.asyncio.client import Redis
 from nifty.common.asyncio import helpers
 from nifty.worker.common.types import ClaimNamespace
 
+_logger = logging.getLogger(__name__)
+
 
 @helpers.retry(max_tries=3, stack_id=__name__)
 async def claim(
@@ -26,5 +28,5 @@ async def claim(
         await pipe.watch(fqkey)
         pipe.multi()
         res = await pipe.incr(fqkey).expire(fqkey, lifetime_sec, nx=True).execute()
-        logging.debug(res)
+        _logger.debug(res)
         return int(res[0]) == 1
@@ -1,26 +1,60 @@
 # fixes stubs like redis that use generics when the code does not
 from __future__ import annotations
+import asyncio
 from asyncio import CancelledError
 
 import logging
+import os
+import socket
+import time
 from abc import ABC, abstractmethod
-from typing import Any, Callable, Dict, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 import aiorun
 from redis.asyncio.client import Redis, PubSub
-from nifty.common import log
+from redis.exceptions import ConnectionError, ResponseError, TimeoutError
+from nifty.common import cfg, log
 
 from nifty.common.asyncio import redis_helpers
-from nifty.common.types import Channel, RedisType
+from nifty.common.redis_helpers import (
+    get_event_format,
+    get_stream_maxlen,
+    get_transport,
+)
+from nifty.common.types import (
+    Channel,
+    EventFormat,
+    Meta,
+    RedisType,
+    Transport,
+    dead_letter_key,
+    encode_event,
+    stream_key,
+)
 from nifty.worker.common.asyncio import claim
 from nifty.worker.common.types import ClaimNamespace
 from nifty.worker.common.worker import BaseNiftyWorker, T_Worker
 
+_logger = logging.getLogger(__name__)
+
+
+# read without decode_responses, events may be binary
+_StreamEntry = Tuple[bytes, Optional[Dict[bytes, bytes]]]
+
+# wait between attempts to reach redis after losing it, doubling up to the max
+_MIN_BACKOFF_SEC = 0.5
+_MAX_BACKOFF_SEC = 30.0
+
 
 class NiftyWorker(BaseNiftyWorker[T_Worker], ABC):
     def __init__(self, claim_namespace: ClaimNamespace):
         super().__init__()
         self.__redis: Optional[Redis[str]] = None
         self.__claim_namespace = claim_namespace
+        self.__transport = Transport.pubsub
+        self.__stream_maxlen = 100000
+        self.__event_format = EventFormat.json
+        self.__stream_max_deliveries = 5
+        self.__backoff_sec = _MIN_BACKOFF_SEC
 
     async def before_start(self):
         ...
@@ -43,6 +77,18 @@ class NiftyWorker(BaseNiftyWorker[T_Worker], ABC):
             self.__redis = redis_helpers.get_redis(RedisType.STD)
         return self.__redis
 
+    async def emit(self, channel: Channel, event: Meta):
+        """
+        Send an event downstream with the same transport this worker consumes
+        """
+        await redis_helpers.emit(
+            self.redis(),
+            channel,
+            encode_event(event, self.__event_format),
+            transport=self.__transport,
+            stream_maxlen=self.__stream_maxlen,
+        )
+
     async def __handle(self, channel: Channel, msg: Dict[str, Any]):
         if not msg:
             await self.on_yield()
@@ -50,18 +96,204 @@ class NiftyWorker(BaseNiftyWorker[T_Worker], ABC):
 
         event = self.unpack(msg)
         if self.filter(event):
-            logging.debug(event)
+            _logger.debug(event)
             claimed = await claim.claim(
                 self.redis(), self.__claim_namespace, event.uuid
             )
             if claimed:
                 await self.on_event(channel, event)
 
+    async def __handle_entries(
+        self, channel: Channel, group: str, entries: List[_StreamEntry]
+    ):
+        """
+        Process stream entries, the consumer group already guarantees each one
+        is delivered to a single consumer so there is no claim.  Entries that
+        fail stay pending and get reclaimed later.
+        """
+        done: List[bytes] = []
+        for entry_id, fields in entries:
+            if fields is None:
+                # trimmed away while pending, nothing to do but ack
+                done.append(entry_id)
+                continue
+            try:
+                event = self.unpack({k.decode(): v for k, v in fields.items()})
+                if self.filter(event):
+                    _logger.debug(event)
+                    await self.on_event(channel, event)
+                done.append(entry_id)
+            except CancelledError:
+                raise
+            except Exception as e:
+                _logger.exception(
+                    f"failed to process {entry_id}, leaving it pending: {e}"
+                )
+        if done:
+            await self.redis().xack(stream_key(channel), group, *done)
+
+    async def __dead_letter(
+        self, r: Redis[str], channel: Channel, group: str, entries: List[_StreamEntry]
+    ) -> List[_StreamEntry]:
+        """
+        Move entries delivered more than stream_max_deliveries times to the
+        channel's dead letter stream and ack them, so an event that always
+        fails isn't reclaimed forever
+
+        :return: the entries still worth handling
+        """
+        if self.__stream_max_deliveries <= 0 or not entries:
+            return entries
+        stream = stream_key(channel)
+        async with r.pipeline(transaction=False) as pipe:
+            for entry_id, _ in entries:
+                pipe.xpending_range(stream, group, min=entry_id, max=entry_id, count=1)
+            pending: List[List[Dict[str, Any]]] = await pipe.execute()
+
+        keep: List[_StreamEntry] = []
+        dead: List[bytes] = []
+        async with r.pipeline(transaction=False) as pipe:
+            for (entry_id, fields), info in zip(entries, pending):
+                if (
+                    not info
+                    or info[0]["times_delivered"] <= self.__stream_max_deliveries
+                ):
+                    keep.append((entry_id, fields))
+                    continue
+                _logger.error(
+                    f"{entry_id} delivered {info[0]['times_delivered']} times,"
+                    " moving it to the dead letter stream"
+                )
+                dead.append(entry_id)
+                if fields is not None:
+                    pipe.xadd(
+                        dead_letter_key(channel),
+                        {**fields, b"id": entry_id},
+                        maxlen=self.__stream_maxlen,
+                        approximate=True,
+                    )
+            if dead:
+                pipe.xack(stream, group, *dead)
+                await pipe.execute()
+        return keep
+
+    async def __listen_stream(
+        self,
+        src_channel: Channel,
+        listen_interval: float,
+        batch_size: int,
+        reclaim_idle_ms: int,
+    ):
+        """
+        Consume the stream until cancelled, reconnecting with backoff when
+        redis goes away, and recreating the group when it disappears
+        """
+        stream = stream_key(src_channel)
+        while True:
+            try:
+                await self.__consume_stream(
+                    src_channel, listen_interval, batch_size, reclaim_idle_ms
+                )
+            except CancelledError:
+                _logger.info("Cancelled")
+                break
+            except (ConnectionError, TimeoutError) as e:
+                _logger.warning(
+                    f"lost {stream}, reconnecting in {self.__backoff_sec}s: {e}"
+                )
+                await asyncio.sleep(self.__backoff_sec)
+                self.__backoff_sec = min(self.__backoff_sec * 2, _MAX_BACKOFF_SEC)
+            except ResponseError as e:
+                # flushed, cleaned up or failed over to an empty replica,
+                # starting over creates the stream and group again
+                if "NOGROUP" not in str(e):
+                    raise
+                _logger.warning(f"{stream} lost its consumer group, recreating: {e}")
+
+    async def __consume_stream(
+        self,
+        src_channel: Channel,
+        listen_interval: float,
+        batch_size: int,
+        reclaim_idle_ms: int,
+    ):
+        r = redis_helpers.get_redis(RedisType.STD, decode_responses=False)
+        try:
+            await self.__read_stream(
+                r, src_channel, listen_interval, batch_size, reclaim_idle_ms
+            )
+        finally:
+            await r.close()
+
+    async def __read_stream(
+        self,
+        r: Redis[str],
+        src_channel: Channel,
+        listen_interval: float,
+        batch_size: int,
+        reclaim_idle_ms: int,
+    ):
+        stream = stream_key(src_channel)
+        group = self.__claim_namespace.value
+        consumer = f"{socket.gethostname()}:{os.getpid()}"
+        try:
+            await r.xgroup_create(stream, group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+        # replay anything this consumer read but never acked before a restart
+        last_id: str | bytes = "0"
+        while True:
+            resp = await r.xreadgroup(
+                group, consumer, {stream: last_id}, count=batch_size
+            )
+            self.__backoff_sec = _MIN_BACKOFF_SEC
+            entries: List[_StreamEntry] = resp[0][1] if resp else []
+            if not entries:
+                break
+            last_id = entries[-1][0]
+            entries = await self.__dead_letter(r, src_channel, group, entries)
+            await self.__handle_entries(src_channel, group, entries)
+
+        last_reclaim = 0.0
+        while True:
+            # take over entries from consumers that died holding them, and
+            # retry our own that failed
+            if time.monotonic() - last_reclaim > reclaim_idle_ms / 1000:
+                last_reclaim = time.monotonic()
+                claimed = await r.xautoclaim(
+                    stream, group, consumer, reclaim_idle_ms, count=batch_size
+                )
+                if claimed and claimed[1]:
+                    _logger.info("reclaimed %s pending entries", len(claimed[1]))
+                    entries = await self.__dead_letter(
+                        r, src_channel, group, claimed[1]
+                    )
+                    await self.__handle_entries(src_channel, group, entries)
+
+            _logger.debug("Reading %s for %s seconds", stream, listen_interval)
+            resp = await r.xreadgroup(
+                group,
+                consumer,
+                {stream: ">"},
+                count=batch_size,
+                block=int(listen_interval * 1000),
+            )
+            self.__backoff_sec = _MIN_BACKOFF_SEC
+            if not resp:
+                await self.on_yield()
+                continue
+            for _, entries in resp:
+                await self.__handle_entries(src_channel, group, entries)
+
     async def __listen(
         self, pubsub: PubSub, src_channel: Channel, listen_interval: float
     ):
         while True:
-            logging.debug(f"Listening to {src_channel} for {listen_interval} seconds")
+            _logger.debug(
+                "Listening to %s for %s seconds", src_channel, listen_interval
+            )
             msg: Dict[
                 str, Any
             ] = await pubsub.get_message(  # pyright: ignore [reportUnknownMemberType]
@@ -72,29 +304,60 @@ class NiftyWorker(BaseNiftyWorker[T_Worker], ABC):
                 # TODO probably should do something smater here if we've already pulled the message
                 await self.__handle(src_channel, msg)
             except CancelledError:
-                logging.info("Cancelled")
+                _logger.info("Cancelled")
                 break
 
     async def run(
-        self, *, src_channel: Channel, listen_interval: Optional[float] = 0.5
+        self,
+        *,
+        src_channel: Channel,
+        listen_interval: Optional[float] = 0.5,
+        transport: Transport = Transport.pubsub,
+        stream_maxlen: int = 100000,
+        stream_batch_size: int = 500,
+        stream_reclaim_idle_ms: int = 60000,
+        stream_max_deliveries: int = 5,
+        event_format: EventFormat = EventFormat.json,
     ):
+        """
+        Consume src_channel until cancelled
+
+        With Transport.stream, workers sharing a ClaimNamespace form a consumer
+        group, each reading up to stream_batch_size entries per call.
+        Entries pending for more than stream_reclaim_idle_ms are taken over
+        from whichever consumer held them.  Entries delivered more than
+        stream_max_deliveries times go to the channel's dead letter stream
+        instead, 0 retries forever.  A lost connection is retried with
+        backoff.  Events are read in any format and emitted as event_format.
+        """
+        self.__transport = transport
+        self.__stream_maxlen = stream_maxlen
+        self.__stream_max_deliveries = stream_max_deliveries
+        self.__event_format = event_format
         try:
             if listen_interval is None or listen_interval <= 0:
                 raise Exception("You must set listen_interval > 0")
             await self.before_start()
-            redis = redis_helpers.get_redis(
-                RedisType.STD
-            )  # STD does not have LRU memory limit
+            if transport == Transport.stream:
+                await self.__listen_stream(
+                    src_channel,
+                    listen_interval,
+                    stream_batch_size,
+                    stream_reclaim_idle_ms,
+                )
+                return
+            # STD does not have LRU memory limit
+            redis = redis_helpers.get_redis(RedisType.STD, decode_responses=False)
             async with redis.pubsub(  # pyright: ignore [reportUnknownMemberType]
                 ignore_subscribe_messages=True
             ) as pubsub:
                 await pubsub.subscribe(  # pyright: ignore [reportUnknownMemberType]
                     src_channel
                 )
-                logging.debug(f"Subscribed to {src_channel}")
+                _logger.debug("Subscribed to %s", src_channel)
                 await self.__listen(pubsub, src_channel, listen_interval)
         except CancelledError:
-            logging.info("Cancelled")
+            _logger.info("Cancelled")
 
 
 def start(worker_ctor: Callable[[], NiftyWorker[T_Worker]], src_channel: Channel):
@@ -102,4 +365,16 @@ def start(worker_ctor: Callable[[], NiftyWorker[T_Worker]], src_channel: Channel
     Starts the worker
     """
     log.log_init()
-    aiorun.run(worker_ctor().run(src_channel=src_channel))
+    aiorun.run(
+        worker_ctor().run(
+            src_channel=src_channel,
+            transport=get_transport(),
+            stream_maxlen=get_stream_maxlen(),
+            stream_batch_size=cfg.gint_fb("redis", "stream_batch_size", 500),
+            stream_reclaim_idle_ms=cfg.gint_fb(
+                "redis", "stream_reclaim_idle_ms", 60000
+            ),
+            stream_max_deliveries=cfg.gint_fb("redis", "stream_max_deliveries", 5),
+            event_format=get_event_format(),
+        )
+    )
@@ -11,6 +11,8 @@ from nifty.common.redis_helpers import get_redis
 from nifty.common.types import Channel, Meta, RedisType
 from .claim import claim
 
+_logger = logging.getLogger(__name__)
+
 T_Worker = TypeVar("T_Worker", bound=Meta)
 
 
@@ -69,7 +71,7 @@ class NiftyWorker(BaseNiftyWorker[T_Worker], ABC):
 
         event = self.unpack(msg)
         if self.filter(event):
-            logging.getLogger(__name__).debug(event)
+            _logger.debug(event)
             if claim(self.redis(), f"{self.__class__}:{event.uuid}", 60):
                 self.on_event(channel, event)
 
@@ -78,9 +80,9 @@ class NiftyWorker(BaseNiftyWorker[T_Worker], ABC):
         if listen_interval is None or listen_interval <= 0:
             raise Exception("You must set listen_interval > 0")
         self.before_start()
-        redis = get_redis(
-            RedisType.STD
-        )  # docs say to use diff reais for read, not sure this is true
+        # docs say to use diff reais for read, not sure this is true
+        # and events may be binary
+        redis = get_redis(RedisType.STD, decode_responses=False)
         pubsub = redis.pubsub(ignore_subscribe_messages=True)
         pubsub.subscribe(src_channel)
         while self.is_running():
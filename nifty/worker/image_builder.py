@@ -5,7 +5,7 @@ from typing import Any, Dict
 # from PIL import Image
 # from selenium import webdriver
 # from nifty.common.helpers import timestamp_ms
-from nifty.common.types import Channel, TrendLinkEvent
+from nifty.common.types import Channel, TrendLinkEvent, decode_event
 from nifty.worker.common.asyncio import worker
 from nifty.worker.common.asyncio.worker import NiftyWorker
 from nifty.worker.common.types import ClaimNamespace
@@ -54,7 +54,7 @@ class ImageBuilderWorker(NiftyWorker[TrendLinkEvent]):
         ...
 
     def unpack(self, msg: Dict[str, Any]) -> TrendLinkEvent:
-        return TrendLinkEvent.parse_raw(msg["data"])
+        return decode_event(msg["data"], TrendLinkEvent)
 
 
 if __name__ == "__main__":
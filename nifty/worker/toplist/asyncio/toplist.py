@@ -26,6 +26,8 @@ from nifty.common.asyncio import helpers
 from nifty.common.helpers import noneint_throws
 from nifty.common.types import Key
 
+_logger = logging.getLogger(__name__)
+
 _EntryKey = TypeVar("_EntryKey", bound=str | int)
 _OriginalRet = TypeVar("_OriginalRet")
 _OriginalFunc = Callable[..., Coroutine[Any, Any, _OriginalRet]]
@@ -169,33 +171,33 @@ class RedisTopList(AbstractTopList[_EntryKey]):
             latest: Optional[bytes] = cast(
                 Optional[bytes], await pipe.lindex(self.buckets_list, 0)
             )
-            logging.debug(f"latest key = {latest}")
+            _logger.debug("latest key = %s", latest)
             latest_bucket_key = int(latest) if latest else None
 
             # if this is a newer bucket
             if not latest_bucket_key or latest_bucket_key < bucket_key:
                 # add it to the set
-                logging.debug(f"pushing bucket {bucket_key}")
+                _logger.debug("pushing bucket %s", bucket_key)
                 pipe.multi()
                 # noinspection PyUnresolvedReferences
                 await pipe.lpush(self.buckets_list, bucket_key).execute()
 
             # else see if this bucket is at the expected index
             else:
-                logging.debug(f"matching bucket {bucket_key}")
+                _logger.debug("matching bucket %s", bucket_key)
                 expected_list_index = int(
                     (latest_bucket_key - bucket_key) / self.bucket_len_sec
                 )
                 kai_raw = await pipe.lindex(self.buckets_list, expected_list_index)
                 key_at_index = cast(Optional[bytes], kai_raw)
                 if not key_at_index:
-                    logging.warning(
+                    _logger.warning(
                         f"can't increment key '{key}', expected "
                         f"'{bucket_key}' but none found"
                     )
                     return
                 elif int(key_at_index) != bucket_key:
-                    logging.warning(
+                    _logger.warning(
                         f"can't increment key '{key}', expected "
                         f"'{bucket_key}' but found {int(key_at_index)}"
                     )
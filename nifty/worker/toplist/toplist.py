@@ -127,7 +127,7 @@ class RedisTopList(AbstractTopList[_EntryKey]):
                     return
 
                 oldest_sec = int(oldest_sec_str)
-                _logger.debug(f"ts={ts_ms} oldest_sec={oldest_sec}")
+                _logger.debug("ts=%s oldest_sec=%s", ts_ms, oldest_sec)
                 if int(ts_ms / 1000) - oldest_sec < self.max_age():
                     return
 
@@ -225,20 +225,20 @@ class RedisTopList(AbstractTopList[_EntryKey]):
             latest: Optional[bytes] = cast(
                 Optional[bytes], pipe.lindex(self.buckets_list, 0)
             )
-            _logger.debug(f"latest key = {latest}")
+            _logger.debug("latest key = %s", latest)
             latest_bucket_key = int(latest) if latest else None
 
             # if this is a newer bucket
             if not latest_bucket_key or latest_bucket_key < bucket_key:
                 # add it to the set
-                _logger.debug(f"pushing bucket {bucket_key}")
+                _logger.debug("pushing bucket %s", bucket_key)
                 pipe.multi()
                 pipe.lpush(self.buckets_list, bucket_key)
                 pipe.execute()
 
             # else see if this bucket is at the expected index
             else:
-                _logger.debug(f"matching bucket {bucket_key}")
+                _logger.debug("matching bucket %s", bucket_key)
                 expected_list_index = int(
                     (latest_bucket_key - bucket_key) / self.bucket_len_sec()
                 )
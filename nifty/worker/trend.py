@@ -6,11 +6,14 @@ from nifty.common import cfg
 from nifty.common.helpers import none_throws, timestamp_ms
 from nifty.common.asyncio import redis_helpers
 from nifty.common.types import Action, ActionType, Channel, Key, TrendEvent
+from nifty.common.types import decode_event
 from .common.asyncio.worker import NiftyWorker
 from .common.types import ClaimNamespace
 from .toplist.asyncio.toplist import AbstractTopList, RedisTopList
 from .common.asyncio import worker
 
+_logger = logging.getLogger(__name__)
+
 # redis doesn't really have great datastructures for this
 # time series would have been best, but it doesn't support
 # dynamic labels or aggregations limits in order
@@ -48,12 +51,12 @@ class TrendWorker(NiftyWorker[Action]):
         await self.__set_size()
 
         async def on_toplist_change(added: Set[int], removed: Set[int]):
-            logging.debug(f"Added: {added}  Removed: {removed}")
-            await self.redis().publish(
+            _logger.debug("Added: %s  Removed: %s", added, removed)
+            await self.emit(
                 Channel.trend,
                 TrendEvent(
                     uuid=str(uuid1()), at=timestamp_ms(), added=added, removed=removed
-                ).json(),
+                ),
             )
 
         self._toplist = RedisTopList[int](
@@ -66,7 +69,7 @@ class TrendWorker(NiftyWorker[Action]):
         )
 
     def unpack(self, msg: Dict[str, Any]) -> Action:
-        return Action.parse_raw(msg["data"])
+        return decode_event(msg["data"], Action)
 
     def filter(self, msg: Action) -> bool:
         return msg.type == ActionType.get
@@ -4,20 +4,22 @@ from uuid import uuid1
 
 from nifty.common import helpers
 from nifty.common.types import Channel, TrendEvent, TrendLinkEvent, UpstreamSource
+from nifty.common.types import decode_event
 from nifty.worker.common.asyncio import worker
 from nifty.worker.common.asyncio.worker import NiftyWorker
 from nifty.worker.common.types import ClaimNamespace
 
+_logger = logging.getLogger(__name__)
+
 
 class TrendLinkWorker(NiftyWorker[TrendEvent]):
     def __init__(self):
         super().__init__(ClaimNamespace.trend_link)
 
     async def on_event(self, channel: Channel, msg: TrendEvent):
-        r = self.redis()
         upstream = UpstreamSource(channel=channel, at=msg.at, uuid=msg.uuid)
         for c in [(a, True) for a in msg.added] + [(r, False) for r in msg.removed]:
-            logging.debug("publishing evt")
+            _logger.debug("publishing evt")
             evt = TrendLinkEvent(
                 uuid=str(uuid1()),
                 at=helpers.timestamp_ms(),
@@ -25,13 +27,13 @@ class TrendLinkWorker(NiftyWorker[TrendEvent]):
                 added=c[1],
                 upstream=[upstream],
             )
-            await r.publish(Channel.trend_link, evt.json())
+            await self.emit(Channel.trend_link, evt)
 
     async def on_yield(self):
         ...
 
     def unpack(self, msg: Dict[str, Any]) -> TrendEvent:
-        return TrendEvent.parse_raw(msg["data"])
+        return decode_event(msg["data"], TrendEvent)
 
 
 if __name__ == "__main__":
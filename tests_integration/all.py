@@ -7,6 +7,7 @@ from flask.testing import FlaskClient
 import time
 
 from nifty.common.types import Action, ActionType, Meta, TrendEvent, TrendLinkEvent
+from nifty.common.types import decode_event
 from nifty.service.store.types import Trending
 
 long_url_fixture = (
@@ -60,7 +61,7 @@ _T_Event = TypeVar("_T_Event", bound=Meta)
 
 def assert_msg(msg: Dict[str, Any], event_type: Type[_T_Event]) -> _T_Event:
     assert msg["data"]
-    event = event_type.parse_raw(msg["data"])
+    event = decode_event(msg["data"], event_type)
     assert event.at
     assert event.uuid
     return event
@@ -173,3 +174,52 @@ def test_idempotent_post(client: FlaskClient, redis: Redis[str]):
     psl.join()
     assert msgs.qsize() == 1
     assert_action(msgs.get_nowait(), ActionType.create)
+
+
+def test_shorten_batch(client: FlaskClient):
+    long_urls = [f"https://www.example.com/batch/{i}" for i in range(50)]
+    # a repeat and one that exists already
+    long_urls.append(long_urls[0])
+    res = client.post("/shorten", json={"long_url": "https://www.example.com/single"})
+    assert res.json
+    single = res.json["short_url"]
+    long_urls.append("https://www.example.com/single")
+
+    res = client.post("/shorten/batch", json={"long_urls": long_urls})
+    assert res.status_code == 201
+    assert res.json
+    short_urls = res.json["short_urls"]
+    assert len(short_urls) == len(long_urls)
+    assert short_urls[0] == short_urls[50]
+    assert short_urls[51] == single
+    assert len(set(short_urls)) == 51
+
+    # results come back in request order
+    for long_url, short_url in zip(long_urls[:3], short_urls[:3]):
+        res = client.get(f"/{short_url}")
+        assert res.status_code == 302
+        assert res.headers["Location"] == long_url
+
+    # everything exists now
+    res = client.post("/shorten/batch", json={"long_urls": long_urls})
+    assert res.status_code == 200
+    assert res.json
+    assert res.json["short_urls"] == short_urls
+
+
+def test_resolve_batch(client: FlaskClient):
+    long_urls = [f"https://www.example.com/resolve/{i}" for i in range(20)]
+    res = client.post("/shorten/batch", json={"long_urls": long_urls})
+    assert res.json
+    short_urls = res.json["short_urls"]
+
+    res = client.post(
+        "/resolve/batch",
+        json={"short_urls": short_urls + ["zzzzzzzzz"], "emit_views": True},
+    )
+    assert res.status_code == 200
+    assert res.json
+    assert res.json["long_urls"] == dict(zip(short_urls, long_urls))
+
+    res = client.post("/resolve/batch", json={"short_urls": []})
+    assert res.status_code == 400
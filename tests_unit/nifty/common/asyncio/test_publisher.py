@@ -0,0 +1,91 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock, call
+
+from nifty.common.asyncio.publisher import AsyncBatchPublisher
+from nifty.common.publisher import QueueFullPolicy
+from nifty.common.types import Transport
+
+
+class TestAsyncPublisher(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.redis = MagicMock()
+        # commands are queued on a pipeline, only execute is awaited
+        self.pipe = MagicMock()
+        self.redis.pipeline.return_value.__aenter__.return_value = self.pipe
+        self.pipe.execute = AsyncMock()
+
+    async def test_close_flushes(self):
+        publisher = AsyncBatchPublisher(self.redis, batch_size=2)
+        self.assertTrue(await publisher.publish("a", "1"))
+        self.assertTrue(await publisher.publish("b", "2"))
+        self.assertTrue(await publisher.publish("a", "3"))
+        self.assertEqual(publisher.stats().pending, 3)
+
+        await publisher.close()
+        self.assertEqual(
+            self.pipe.publish.mock_calls,
+            [call("a", "1"), call("b", "2"), call("a", "3")],
+        )
+        self.redis.pipeline.assert_called_with(transaction=False)
+        stats = publisher.stats()
+        self.assertEqual(stats.published, 3)
+        self.assertEqual(stats.pending, 0)
+
+    async def test_stream_transport(self):
+        publisher = AsyncBatchPublisher(
+            self.redis, transport=Transport.stream, stream_maxlen=10
+        )
+        await publisher.publish("a", "1")
+        await publisher.close()
+        self.pipe.xadd.assert_called_once_with(
+            "a:stream", {"data": "1"}, maxlen=10, approximate=True
+        )
+        self.pipe.publish.assert_not_called()
+
+    async def test_flush_task_batches(self):
+        publisher = AsyncBatchPublisher(
+            self.redis, batch_size=2, flush_interval_sec=0.01
+        )
+        publisher.start()
+        for i in range(5):
+            await publisher.publish("a", str(i))
+
+        for _ in range(200):
+            if publisher.stats().published == 5:
+                break
+            await asyncio.sleep(0.01)
+        await publisher.close()
+
+        stats = publisher.stats()
+        self.assertEqual(stats.published, 5)
+        self.assertGreaterEqual(stats.batches, 3)
+        self.assertEqual(
+            self.pipe.publish.mock_calls, [call("a", str(i)) for i in range(5)]
+        )
+
+    async def test_drop_when_full(self):
+        publisher = AsyncBatchPublisher(self.redis, max_queue=1)
+        self.assertTrue(await publisher.publish("a", "1"))
+        self.assertFalse(await publisher.publish("a", "2"))
+        self.assertEqual(publisher.stats().dropped, 1)
+
+    async def test_block_when_full(self):
+        publisher = AsyncBatchPublisher(
+            self.redis,
+            max_queue=1,
+            policy=QueueFullPolicy.block,
+            block_timeout_sec=0.01,
+        )
+        self.assertTrue(await publisher.publish("a", "1"))
+        self.assertFalse(await publisher.publish("a", "2"))
+        self.assertEqual(publisher.stats().dropped, 1)
+
+    async def test_redis_failure_is_counted(self):
+        self.pipe.execute.side_effect = ConnectionError("down")
+        publisher = AsyncBatchPublisher(self.redis)
+        await publisher.publish("a", "1")
+        with self.assertLogs("nifty.common.asyncio.publisher", level="WARNING"):
+            await publisher.close()
+        self.assertEqual(publisher.stats().failed, 1)
+        self.assertEqual(publisher.stats().published, 0)
@@ -0,0 +1,73 @@
+import math
+import unittest
+from unittest.mock import MagicMock, Mock
+
+from nifty.common import bloom
+from nifty.common.bloom import BloomFilter, BloomSpec
+
+
+class TestBloom(unittest.TestCase):
+    def test_spec_sizing(self):
+        spec = BloomSpec(1000000, 0.01)
+        # ~9.6 bits per item and 7 hashes for 1%
+        self.assertEqual(spec.bits, 9585059)
+        self.assertEqual(spec.hashes, 7)
+        self.assertEqual(spec.key, "nifty:bloom:longurl:9585059.7")
+
+    def test_spec_invalid(self):
+        self.assertRaises(ValueError, BloomSpec, 0, 0.01)
+        self.assertRaises(ValueError, BloomSpec, 10, 1)
+
+    def test_positions(self):
+        spec = BloomSpec(1000, 0.01)
+        positions = spec.positions("https://www.google.com")
+        self.assertEqual(len(positions), spec.hashes)
+        self.assertTrue(all(0 <= p < spec.bits for p in positions))
+        self.assertEqual(positions, spec.positions("https://www.google.com"))
+        self.assertNotEqual(positions, spec.positions("https://www.bing.com"))
+
+    def test_might_contain(self):
+        redis = Mock()
+        redis.evalsha.return_value = 0
+        spec = BloomSpec(1000, 0.01)
+        self.assertFalse(BloomFilter(redis, spec).might_contain("a"))
+        args = redis.evalsha.call_args.args
+        self.assertEqual(args[0], bloom.BLOOM_CHECK.sha)
+        self.assertEqual(args[1:3], (1, spec.key))
+        self.assertEqual(list(args[3:]), spec.positions("a"))
+
+    def test_add_many(self):
+        redis = Mock()
+        spec = BloomSpec(1000, 0.01)
+        BloomFilter(redis, spec).add_many(["a", "b"])
+        args = redis.evalsha.call_args.args
+        self.assertEqual(args[1:4], (2, spec.key, spec.building_key))
+        self.assertEqual(list(args[4:]), spec.positions("a") + spec.positions("b"))
+
+    def test_rebuild(self):
+        redis = Mock()
+        spec = BloomSpec(1000, 0.01)
+        count = BloomFilter(redis, spec).rebuild(iter(["a", "b", "c"]), batch_size=2)
+        self.assertEqual(count, 3)
+        self.assertEqual(redis.evalsha.call_count, 2)
+        redis.setbit.assert_called_once_with(spec.building_key, spec.bits - 1, 0)
+        redis.rename.assert_called_once_with(spec.building_key, spec.key)
+
+    def test_stats(self):
+        redis = MagicMock()
+        pipe = redis.pipeline.return_value.__enter__.return_value
+        spec = BloomSpec(1000, 0.01)
+        pipe.execute.return_value = [1, spec.bits // 2]
+        stats = BloomFilter(redis, spec).stats()
+        self.assertTrue(stats.ready)
+        self.assertAlmostEqual(stats.fill_ratio, 0.5, places=3)
+        self.assertAlmostEqual(stats.estimated_fpr, 0.5**spec.hashes, places=3)
+        self.assertEqual(
+            stats.estimated_items, round(spec.bits / spec.hashes * math.log(2))
+        )
+
+    def test_stats_full(self):
+        spec = BloomSpec(10, 0.5)
+        stats = bloom.bloom_stats(spec, True, spec.bits)
+        self.assertEqual(stats.estimated_fpr, 1)
+        self.assertIsNone(stats.estimated_items)
@@ -22,6 +22,7 @@ app_text = """
 [db]
 user=${FOO_DB_USER}
 backoff=.6
+pooled=on
 
 """
 
@@ -129,3 +130,13 @@ class TestCfg(unittest.TestCase):
 
         with self.assertRaises(Exception):
             cfg.g("db", "foo")
+
+    def test_optional_operations(
+        self,
+    ):
+        cfg.init(app_name=AppContextName.nifty, primary_cfg="local")
+        self.assertEqual(cfg.gbool_fb("db", "pooled", False), True)
+        self.assertEqual(cfg.gbool_fb("db", "foo", False), False)
+        self.assertEqual(cfg.gbool_fb("foo", "pooled", True), True)
+        self.assertIsNone(cfg.g_opt("foo", "port"))
+        self.assertEqual(cfg.gint_fb("foo", "port", 789), 789)
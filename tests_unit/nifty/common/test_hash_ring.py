@@ -0,0 +1,67 @@
+import unittest
+
+from nifty.common.hash_ring import HashRing
+
+
+class TestHashRing(unittest.TestCase):
+    def setUp(self) -> None:
+        self.now = 1000.0
+        self.keys = [f"key{i}" for i in range(5000)]
+
+    def ring(self, *names: str) -> HashRing[str]:
+        return HashRing({n: n for n in names}, down_sec=5, clock=lambda: self.now)
+
+    def owners(self, ring: HashRing[str]):
+        return {k: ring.node(k) for k in self.keys}
+
+    def test_spread(self):
+        owners = self.owners(self.ring("a", "b", "c"))
+        for name in ["a", "b", "c"]:
+            share = sum(1 for o in owners.values() if o and o[0] == name)
+            self.assertTrue(1300 < share < 2000, share)
+
+    def test_adding_a_node_moves_a_share(self):
+        before = self.owners(self.ring("a", "b", "c"))
+        after = self.owners(self.ring("a", "b", "c", "d"))
+        moved = [k for k in self.keys if before[k] != after[k]]
+        # about a quarter, and only to the new node
+        self.assertTrue(900 < len(moved) < 1600, len(moved))
+        for k in moved:
+            self.assertEqual(after[k], ("d", "d"))
+
+    def test_down_node_is_routed_around(self):
+        ring = self.ring("a", "b", "c")
+        before = self.owners(ring)
+        ring.mark_down("b")
+        self.assertTrue(ring.is_down("b"))
+        after = self.owners(ring)
+        for k in self.keys:
+            if before[k] == ("b", "b"):
+                self.assertIn(after[k], [("a", "a"), ("c", "c")])
+            else:
+                self.assertEqual(after[k], before[k])
+
+        self.now += 5
+        self.assertFalse(ring.is_down("b"))
+        self.assertEqual(self.owners(ring), before)
+
+    def test_all_down(self):
+        ring = self.ring("a", "b")
+        ring.mark_down("a")
+        ring.mark_down("b")
+        self.assertIsNone(ring.node("key"))
+        self.assertEqual(ring.group(["key"]), {})
+
+    def test_group(self):
+        ring = self.ring("a", "b", "c")
+        groups = ring.group(self.keys)
+        self.assertEqual(
+            sorted(i for g in groups.values() for i in g), list(range(5000))
+        )
+        for name, idxs in groups.items():
+            for i in idxs:
+                self.assertEqual(ring.node(self.keys[i]), (name, name))
+
+    def test_no_nodes(self):
+        with self.assertRaises(ValueError):
+            HashRing[str]({})
@@ -0,0 +1,41 @@
+import unittest
+from unittest.mock import Mock
+
+from redis.exceptions import ConnectionError
+
+from nifty.common import bloom
+from nifty.common.id_bitmap import MAX_ID, IdBitmap
+
+
+class TestIdBitmap(unittest.TestCase):
+    def setUp(self) -> None:
+        self.redis = Mock()
+        self.bitmap = IdBitmap(self.redis, "bits")
+
+    def test_might_contain(self):
+        self.redis.evalsha.return_value = 0
+        self.assertFalse(self.bitmap.might_contain(42))
+        self.assertEqual(
+            self.redis.evalsha.call_args.args, (bloom.BLOOM_CHECK.sha, 1, "bits", 42)
+        )
+
+    def test_too_big_is_maybe(self):
+        self.assertTrue(self.bitmap.might_contain(MAX_ID + 1))
+        self.redis.evalsha.assert_not_called()
+
+    def test_add_many(self):
+        self.bitmap.add_many([3, 5, MAX_ID + 1])
+        self.assertEqual(
+            self.redis.evalsha.call_args.args,
+            (bloom.BLOOM_ADD.sha, 2, "bits", "bits:building", 3, 5),
+        )
+
+    def test_failed_add_drops_bitmap(self):
+        self.redis.evalsha.side_effect = ConnectionError("down")
+        self.bitmap.add_many([3])
+        self.redis.delete.assert_called_once_with("bits")
+
+    def test_rebuild(self):
+        self.assertEqual(self.bitmap.rebuild(iter(range(1, 6)), batch_size=2), 5)
+        self.assertEqual(self.redis.evalsha.call_count, 3)
+        self.redis.rename.assert_called_once_with("bits:building", "bits")
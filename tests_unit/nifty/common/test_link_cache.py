@@ -0,0 +1,116 @@
+import unittest
+from dataclasses import replace
+from datetime import datetime, timezone
+from unittest.mock import MagicMock
+
+from redis.exceptions import ConnectionError
+
+from nifty.common.hash_ring import HashRing
+from nifty.common.link_cache import LinkCache, forward_key
+from nifty.common.types import Link
+
+link_fixture = Link(
+    id=7,
+    created_at=datetime.fromtimestamp(1678620136, tz=timezone.utc),
+    long_url_id=3,
+    short_url_id=5,
+    long_url="https://www.google.com",
+    short_url="3",
+)
+flat_fixture = [i for kv in link_fixture.redis_dict().items() for i in kv]
+
+
+class TestLinkCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.nodes = {"a": MagicMock(), "b": MagicMock()}
+        self.ring = HashRing(self.nodes)
+        self.cache = LinkCache(self.ring)
+
+    def owner(self, key: str) -> MagicMock:
+        return self.nodes[self.ring.node(key)[0]]  # type: ignore
+
+    def other(self, key: str) -> MagicMock:
+        return self.nodes["b" if self.ring.node(key)[0] == "a" else "a"]  # type: ignore
+
+    def test_get_link_routes_by_short_url(self):
+        self.owner("3").evalsha.return_value = flat_fixture
+        self.assertEqual(self.cache.get_link("3"), link_fixture)
+        self.other("3").evalsha.assert_not_called()
+
+    def test_dead_node_is_routed_around(self):
+        owner = self.owner("3")
+        owner.evalsha.side_effect = ConnectionError("down")
+        self.other("3").evalsha.return_value = flat_fixture
+        self.assertEqual(self.cache.get_link("3"), link_fixture)
+        # and stays routed around
+        self.assertIsNot(self.owner("3"), owner)
+
+    def test_all_nodes_dead_is_a_miss(self):
+        for node in self.nodes.values():
+            node.evalsha.side_effect = ConnectionError("down")
+        self.assertIsNone(self.cache.get_link("3"))
+
+    def test_get_link_by_long_two_hops(self):
+        key = forward_key(link_fixture.long_url)
+        self.owner(key).get.return_value = "3"
+        self.owner("3").evalsha.return_value = flat_fixture
+        self.assertEqual(
+            self.cache.get_link_by_long(link_fixture.long_url), link_fixture
+        )
+        self.owner(key).get.assert_called_once_with(key)
+
+    def test_get_links_keeps_order(self):
+        short_urls = [str(i) for i in range(20)]
+        for node in self.nodes.values():
+            pipe = node.pipeline.return_value.__enter__.return_value
+            pipe.execute.side_effect = lambda: []
+        found = self.cache.get_links(short_urls)
+        self.assertEqual(found, [None] * 20)
+        queued = sum(
+            node.pipeline.return_value.__enter__.return_value.evalsha.call_count
+            for node in self.nodes.values()
+        )
+        self.assertEqual(queued, 20)
+
+    def test_put_link_forward_key_on_its_own_node(self):
+        key = forward_key(link_fixture.long_url)
+        short_url = next(
+            s for s in map(str, range(100)) if self.owner(s) is not self.owner(key)
+        )
+        link = replace(link_fixture, short_url=short_url)
+        self.cache.put_link(link, 60)
+
+        link_pipe = self.owner(short_url).pipeline.return_value.__enter__.return_value
+        args = link_pipe.evalsha.call_args.args
+        # no forward ttl next to the link
+        self.assertEqual(args[7:11], (7, link.long_url, short_url, 0))
+        forward_pipe = self.owner(key).pipeline.return_value.__enter__.return_value
+        forward_pipe.set.assert_called_once_with(key, short_url, ex=60)
+
+    def test_get_links_by_id_asks_every_node(self):
+        owner_pipe = self.owner("3").pipeline.return_value.__enter__.return_value
+        other_pipe = self.other("3").pipeline.return_value.__enter__.return_value
+        # the link hash on its owner, and a stale copy on the other node
+        owner_pipe.execute.side_effect = lambda: [link_fixture.redis_dict(), {}][
+            : owner_pipe.hgetall.call_count
+        ]
+        stale = replace(link_fixture, long_url="https://bing.com")
+        other_pipe.execute.side_effect = lambda: [stale.redis_dict(), {}][
+            : other_pipe.hgetall.call_count
+        ]
+        self.assertEqual(self.cache.get_links_by_id([7, 8]), [link_fixture, None])
+
+    def test_missing(self):
+        self.owner("3").exists.return_value = 1
+        self.assertTrue(self.cache.is_missing("3"))
+        self.owner("3").exists.assert_called_once_with("nifty:shorturl:missing:3")
+
+        self.cache.put_missing("3", 30)
+        self.owner("3").set.assert_called_once_with(
+            "nifty:shorturl:missing:3", 1, ex=30
+        )
+
+    def test_missing_dead_node_is_not_missing(self):
+        for node in self.nodes.values():
+            node.exists.side_effect = ConnectionError("down")
+        self.assertFalse(self.cache.is_missing("3"))
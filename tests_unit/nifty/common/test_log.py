@@ -0,0 +1,65 @@
+import json
+import logging
+import queue
+import unittest
+from typing import List
+
+from nifty.common import log
+from nifty.common.log import JsonFormatter, RateLimitFilter
+
+
+def _record(name: str, level: int = logging.DEBUG) -> logging.LogRecord:
+    return logging.LogRecord(name, level, "f.py", 3, "hi %s", ("there",), None)
+
+
+class TestRateLimitFilter(unittest.TestCase):
+    def test_per_logger_budget(self):
+        now = [0.0]
+        f = RateLimitFilter(1, 2, clock=lambda: now[0])
+        self.assertEqual(
+            [f.filter(_record("a")) for _ in range(3)], [True] * 2 + [False]
+        )
+        # another logger has its own budget
+        self.assertTrue(f.filter(_record("b")))
+        # warnings always pass
+        self.assertTrue(f.filter(_record("a", logging.WARNING)))
+        now[0] = 1.0
+        self.assertTrue(f.filter(_record("a")))
+        self.assertFalse(f.filter(_record("a")))
+        self.assertEqual(f.dropped, 2)
+
+
+class TestJsonFormatter(unittest.TestCase):
+    def test_format(self):
+        out = json.loads(JsonFormatter().format(_record("a", logging.INFO)))
+        self.assertEqual(out["msg"], "hi there")
+        self.assertEqual(out["level"], "INFO")
+        self.assertEqual(out["logger"], "a")
+        self.assertEqual(out["where"], "f.py:3")
+
+
+class _Collect(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records: List[logging.LogRecord] = []
+
+    def emit(self, record: logging.LogRecord):
+        self.records.append(record)
+
+
+class TestListener(unittest.TestCase):
+    def test_restart_after_fork(self):
+        out = _Collect()
+        handler = log._DroppingQueueHandler(queue.Queue(maxsize=1))
+        log._start_listener(handler, out, 10)
+        first = handler.queue
+        try:
+            handler.handle(_record("a"))
+            # as a forked child does, the old queue has no listener there
+            log._start_listener(handler, out, 10)
+            self.assertIsNot(handler.queue, first)
+            handler.handle(_record("b"))
+        finally:
+            log._stop_listener()
+            log._listener = None
+        self.assertIn("b", [r.name for r in out.records])
@@ -0,0 +1,84 @@
+import time
+import unittest
+from unittest.mock import MagicMock, call
+
+from nifty.common.publisher import BatchPublisher, QueueFullPolicy
+from nifty.common.types import Transport
+
+
+class TestPublisher(unittest.TestCase):
+    def setUp(self) -> None:
+        self.redis = MagicMock()
+        self.pipe = self.redis.pipeline.return_value.__enter__.return_value
+
+    def test_close_flushes(self):
+        publisher = BatchPublisher(self.redis, batch_size=2)
+        self.assertTrue(publisher.publish("a", "1"))
+        self.assertTrue(publisher.publish("b", "2"))
+        self.assertTrue(publisher.publish("a", "3"))
+        self.assertEqual(publisher.stats().pending, 3)
+
+        publisher.close()
+        self.assertEqual(
+            self.pipe.publish.mock_calls,
+            [call("a", "1"), call("b", "2"), call("a", "3")],
+        )
+        self.redis.pipeline.assert_called_with(transaction=False)
+        stats = publisher.stats()
+        self.assertEqual(stats.published, 3)
+        self.assertEqual(stats.pending, 0)
+
+    def test_stream_transport(self):
+        publisher = BatchPublisher(
+            self.redis, transport=Transport.stream, stream_maxlen=10
+        )
+        publisher.publish("a", "1")
+        publisher.close()
+        self.pipe.xadd.assert_called_once_with(
+            "a:stream", {"data": "1"}, maxlen=10, approximate=True
+        )
+        self.pipe.publish.assert_not_called()
+
+    def test_flusher_batches(self):
+        publisher = BatchPublisher(self.redis, batch_size=2, flush_interval_sec=0.01)
+        publisher.start()
+        for i in range(5):
+            publisher.publish("a", str(i))
+
+        deadline = time.monotonic() + 2
+        while publisher.stats().published < 5 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        publisher.close()
+
+        stats = publisher.stats()
+        self.assertEqual(stats.published, 5)
+        self.assertGreaterEqual(stats.batches, 3)
+        self.assertEqual(
+            self.pipe.publish.mock_calls, [call("a", str(i)) for i in range(5)]
+        )
+
+    def test_drop_when_full(self):
+        publisher = BatchPublisher(self.redis, max_queue=1)
+        self.assertTrue(publisher.publish("a", "1"))
+        self.assertFalse(publisher.publish("a", "2"))
+        self.assertEqual(publisher.stats().dropped, 1)
+
+    def test_block_when_full(self):
+        publisher = BatchPublisher(
+            self.redis,
+            max_queue=1,
+            policy=QueueFullPolicy.block,
+            block_timeout_sec=0.01,
+        )
+        self.assertTrue(publisher.publish("a", "1"))
+        self.assertFalse(publisher.publish("a", "2"))
+        self.assertEqual(publisher.stats().dropped, 1)
+
+    def test_redis_failure_is_counted(self):
+        self.pipe.execute.side_effect = ConnectionError("down")
+        publisher = BatchPublisher(self.redis)
+        publisher.publish("a", "1")
+        with self.assertLogs("nifty.common.publisher", level="WARNING"):
+            publisher.close()
+        self.assertEqual(publisher.stats().failed, 1)
+        self.assertEqual(publisher.stats().published, 0)
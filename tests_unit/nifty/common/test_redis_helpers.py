@@ -0,0 +1,128 @@
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, Mock
+
+from redis.exceptions import NoScriptError
+
+from nifty.common import redis_helpers
+from nifty.common.types import Link
+
+link_fixture = Link(
+    id=7,
+    created_at=datetime.fromtimestamp(1678620136, tz=timezone.utc),
+    long_url_id=3,
+    short_url_id=5,
+    long_url="https://www.google.com",
+    short_url="3",
+)
+
+
+class TestRedisHelpers(unittest.TestCase):
+    def test_script_evalsha(self):
+        redis = Mock()
+        redis.evalsha.return_value = 1
+        script = redis_helpers.LuaScript("test", "return 1")
+        self.assertEqual(script(redis, ["k"], ["a"]), 1)
+        redis.evalsha.assert_called_once_with(script.sha, 1, "k", "a")
+        redis.eval.assert_not_called()
+
+    def test_script_noscript_fallback(self):
+        redis = Mock()
+        redis.evalsha.side_effect = NoScriptError("NOSCRIPT")
+        redis.eval.return_value = 1
+        script = redis_helpers.LuaScript("test", "return 1")
+        self.assertEqual(script(redis, ["k"], ["a"]), 1)
+        redis.eval.assert_called_once_with("return 1", 1, "k", "a")
+
+    def test_load_scripts(self):
+        redis = Mock()
+        redis_helpers.load_scripts(redis)
+        self.assertEqual(
+            redis.script_load.call_count, len(redis_helpers.scripts.values())
+        )
+
+    def test_get_link(self):
+        redis = Mock()
+        redis.evalsha.return_value = [
+            i for kv in link_fixture.redis_dict().items() for i in kv
+        ]
+        self.assertEqual(redis_helpers.get_link(redis, "3"), link_fixture)
+        args = redis.evalsha.call_args.args
+        self.assertEqual(
+            args[1:], (1, "nifty:linkid:byshorturl:3", "nifty:link:bylinkid")
+        )
+
+    def test_get_link_miss(self):
+        redis = Mock()
+        redis.evalsha.return_value = []
+        self.assertIsNone(redis_helpers.get_link(redis, "3"))
+
+    def test_put_link(self):
+        redis = Mock()
+        redis_helpers.put_link(redis, link_fixture, 60)
+        args = redis.evalsha.call_args.args
+        digest = redis_helpers.long_url_digest("https://www.google.com")
+        self.assertEqual(
+            args[1:11],
+            (
+                5,
+                "nifty:link:bylinkid:7",
+                "nifty:linkid:byshorturl:3",
+                "nifty:longurl:byshorturl:3",
+                f"nifty:shorturl:bylongdigest:{digest}",
+                "nifty:shorturl:missing:3",
+                7,
+                "https://www.google.com",
+                "3",
+                60,
+            ),
+        )
+        fields = dict(zip(args[11::2], args[12::2]))
+        self.assertEqual(fields, link_fixture.redis_dict())
+
+    def test_get_link_by_long(self):
+        redis = Mock()
+        redis.evalsha.return_value = [
+            i for kv in link_fixture.redis_dict().items() for i in kv
+        ]
+        self.assertEqual(
+            redis_helpers.get_link_by_long(redis, "https://www.google.com"),
+            link_fixture,
+        )
+        args = redis.evalsha.call_args.args
+        self.assertEqual(args[3:], ("nifty:linkid:byshorturl", "nifty:link:bylinkid"))
+
+    def test_get_link_by_long_collision(self):
+        redis = Mock()
+        redis.evalsha.return_value = [
+            i for kv in link_fixture.redis_dict().items() for i in kv
+        ]
+        self.assertIsNone(redis_helpers.get_link_by_long(redis, "https://bing.com"))
+
+    def test_get_links(self):
+        redis = MagicMock()
+        pipe = redis.pipeline.return_value.__enter__.return_value
+        pipe.execute.return_value = [
+            [i for kv in link_fixture.redis_dict().items() for i in kv],
+            [],
+        ]
+        self.assertEqual(
+            redis_helpers.get_links(redis, ["3", "4"]), [link_fixture, None]
+        )
+        self.assertEqual(pipe.evalsha.call_count, 2)
+
+    def test_get_links_by_id(self):
+        redis = MagicMock()
+        pipe = redis.pipeline.return_value.__enter__.return_value
+        pipe.execute.return_value = [{}, link_fixture.redis_dict()]
+        self.assertEqual(
+            redis_helpers.get_links_by_id(redis, [8, 7]), [None, link_fixture]
+        )
+        pipe.hgetall.assert_any_call("nifty:link:bylinkid:7")
+
+    def test_get_links_noscript_reloads(self):
+        redis = MagicMock()
+        pipe = redis.pipeline.return_value.__enter__.return_value
+        pipe.execute.side_effect = [NoScriptError("NOSCRIPT"), [[]]]
+        self.assertEqual(redis_helpers.get_links(redis, ["3"]), [None])
+        redis.script_load.assert_called()
@@ -0,0 +1,91 @@
+import unittest
+from datetime import datetime, timezone
+from uuid import uuid1
+
+from nifty.common.types import (
+    EVENT_MAGIC,
+    Action,
+    ActionType,
+    Channel,
+    EventFormat,
+    Link,
+    TrendEvent,
+    TrendLinkEvent,
+    UpstreamSource,
+    dead_letter_key,
+    decode_event,
+    encode_event,
+    stream_key,
+)
+
+action_fixture = Action(
+    uuid=str(uuid1()), at=1678620136000, type=ActionType.create, link_id=42
+)
+
+
+class TestEventCodec(unittest.TestCase):
+    def test_action_round_trip(self):
+        data = encode_event(action_fixture, EventFormat.binary)
+        self.assertEqual(data[0], EVENT_MAGIC)
+        self.assertEqual(decode_event(data, Action), action_fixture)
+
+    def test_trend_round_trip(self):
+        event = TrendEvent(uuid=str(uuid1()), at=1, added={1, 2}, removed={3})
+        data = encode_event(event, EventFormat.binary)
+        self.assertEqual(decode_event(data, TrendEvent), event)
+
+    def test_trend_link_round_trip(self):
+        event = TrendLinkEvent(
+            uuid=str(uuid1()),
+            at=2,
+            link_id=7,
+            added=False,
+            upstream=[UpstreamSource(channel=Channel.trend, at=1, uuid=str(uuid1()))],
+        )
+        data = encode_event(event, EventFormat.binary)
+        self.assertEqual(decode_event(data, TrendLinkEvent), event)
+
+    def test_json_is_still_read(self):
+        data = encode_event(action_fixture)
+        self.assertEqual(data, action_fixture.json().encode())
+        self.assertEqual(decode_event(data, Action), action_fixture)
+        self.assertEqual(decode_event(action_fixture.json(), Action), action_fixture)
+
+    def test_not_a_uuid_falls_back_to_json(self):
+        event = action_fixture.copy(update={"uuid": "not-a-uuid"})
+        data = encode_event(event, EventFormat.binary)
+        self.assertEqual(decode_event(data, Action), event)
+
+    def test_wrong_type_or_version(self):
+        data = encode_event(action_fixture, EventFormat.binary)
+        with self.assertRaises(ValueError):
+            decode_event(data, TrendEvent)
+        with self.assertRaises(ValueError):
+            decode_event(data[:1] + b"\x09" + data[2:], Action)
+
+
+class TestLink(unittest.TestCase):
+    def test_redis_round_trip(self):
+        link = Link(
+            id=7,
+            created_at=datetime.fromtimestamp(1678620136.123, tz=timezone.utc),
+            long_url_id=3,
+            short_url_id=5,
+            long_url="https://www.google.com",
+            short_url="3",
+        )
+        # as redis hands it back, every value a string
+        raw = {k: str(v) for k, v in link.redis_dict().items()}
+        self.assertEqual(Link.from_redis(raw), link)
+        self.assertEqual(Link.from_redis(raw).created_at_ms(), 1678620136123)
+
+    def test_action_new(self):
+        action = Action.new(ActionType.get, 7, 5)
+        self.assertEqual(Action.parse_raw(action.json()), action)
+
+
+class TestStreamKeys(unittest.TestCase):
+    def test_named_by_value(self):
+        self.assertEqual(stream_key(Channel.action), "nifty:action:stream")
+        self.assertEqual(dead_letter_key(Channel.action), "nifty:action:dead")
+        self.assertEqual(stream_key("a"), "a:stream")
@@ -0,0 +1,28 @@
+import unittest
+from unittest.mock import MagicMock
+
+from nifty.service.store import hot_keys
+
+
+class TestHotKeys(unittest.TestCase):
+    def test_save(self):
+        redis = MagicMock()
+        pipe = redis.pipeline.return_value.__enter__.return_value
+        hot_keys.save(redis, [("a", 3), ("b", 1)], 100, 60)
+        pipe.zadd.assert_called_once_with(
+            "nifty:hotkeys:shorturl", {"a": 3, "b": 1}, gt=True
+        )
+        pipe.zremrangebyrank.assert_called_once_with("nifty:hotkeys:shorturl", 0, -101)
+        pipe.expire.assert_called_once_with("nifty:hotkeys:shorturl", 60)
+        pipe.execute.assert_called_once()
+
+    def test_save_nothing(self):
+        redis = MagicMock()
+        hot_keys.save(redis, [], 100, 60)
+        redis.pipeline.assert_not_called()
+
+    def test_load(self):
+        redis = MagicMock()
+        redis.zrange.return_value = ["a", "b"]
+        self.assertEqual(hot_keys.load(redis, 10), ["a", "b"])
+        redis.zrange.assert_called_once_with("nifty:hotkeys:shorturl", 0, 9, desc=True)
@@ -0,0 +1,114 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timezone
+
+from nifty.common.types import Link
+from nifty.service.store import hot_links
+from nifty.service.store.hot_links import HotLinks
+
+
+def _link(id: int, short_url: str) -> Link:
+    return Link(
+        id=id,
+        created_at=datetime.fromtimestamp(1678620136, tz=timezone.utc),
+        long_url_id=id + 1,
+        short_url_id=id + 2,
+        long_url=f"https://example.com/{id}/ü",
+        short_url=short_url,
+    )
+
+
+class TestHotLinks(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "hot")
+        self.now = 1000.0
+        self.now_ms = 5000
+        self.hot = HotLinks(
+            self.path,
+            check_interval_sec=5,
+            clock=lambda: self.now,
+            wall_clock_ms=lambda: self.now_ms,
+        )
+
+    def tearDown(self) -> None:
+        self.dir.cleanup()
+
+    def test_missing_file(self):
+        self.assertIsNone(self.hot.get("a"))
+        self.assertEqual(self.hot.size(), 0)
+
+    def test_get(self):
+        links = [_link(i, s) for i, s in enumerate(["b", "a", "Zz", "c9", "a0"])]
+        self.assertEqual(hot_links.write(self.path, links), 5)
+        for link in links:
+            self.assertEqual(self.hot.get(link.short_url), link)
+        self.assertIsNone(self.hot.get("nope"))
+        self.assertIsNone(self.hot.get(""))
+
+    def test_empty(self):
+        hot_links.write(self.path, [])
+        self.assertIsNone(self.hot.get("a"))
+
+    def test_swap(self):
+        hot_links.write(self.path, [_link(1, "a")])
+        self.assertEqual(self.hot.get("a"), _link(1, "a"))
+
+        hot_links.write(self.path, [_link(2, "b")])
+        # not checked again until the interval passes
+        self.assertEqual(self.hot.get("a"), _link(1, "a"))
+        self.now += 5
+        self.assertIsNone(self.hot.get("a"))
+        self.assertEqual(self.hot.get("b"), _link(2, "b"))
+
+    def test_invalidate(self):
+        hot_links.write(self.path, [_link(1, "a"), _link(2, "b")], 4000)
+        self.hot.invalidate("a")
+        self.assertIsNone(self.hot.get("a"))
+        self.assertIsNotNone(self.hot.get("b"))
+        self.hot.clear()
+        self.assertIsNone(self.hot.get("b"))
+
+        # a file read before the invalidations is still skipped
+        hot_links.write(self.path, [_link(1, "a"), _link(2, "b")], 4500)
+        self.now += 5
+        self.assertIsNone(self.hot.get("a"))
+        self.assertIsNone(self.hot.get("b"))
+
+        # until one read after them
+        hot_links.write(self.path, [_link(1, "a"), _link(2, "b")], 6000)
+        self.now += 5
+        self.assertIsNotNone(self.hot.get("a"))
+        self.assertIsNotNone(self.hot.get("b"))
+
+    def test_invalidate_without_file(self):
+        self.hot.invalidate("a")
+        hot_links.write(self.path, [_link(1, "a"), _link(2, "b")], 4000)
+        self.now += 5
+        # everything built before the invalidation is skipped
+        self.assertIsNone(self.hot.get("b"))
+
+        hot_links.write(self.path, [_link(1, "a"), _link(2, "b")], 6000)
+        self.now += 5
+        self.assertIsNotNone(self.hot.get("a"))
+
+    def test_skipped_is_bounded(self):
+        hot = HotLinks(
+            self.path,
+            clock=lambda: self.now,
+            wall_clock_ms=lambda: self.now_ms,
+            max_skipped=2,
+        )
+        hot_links.write(self.path, [_link(1, "a"), _link(2, "b")], 4000)
+        hot.invalidate("x")
+        hot.invalidate("y")
+        self.assertIsNotNone(hot.get("a"))
+        # one more and the whole file is skipped instead
+        hot.invalidate("z")
+        self.assertIsNone(hot.get("a"))
+        self.assertIsNone(hot.get("b"))
+
+        hot_links.write(self.path, [_link(1, "a"), _link(2, "b")], 6000)
+        self.now += 5
+        self.assertIsNotNone(hot.get("a"))
@@ -0,0 +1,74 @@
+import unittest
+from nifty.service.store.local_cache import LocalCache
+
+
+class TestLocalCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.now = 1000.0
+        self.cache = LocalCache[str, int](
+            max_size=2, ttl_sec=10, clock=lambda: self.now
+        )
+
+    def test_get_put(self):
+        self.assertIsNone(self.cache.get("a"))
+        self.cache.put("a", 1)
+        self.assertEqual(self.cache.get("a"), 1)
+
+        stats = self.cache.stats()
+        self.assertEqual(stats.hits, 1)
+        self.assertEqual(stats.misses, 1)
+        self.assertEqual(stats.size, 1)
+
+    def test_ttl(self):
+        self.cache.put("a", 1)
+        self.now += 10
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.stats().expirations, 1)
+        self.assertEqual(self.cache.stats().size, 0)
+
+    def test_admission_keeps_hot_keys(self):
+        for _ in range(5):
+            self.cache.get("hot")
+            self.cache.get("warm")
+        self.cache.put("hot", 1)
+        self.cache.put("warm", 2)
+
+        # a one hit wonder can't displace either of them
+        self.cache.get("cold")
+        self.cache.put("cold", 3)
+        self.assertIsNone(self.cache.get("cold"))
+        self.assertEqual(self.cache.stats().rejections, 1)
+
+        # but something requested more often than the lru victim can
+        for _ in range(10):
+            self.cache.get("hotter")
+        self.cache.put("hotter", 4)
+        self.assertEqual(self.cache.get("hotter"), 4)
+        self.assertEqual(self.cache.stats().evictions, 1)
+        self.assertEqual(self.cache.stats().size, 2)
+
+    def test_invalidate(self):
+        self.cache.put("a", 1)
+        self.cache.put("b", 2)
+        self.cache.invalidate("a")
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.get("b"), 2)
+
+        self.cache.clear()
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(self.cache.stats().invalidations, 2)
+
+    def test_hot(self):
+        self.cache.put("a", 1)
+        self.cache.put("b", 2)
+        for _ in range(3):
+            self.cache.get("b")
+        self.cache.get("a")
+        self.assertEqual([k for k, _ in self.cache.hot(2)], ["b", "a"])
+        self.assertEqual([k for k, _ in self.cache.hot(1)], ["b"])
+
+    def test_bad_args(self):
+        with self.assertRaises(ValueError):
+            LocalCache[str, int](max_size=0, ttl_sec=1)
+        with self.assertRaises(ValueError):
+            LocalCache[str, int](max_size=1, ttl_sec=0)
@@ -0,0 +1,54 @@
+import unittest
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from nifty.common.types import Link
+from nifty.service.store import postgres
+from nifty.service.store.types import ShortenRow
+
+
+def _cursor(*columns: str) -> SimpleNamespace:
+    return SimpleNamespace(description=[SimpleNamespace(name=c) for c in columns])
+
+
+class TestLinkRow(unittest.TestCase):
+    def test_columns_by_name(self):
+        created_at = datetime.fromtimestamp(1678620136, tz=timezone.utc)
+        make = postgres.link_row(
+            _cursor(  # type: ignore
+                "short_url",
+                "long_url",
+                "created",
+                "id",
+                "created_at",
+                "short_url_id",
+                "long_url_id",
+            )
+        )
+        self.assertEqual(
+            make(("3", "https://www.google.com", True, 7, created_at, 5, 3)),
+            Link(7, created_at, 3, 5, "https://www.google.com", "3"),
+        )
+
+    def test_shorten_row(self):
+        created_at = datetime.fromtimestamp(1678620136, tz=timezone.utc)
+        make = postgres.shorten_row(
+            _cursor(  # type: ignore
+                "id",
+                "created_at",
+                "long_url_id",
+                "short_url_id",
+                "long_url",
+                "short_url",
+                "created",
+            )
+        )
+        self.assertEqual(
+            make((7, created_at, 3, 5, "https://www.google.com", "3", True)),
+            ShortenRow(Link(7, created_at, 3, 5, "https://www.google.com", "3"), True),
+        )
+
+    def test_no_result(self):
+        make = postgres.link_row(SimpleNamespace(description=None))  # type: ignore
+        with self.assertRaises(Exception):
+            make(())
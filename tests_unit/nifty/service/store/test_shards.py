@@ -0,0 +1,61 @@
+import unittest
+
+from nifty.service.base62 import base62_encode
+from nifty.service.store.shards import ShardLayout, jump_hash
+
+
+class TestShards(unittest.TestCase):
+    def test_jump_hash(self):
+        for key in range(1000):
+            self.assertEqual(jump_hash(key, 1), 0)
+            self.assertEqual(jump_hash(key, 10), jump_hash(key, 10))
+            self.assertTrue(0 <= jump_hash(key, 10) < 10)
+
+    def test_home_shard_only_moves_to_new_shard(self):
+        layout = ShardLayout(count=4, slots=64)
+        moved = 0
+        for i in range(2000):
+            url = f"https://example.com/{i}"
+            before = layout.home_shard(url, 3)
+            after = layout.home_shard(url)
+            if before != after:
+                self.assertEqual(after, 3)
+                moved += 1
+        # about a quarter should move
+        self.assertTrue(300 < moved < 700, moved)
+
+    def test_unsharded(self):
+        layout = ShardLayout()
+        self.assertFalse(layout.sharded)
+        self.assertEqual(layout.shard_for_id(12345), 0)
+        self.assertEqual(layout.shard_for_short_url("anything"), 0)
+        self.assertEqual(layout.home_shard("https://example.com"), 0)
+
+    def test_shard_for_id(self):
+        layout = ShardLayout(count=2, slots=64, legacy_max_id=1000)
+        self.assertEqual(layout.shard_for_id(999), 0)
+        self.assertEqual(layout.shard_for_id(1000), 0)
+        self.assertEqual(layout.shard_for_id(1024), 0)
+        self.assertEqual(layout.shard_for_id(1025), 1)
+
+    def test_shard_for_short_url(self):
+        layout = ShardLayout(count=2, slots=64)
+        self.assertEqual(layout.shard_for_short_url(base62_encode(128)), 0)
+        self.assertEqual(layout.shard_for_short_url(base62_encode(129)), 1)
+        # a shard that doesn't exist yet
+        self.assertIsNone(layout.shard_for_short_url(base62_encode(130)))
+        self.assertIsNone(layout.shard_for_short_url("not-base62!"))
+
+    def test_first_id(self):
+        layout = ShardLayout(count=2, slots=64)
+        self.assertEqual(layout.first_id(0, 0), 64)
+        self.assertEqual(layout.first_id(1, 0), 1)
+        self.assertEqual(layout.first_id(1, 1000), 1025)
+        self.assertEqual(layout.first_id(0, 1024), 1088)
+        self.assertEqual(layout.first_id(5, 1000), 1029)
+
+    def test_bad_layout(self):
+        with self.assertRaises(ValueError):
+            ShardLayout(count=0)
+        with self.assertRaises(ValueError):
+            ShardLayout(count=8, slots=4)
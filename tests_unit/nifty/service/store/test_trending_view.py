@@ -0,0 +1,52 @@
+import unittest
+from unittest.mock import MagicMock
+
+from nifty.service.store import trending_view
+from nifty.service.store.trending_view import TrendingView
+from nifty.service.store.types import Trending, TrendingItem
+
+
+def _trending(views: int) -> Trending:
+    return Trending(
+        list=[
+            TrendingItem(
+                id=1,
+                created_at=1000,
+                long_url="https://example.com",
+                short_url="b",
+                views=views,
+            )
+        ]
+    )
+
+
+class TestTrendingView(unittest.TestCase):
+    def test_render(self):
+        view = trending_view.render(_trending(3), 5)
+        self.assertEqual(Trending.parse_raw(view.body), _trending(3))
+        self.assertEqual(view.at, 5)
+        self.assertEqual(view.etag, trending_view.render(_trending(3), 6).etag)
+        self.assertNotEqual(view.etag, trending_view.render(_trending(4), 5).etag)
+
+    def test_save_load(self):
+        redis = MagicMock()
+        pipe = redis.pipeline.return_value.__enter__.return_value
+        view = TrendingView(etag="e", body="{}", at=5)
+        trending_view.save(redis, view, 60)
+        pipe.hset.assert_called_once_with(
+            "nifty:trending:view", mapping={"etag": "e", "body": "{}", "at": 5}
+        )
+        pipe.expire.assert_called_once_with("nifty:trending:view", 60)
+
+        redis.hmget.return_value = ["e", "{}", "5"]
+        self.assertEqual(trending_view.load(redis), view)
+        redis.hmget.return_value = [None, None, None]
+        self.assertIsNone(trending_view.load(redis))
+
+    def test_matches(self):
+        self.assertTrue(trending_view.matches('"abc"', "abc"))
+        self.assertTrue(trending_view.matches('"x", W/"abc"', "abc"))
+        self.assertTrue(trending_view.matches("*", "abc"))
+        self.assertFalse(trending_view.matches('"abd"', "abc"))
+        self.assertFalse(trending_view.matches(None, "abc"))
+        self.assertFalse(trending_view.matches("", "abc"))
@@ -0,0 +1,17 @@
+import unittest
+from nifty.service.base62 import base62_decode, base62_decode_strict, base62_encode
+
+
+class TestBase62(unittest.TestCase):
+    def test_round_trip(self):
+        for num in [1, 61, 62, 3844, 1_000_000_000_000]:
+            self.assertEqual(base62_decode(base62_encode(num)), num)
+            self.assertEqual(base62_decode_strict(base62_encode(num)), num)
+
+    def test_strict(self):
+        self.assertEqual(base62_decode_strict("10"), 62)
+        self.assertIsNone(base62_decode_strict(""))
+        self.assertIsNone(base62_decode_strict("0"))
+        self.assertIsNone(base62_decode_strict("010"))
+        self.assertIsNone(base62_decode_strict("foo-bar"))
+        self.assertIsNone(base62_decode_strict("favicon.ico"))
@@ -0,0 +1,209 @@
+import unittest
+from asyncio import CancelledError
+from typing import Any, Dict, List, Sequence
+from unittest.mock import AsyncMock, MagicMock, call, patch
+
+from redis.exceptions import ConnectionError, ResponseError
+
+from nifty.common.types import (
+    Action,
+    ActionType,
+    Channel,
+    Transport,
+    dead_letter_key,
+    encode_event,
+    stream_key,
+)
+from nifty.worker.common.asyncio import worker
+from nifty.worker.common.asyncio.worker import NiftyWorker
+from nifty.worker.common.types import ClaimNamespace
+
+_STREAM = stream_key(Channel.action)
+_GROUP = ClaimNamespace.trend.value
+
+
+def _entry(entry_id: bytes, link_id: int):
+    event = Action.new(ActionType.get, link_id, 1)
+    return entry_id, {b"data": encode_event(event)}
+
+
+class _Worker(NiftyWorker[Action]):
+    """
+    Records what it handles, fails on fail_ids and stops at the yield_limit'th
+    empty read
+    """
+
+    def __init__(self, fail_ids: Sequence[int] = (), yield_limit: int = 1):
+        super().__init__(ClaimNamespace.trend)
+        self.handled: List[int] = []
+        self.fail_ids = fail_ids
+        self.yields = 0
+        self.yield_limit = yield_limit
+
+    async def on_event(self, channel: Channel, msg: Action):
+        if msg.link_id in self.fail_ids:
+            raise ValueError(f"can't handle {msg.link_id}")
+        self.handled.append(msg.link_id)
+
+    async def on_yield(self):
+        self.yields += 1
+        if self.yields >= self.yield_limit:
+            raise CancelledError()
+
+    def unpack(self, msg: Dict[str, Any]) -> Action:
+        return Action.parse_raw(msg["data"])
+
+
+class TestStreamWorker(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.redis = MagicMock()
+        for name in ["xgroup_create", "xreadgroup", "xautoclaim", "xack", "close"]:
+            setattr(self.redis, name, AsyncMock())
+        self.redis.xautoclaim.return_value = [b"0-0", [], []]
+        # commands are queued on a pipeline, only execute is awaited
+        self.pipe = MagicMock()
+        self.redis.pipeline.return_value.__aenter__.return_value = self.pipe
+        self.pipe.execute = AsyncMock()
+        patches = [
+            patch.object(
+                worker.redis_helpers, "get_redis", MagicMock(return_value=self.redis)
+            ),
+            patch.object(worker, "_MIN_BACKOFF_SEC", 0.0),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def _pending(self, *times_delivered: int):
+        # one xpending_range reply per entry, as __dead_letter asks for them
+        self.pipe.execute.return_value = [
+            [{"times_delivered": t}] for t in times_delivered
+        ]
+
+    async def _run(self, w: _Worker, max_deliveries: int = 5):
+        await w.run(
+            src_channel=Channel.action,
+            transport=Transport.stream,
+            stream_reclaim_idle_ms=60000,
+            stream_max_deliveries=max_deliveries,
+        )
+
+    async def test_replays_pending_entries(self):
+        self._pending(2)
+        self.redis.xreadgroup.side_effect = [
+            [[_STREAM, [_entry(b"1-0", 7)]]],
+            [],
+            None,
+        ]
+        w = _Worker()
+        await self._run(w)
+
+        self.assertEqual(w.handled, [7])
+        self.redis.xgroup_create.assert_awaited_once_with(
+            _STREAM, _GROUP, id="0", mkstream=True
+        )
+        reads = self.redis.xreadgroup.await_args_list
+        self.assertEqual(reads[0].args[2], {_STREAM: "0"})
+        self.assertEqual(reads[1].args[2], {_STREAM: b"1-0"})
+        self.assertEqual(reads[2].args[2], {_STREAM: ">"})
+        self.redis.xack.assert_awaited_once_with(_STREAM, _GROUP, b"1-0")
+
+    async def test_failed_entry_stays_pending(self):
+        self.redis.xreadgroup.side_effect = [
+            [],
+            [[_STREAM, [_entry(b"1-0", 7), _entry(b"2-0", 8)]]],
+            None,
+        ]
+        w = _Worker(fail_ids=[7], yield_limit=1)
+        with self.assertLogs(worker.__name__, level="ERROR"):
+            await self._run(w)
+
+        self.assertEqual(w.handled, [8])
+        self.redis.xack.assert_awaited_once_with(_STREAM, _GROUP, b"2-0")
+
+    async def test_autoclaim(self):
+        self._pending(1)
+        self.redis.xreadgroup.side_effect = [[], None]
+        self.redis.xautoclaim.return_value = [b"0-0", [_entry(b"3-0", 9)], []]
+        w = _Worker()
+        await self._run(w)
+
+        self.assertEqual(w.handled, [9])
+        stream, group, _consumer, idle_ms = self.redis.xautoclaim.await_args.args
+        self.assertEqual((stream, group, idle_ms), (_STREAM, _GROUP, 60000))
+        self.redis.xack.assert_awaited_once_with(_STREAM, _GROUP, b"3-0")
+
+    async def test_dead_letters_past_max_deliveries(self):
+        self._pending(6, 1)
+        poison, ok = _entry(b"1-0", 7), _entry(b"2-0", 8)
+        self.redis.xreadgroup.side_effect = [
+            [[_STREAM, [poison, ok]]],
+            [],
+            None,
+        ]
+        w = _Worker(fail_ids=[7])
+        with self.assertLogs(worker.__name__, level="ERROR"):
+            await self._run(w, max_deliveries=5)
+
+        self.assertEqual(w.handled, [8])
+        self.pipe.xadd.assert_called_once_with(
+            dead_letter_key(Channel.action),
+            {**poison[1], b"id": b"1-0"},
+            maxlen=100000,
+            approximate=True,
+        )
+        self.pipe.xack.assert_called_once_with(_STREAM, _GROUP, b"1-0")
+        self.redis.xack.assert_awaited_once_with(_STREAM, _GROUP, b"2-0")
+
+    async def test_no_dead_letter_when_unlimited(self):
+        self.redis.xreadgroup.side_effect = [
+            [[_STREAM, [_entry(b"1-0", 7)]]],
+            [],
+            None,
+        ]
+        w = _Worker()
+        await self._run(w, max_deliveries=0)
+
+        self.assertEqual(w.handled, [7])
+        self.pipe.xpending_range.assert_not_called()
+        self.pipe.xadd.assert_not_called()
+
+    async def test_reconnects_after_connection_error(self):
+        self.redis.xreadgroup.side_effect = [
+            [],
+            ConnectionError("gone"),
+            [],
+            None,
+        ]
+        w = _Worker()
+        with self.assertLogs(worker.__name__, level="WARNING") as logs:
+            await self._run(w)
+
+        self.assertIn("reconnecting", logs.output[0])
+        self.assertEqual(self.redis.xgroup_create.await_count, 2)
+        # each connection is closed when it is given up
+        self.assertEqual(self.redis.close.await_count, 2)
+        self.assertEqual(w.yields, 1)
+
+    async def test_recreates_lost_group(self):
+        self.redis.xreadgroup.side_effect = [
+            [],
+            ResponseError("NOGROUP No such key or consumer group"),
+            [],
+            None,
+        ]
+        w = _Worker()
+        with self.assertLogs(worker.__name__, level="WARNING") as logs:
+            await self._run(w)
+
+        self.assertIn("recreating", logs.output[0])
+        self.assertEqual(
+            self.redis.xgroup_create.await_args_list,
+            [call(_STREAM, _GROUP, id="0", mkstream=True)] * 2,
+        )
+        self.assertEqual(w.yields, 1)
+
+    async def test_other_response_errors_stop_the_worker(self):
+        self.redis.xreadgroup.side_effect = [ResponseError("WRONGTYPE")]
+        with self.assertRaises(ResponseError):
+            await self._run(_Worker())